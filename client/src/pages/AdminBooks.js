@@ -1,5 +1,5 @@
 import { useEffect, useState, useContext } from 'react';
-import { getBooks, addBook, deleteBook } from '../utils/api';
+import { getBooksPage, addBook, deleteBook } from '../utils/api';
 import { AuthContext } from '../utils/AuthContext';
 import { Formik, Form, Field, ErrorMessage } from 'formik';
 import * as Yup from 'yup';
@@ -7,13 +7,17 @@ import * as Yup from 'yup';
 const AdminBooks = () => {
   const { user } = useContext(AuthContext);
   const [books, setBooks] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [error, setError] = useState(null);
 
-  useEffect(() => {
-    const fetchBooks = async () => {
-      const data = await getBooks();
-      setBooks(data);
-    };
+  // The first page when `after` is not given, else the page after it appended
+  const fetchBooks = async (after) => {
+    const page = await getBooksPage(after ? { after } : {});
+    setBooks(prevBooks => (after ? [...prevBooks, ...page.books] : page.books));
+    setNextCursor(page.nextCursor);
+  };
 
+  useEffect(() => {
     fetchBooks();
   }, []);
 
@@ -28,9 +32,20 @@ const AdminBooks = () => {
       .required('Available copies is required'),
   });
 
-  const handleDelete = async (id) => {
-    await deleteBook(id, user.token);
-    setBooks(prevBooks => prevBooks.filter(book => book.id !== id));
+  const handleDelete = async (book) => {
+    setError(null);
+    try {
+      await deleteBook(book.id, book.version, user.token);
+      setBooks(prevBooks => prevBooks.filter(b => b.id !== book.id));
+    } catch (err) {
+      if (err.response && err.response.status === 409) {
+        // Someone else changed or removed it; show the list as it is now
+        setError('That book was changed by someone else, so the list has been reloaded.');
+        await fetchBooks();
+      } else {
+        setError(err.response ? err.response.data.message : 'Failed to delete book.');
+      }
+    }
   };
 
   return (
@@ -90,6 +105,7 @@ const AdminBooks = () => {
       </div>
 
       <h2>Book List</h2>
+      {error && <div style={{ color: 'red', marginBottom: '1rem' }}>{error}</div>}
       <div className="card">
         <table style={{ width: '100%', borderCollapse: 'collapse' }}>
           <thead>
@@ -110,7 +126,7 @@ const AdminBooks = () => {
                 <td style={{ padding: '10px' }}>{book.available_copies}</td>
                 <td style={{ padding: '10px' }}>
                   <button
-                    onClick={() => handleDelete(book.id)}
+                    onClick={() => handleDelete(book)}
                     className="btn btn-secondary"
                   >
                     Delete
@@ -120,6 +136,13 @@ const AdminBooks = () => {
             ))}
           </tbody>
         </table>
+        {nextCursor && (
+          <div style={{ textAlign: 'center', marginTop: '1rem' }}>
+            <button onClick={() => fetchBooks(nextCursor)} className="btn btn-secondary">
+              Load more books
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -1,6 +1,6 @@
 import { useEffect, useState, useContext, useCallback } from 'react';
 import { useParams, Link } from 'react-router-dom';
-import { getBook } from '../utils/api';
+import { getBook, subscribeToBooks } from '../utils/api';
 import ReviewForm from '../components/ReviewForm';
 import { AuthContext } from '../utils/AuthContext';
 import './BookDetails.css';
@@ -31,6 +31,16 @@ const BookDetails = () => {
     fetchBook();
   }, [fetchBook]);
 
+  // Copy counts come with the event; a new review means fetching the book again
+  useEffect(() => {
+    const reload = () => getBook(id).then(setBook).catch(err => console.error('Error refreshing book:', err.message));
+    return subscribeToBooks([id], {
+      availability: ({ available_copies }) => setBook(prevBook => prevBook && { ...prevBook, available_copies }),
+      review: reload,
+      reset: reload,
+    });
+  }, [id]);
+
   const handleBorrowBook = async () => {
     setBorrowing(true);
     try {
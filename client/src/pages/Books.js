@@ -1,25 +1,70 @@
 import { useEffect, useState } from 'react';
-import { getBooks } from '../utils/api';
+import { getBooksPage, searchBooks, subscribeToBooks } from '../utils/api';
 import BookCard from '../components/BookCard';
 
+// The grid only shows these, so skip reviews and borrow records
+const GRID_VIEW = { fields: 'id,title,author,isbn,available_copies,image_url', include: '' };
+
+// Most books one event stream can watch
+const MAX_WATCHED_BOOKS = 200;
+
 
 
 const Books = () => {
   const [books, setBooks] = useState([]);
+  // Cursor for the next page of the catalog; null once it is all shown
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [error, setError] = useState(null);
+  const [query, setQuery] = useState('');
+  const [reloads, setReloads] = useState(0);
 
   useEffect(() => {
     const fetchBooks = async () => {
       try {
-        const data = await getBooks();
-        setBooks(data);
+        if (query.trim()) {
+          setBooks(await searchBooks(query));
+          setNextCursor(null);
+        } else {
+          const page = await getBooksPage(GRID_VIEW);
+          setBooks(page.books);
+          setNextCursor(page.nextCursor);
+        }
       } catch (err) {
         console.error('Error fetching books:', err);
         setError('Failed to load books.');
       }
     };
-    fetchBooks();
-  }, []);
+    // Wait for a pause in typing before asking the server
+    const timer = setTimeout(fetchBooks, 300);
+    return () => clearTimeout(timer);
+  }, [query, reloads]);
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const page = await getBooksPage({ ...GRID_VIEW, after: nextCursor });
+      setBooks(prevBooks => [...prevBooks, ...page.books]);
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      console.error('Error fetching books:', err);
+      setError('Failed to load books.');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Keep copy counts current from the event stream instead of polling
+  const watchedIds = books.slice(0, MAX_WATCHED_BOOKS).map(book => book.id).join(',');
+  useEffect(() => {
+    const ids = watchedIds ? watchedIds.split(',') : [];
+    return subscribeToBooks(ids, {
+      availability: ({ book_id, available_copies }) => setBooks(prevBooks => prevBooks.map(book =>
+        book.id === book_id ? { ...book, available_copies } : book)),
+      // Missed too much while disconnected: load the list again
+      reset: () => setReloads(count => count + 1),
+    });
+  }, [watchedIds]);
 
   if (error) return <div style={{ color: 'red', padding: '20px' }}>{error}</div>;
 
@@ -30,6 +75,8 @@ const Books = () => {
         <input
           type="text"
           placeholder="Search books..."
+          value={query}
+          onChange={e => setQuery(e.target.value)}
           style={{ maxWidth: '300px' }}
         />
       </div>
@@ -40,7 +87,15 @@ const Books = () => {
           <p>No books available.</p>
         )}
       </div>
-      <p style={{ textAlign: 'center', color: '#4b5563' }}>Showing 1-{books.length} of {books.length} books. (Pagination coming soon!)</p>
+      {nextCursor ? (
+        <div style={{ textAlign: 'center', margin: '20px 0' }}>
+          <button onClick={loadMore} disabled={loadingMore} className="btn btn-primary">
+            {loadingMore ? 'Loading...' : 'Load more books'}
+          </button>
+        </div>
+      ) : (
+        <p style={{ textAlign: 'center', color: '#4b5563' }}>Showing all {books.length} books.</p>
+      )}
     </div>
   );
 };
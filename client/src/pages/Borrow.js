@@ -1,25 +1,27 @@
 import { useContext, useEffect, useState } from 'react';
 import { AuthContext } from '../utils/AuthContext';
-import { getBooks, borrowBook } from '../utils/api';
+import { getBooksPage, borrowBook } from '../utils/api';
 import BookCard from '../components/BookCard';
 
 const Borrow = () => {
   const { user } = useContext(AuthContext);
   const [books, setBooks] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [error, setError] = useState(null);
 
-  useEffect(() => {
-    const fetchBooks = async () => {
-      try {
-        const data = await getBooks();
-        const availableBooks = data.filter(book => book.available_copies > 0);
-        setBooks(availableBooks);
-      } catch (err) {
-        console.error('Error fetching books:', err);
-        setError('Failed to load books.');
-      }
-    };
+  const fetchBooks = async (after) => {
+    try {
+      const page = await getBooksPage(after ? { after } : {});
+      const availableBooks = page.books.filter(book => book.available_copies > 0);
+      setBooks(prevBooks => (after ? [...prevBooks, ...availableBooks] : availableBooks));
+      setNextCursor(page.nextCursor);
+    } catch (err) {
+      console.error('Error fetching books:', err);
+      setError('Failed to load books.');
+    }
+  };
 
+  useEffect(() => {
     fetchBooks();
   }, []);
 
@@ -64,6 +66,13 @@ const Borrow = () => {
           </div>
         ))}
       </div>
+      {nextCursor && (
+        <div style={{ textAlign: 'center', margin: '20px 0' }}>
+          <button onClick={() => fetchBooks(nextCursor)} className="btn btn-primary">
+            Load more books
+          </button>
+        </div>
+      )}
     </div>
   );
 };
@@ -2,13 +2,62 @@ import axios from 'axios';
 
 const API_URL = 'https://library-management-system-backend-ngys.onrender.com/api';
 
-export const getBooks = async () => {
-  const response = await fetch(`${API_URL}/books`, {
+// One page of the catalog as { books, nextCursor }. Pass nextCursor back as
+// `after` for the following page; it is null on the last one. Pass
+// { fields, include } to ask for only some columns and child lists,
+// e.g. { fields: 'id,title', include: '' } for a lightweight listing
+export const getBooksPage = async (params = {}) => {
+  const query = new URLSearchParams(params).toString();
+  const response = await fetch(`${API_URL}/books${query ? `?${query}` : ''}`, {
     headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
   });
   if (!response.ok) throw new Error('Failed to fetch books');
+  const books = await response.json();
+  return { books, nextCursor: response.headers.get('X-Next-Cursor') };
+};
+
+// Just the first page, for places that show a few books
+export const getBooks = async (params = {}) => {
+  const { books } = await getBooksPage(params);
+  return books;
+};
+
+// Several books in one request, in the order given; missing ones come back
+// as { id, found: false }
+export const getBooksByIds = async (ids, params = {}) => {
+  const query = new URLSearchParams(params).toString();
+  const response = await fetch(`${API_URL}/books/lookup${query ? `?${query}` : ''}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Authorization: `Bearer ${localStorage.getItem('token')}`,
+    },
+    body: JSON.stringify({ ids }),
+  });
+  if (!response.ok) throw new Error('Failed to fetch books');
   const data = await response.json();
-  return data;
+  return data.results;
+};
+
+export const searchBooks = async (query) => {
+  const response = await fetch(`${API_URL}/books/search?q=${encodeURIComponent(query)}`, {
+    headers: { Authorization: `Bearer ${localStorage.getItem('token')}` },
+  });
+  if (!response.ok) throw new Error('Failed to search books');
+  const data = await response.json();
+  return data.results;
+};
+
+// Live changes to some books over server-sent events. `handlers` maps event
+// types (availability, review, rating, reset) to callbacks that get the
+// event's data; returns a function that closes the stream.
+export const subscribeToBooks = (ids, handlers) => {
+  if (ids.length === 0) return () => {};
+  const source = new EventSource(`${API_URL}/events?books=${ids.join(',')}`);
+  Object.entries(handlers).forEach(([type, handler]) => {
+    source.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+  });
+  return () => source.close();
 };
 
 export const getBook = async (id) => {
@@ -34,8 +83,11 @@ export const updateBook = async (id, bookData, token) => {
   return res.data;
 };
 
-export const deleteBook = async (id, token) => {
+// `version` is the book's version as last loaded; the server answers 409
+// if someone has changed or removed the book since
+export const deleteBook = async (id, version, token) => {
   await axios.delete(`${API_URL}/books/${id}`, {
+    params: { version },
     headers: { Authorization: `Bearer ${token}` }
   });
 };
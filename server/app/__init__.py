@@ -1,27 +1,115 @@
+import logging
+import os
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import configure_mappers
 from flask_jwt_extended import JWTManager
+from flask_migrate import Migrate
 from flask_cors import CORS
 
 db = SQLAlchemy()
 jwt = JWTManager()
+# SQLite can't ALTER most things in place, so migrations rebuild tables in batch
+# mode; its DDL is transactional, so a failed upgrade leaves nothing half-done
+migrate = Migrate(render_as_batch=True, transactional_ddl=True)
 
-def create_app():
+# Alembic environment and revisions, next to the app package
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+def create_app(config=None):
+    """Build the app without touching the database.
+
+    The schema is owned by the migrations in migrations/: run `flask db
+    upgrade` once per deploy, before the workers start. Nothing here opens
+    a connection, so the app can be created in a preloading parent process
+    and forked (see gunicorn.conf.py).
+    """
     app = Flask(__name__)
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///library.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False 
     app.config['JWT_SECRET_KEY'] = 'yusufmim123'  
     app.config['JWT_TOKEN_LOCATION'] = ['headers']  
+    # Identities are {'id', 'email'} dicts, not strings
+    app.config['JWT_VERIFY_SUB'] = False
+    # Per-process cache of the users behind tokens; revocations clear it in
+    # every worker at once, other changes to a user show after AUTH_CACHE_TTL
+    app.config['AUTH_CACHE_TTL'] = 30
+    app.config['AUTH_CACHE_MAX_ENTRIES'] = 10000
+    app.config['LOG_LEVEL'] = 'INFO'
+    app.config['RESPONSE_CACHE_ENABLED'] = True
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = 1024
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+    # Password hashing: bcrypt work factor and the per-process hashing pool
+    # (PASSWORD_HASH_WORKERS = 0 hashes inline on the request thread)
+    app.config['BCRYPT_ROUNDS'] = 12
+    app.config['PASSWORD_HASH_WORKERS'] = min(os.cpu_count() or 1, 4)
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 16
+    app.config['PASSWORD_HASH_TIMEOUT'] = 10
+    # Loan policy used by the fines engine
+    app.config['LOAN_PERIOD_DAYS'] = 14
+    app.config['FINE_PER_DAY'] = 0.25
+    app.config['FINE_CAP'] = 10.0
+    # How often each worker checks for book events written by other workers
+    app.config['EVENTS_POLL_INTERVAL'] = 0.5
+    # SQLite pragmas and pool (see app/storage.py) and the commit path
+    app.config['SQLITE_PROFILE'] = 'wal'
+    app.config['SQLITE_PRAGMAS'] = {}
+    app.config['WRITE_RETRY_ATTEMPTS'] = 5
+    app.config['WRITE_RETRY_BASE_DELAY'] = 0.01
+    app.config['WRITE_GROUP_COMMIT'] = False
+    app.config['WRITE_GROUP_MAX'] = 32
+    if config:
+        app.config.update(config)
+
+    logging.basicConfig(level=app.config['LOG_LEVEL'])
 
-    CORS(app, resources={r"/api/*": {"origins": "https://library-management-system-frontend-n7sn.onrender.com"}})
+    CORS(app, resources={r"/api/*": {"origins": "https://library-management-system-frontend-n7sn.onrender.com"}},
+         expose_headers=['X-Next-Cursor', 'Link', 'Server-Timing'])
 
+    from .storage import engine_options, install_storage_profile
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
     jwt.init_app(app)
-
+    migrate.init_app(app, db, directory=MIGRATIONS_DIRECTORY)
     with app.app_context():
-        db.create_all()
+        install_storage_profile(db.engine, app.config)
 
     from .routes import bp
+    from .auth import principal_cache
+
     app.register_blueprint(bp)
+    # Set up the mappers now rather than on the first query of every forked worker
+    configure_mappers()
+
+    from .cache import response_cache
+    response_cache.max_entries = app.config['RESPONSE_CACHE_MAX_ENTRIES']
+    response_cache.max_bytes = app.config['RESPONSE_CACHE_MAX_BYTES']
+
+    principal_cache.ttl = app.config['AUTH_CACHE_TTL']
+    principal_cache.max_entries = app.config['AUTH_CACHE_MAX_ENTRIES']
+
+    from .events import event_hub
+    event_hub.poll_interval = app.config['EVENTS_POLL_INTERVAL']
+
+    from .search import reindex_command
+    from .ratings import backfill_command
+    from .importer import import_command
+    from .exporter import export_command
+    from .fines import refresh_fines_command
+    from .queryplan import check_query_plans_command
+    from .recommendations import rebuild_command, update_command
+    from .auth import revoke_tokens_command, deactivate_user_command
+    from .analytics import rebuild_analytics_command
+    app.cli.add_command(reindex_command)
+    app.cli.add_command(backfill_command)
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(refresh_fines_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(rebuild_command)
+    app.cli.add_command(update_command)
+    app.cli.add_command(revoke_tokens_command)
+    app.cli.add_command(deactivate_user_command)
+    app.cli.add_command(rebuild_analytics_command)
 
     return app
\ No newline at end of file
@@ -0,0 +1,231 @@
+"""Circulation analytics: loans per day, genre and author, and the top books.
+
+The dashboard reads two rollup tables instead of grouping borrow_records
+and reviews on every load:
+
+    daily_genre_stats  loans made and returned per UTC day and genre
+    daily_book_stats   the same per UTC day and book, plus reviews and
+                       their rating sum
+
+Per-author figures come from daily_book_stats joined to books. The
+borrow, return and review paths fold each event in with one or two
+upserts in their own transaction (count_borrow, count_return,
+count_review), so the rollups commit or roll back with the change. A
+loan counts under the genre its book had at the time.
+
+The day and genre series read a handful of rows per day. Rankings by
+book and author group the window's daily_book_stats rows, so they cost
+in proportion to the distinct books borrowed each day rather than to
+the loans themselves.
+
+rebuild_analytics() recomputes the rollups from the raw tables, for a
+backfill or after editing history by hand:
+
+    flask analytics-rebuild [--since 2026-01-01]
+
+It holds the write lock while it runs, so borrows wait (or get a 503)
+until it commits. Loans and reviews of deleted books are gone from the
+raw tables, so a rebuild drops them from the rollups too.
+"""
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app import db
+from app.models import Book, DailyGenreStat, DailyBookStat
+
+# Widest window, in days, the read endpoints answer for
+MAX_ANALYTICS_DAYS = 366
+# Window when the caller gives none
+DEFAULT_ANALYTICS_DAYS = 30
+# Longest ranked list (top books, authors) one call returns
+MAX_ANALYTICS_LIMIT = 100
+
+BOOK_UPSERT_SQL = text("""
+INSERT INTO daily_book_stats (day, book_id, borrows, returns, reviews, rating_sum)
+VALUES (:day, :book_id, :borrows, :returns, :reviews, :rating)
+ON CONFLICT (day, book_id) DO UPDATE SET
+    borrows = borrows + excluded.borrows,
+    returns = returns + excluded.returns,
+    reviews = reviews + excluded.reviews,
+    rating_sum = rating_sum + excluded.rating_sum
+""")
+
+# Takes the genre from the book as it stands in this transaction
+GENRE_UPSERT_SQL = text("""
+INSERT INTO daily_genre_stats (day, genre, borrows, returns)
+SELECT :day, COALESCE(genre, ''), :borrows, :returns FROM books WHERE id = :book_id
+ON CONFLICT (day, genre) DO UPDATE SET
+    borrows = borrows + excluded.borrows,
+    returns = returns + excluded.returns
+""")
+
+REBUILD_SQL = [
+    text("DELETE FROM daily_book_stats WHERE day >= :since"),
+    text("DELETE FROM daily_genre_stats WHERE day >= :since"),
+    text("""
+    INSERT INTO daily_book_stats (day, book_id, borrows, returns, reviews, rating_sum)
+    SELECT day, book_id, SUM(borrows), SUM(returns), SUM(reviews), SUM(rating_sum) FROM (
+        SELECT date(borrow_date) AS day, book_id, 1 AS borrows, 0 AS returns, 0 AS reviews, 0 AS rating_sum
+        FROM borrow_records WHERE borrow_date >= :since
+        UNION ALL
+        SELECT date(return_date), book_id, 0, 1, 0, 0 FROM borrow_records WHERE return_date >= :since
+        UNION ALL
+        SELECT date(created_at), book_id, 0, 0, 1, rating FROM reviews WHERE created_at >= :since
+    ) GROUP BY day, book_id
+    """),
+    # From the rows just written rather than borrow_records again, grouped
+    # by each book's genre today
+    text("""
+    INSERT INTO daily_genre_stats (day, genre, borrows, returns)
+    SELECT s.day, COALESCE(b.genre, ''), SUM(s.borrows), SUM(s.returns)
+    FROM daily_book_stats AS s LEFT JOIN books AS b ON b.id = s.book_id
+    WHERE s.day >= :since AND (s.borrows > 0 OR s.returns > 0)
+    GROUP BY s.day, COALESCE(b.genre, '')
+    """),
+]
+
+
+def count_circulation(book_id, moment, borrows=0, returns=0):
+    parameters = {'day': moment.date().isoformat(), 'book_id': book_id, 'borrows': borrows, 'returns': returns}
+    db.session.execute(BOOK_UPSERT_SQL, dict(parameters, reviews=0, rating=0))
+    db.session.execute(GENRE_UPSERT_SQL, parameters)
+
+
+def count_borrow(book_id, borrow_date):
+    """Add a new loan to the rollups, in the caller's transaction."""
+    count_circulation(book_id, borrow_date, borrows=1)
+
+
+def count_return(book_id, return_date):
+    """Add a return to the rollups, in the caller's transaction."""
+    count_circulation(book_id, return_date, returns=1)
+
+
+def count_review(book_id, created_at, rating):
+    """Add a new review to the rollups, in the caller's transaction."""
+    db.session.execute(BOOK_UPSERT_SQL, {'day': created_at.date().isoformat(), 'book_id': book_id,
+                                         'borrows': 0, 'returns': 0, 'reviews': 1, 'rating': rating})
+
+
+def rebuild_analytics(since=None):
+    """Recompute the rollups for the days from `since` (all days if None); returns the book rows written."""
+    parameters = {'since': since.isoformat() if since else ''}
+    results = [db.session.execute(statement, parameters) for statement in REBUILD_SQL]
+    db.session.commit()
+    return results[2].rowcount
+
+
+def analytics_window(start=None, end=None):
+    """The (start, end) dates to report on, both inclusive. Raises ValueError.
+
+    Defaults to the DEFAULT_ANALYTICS_DAYS days ending today (UTC).
+    """
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=DEFAULT_ANALYTICS_DAYS - 1)
+    if start > end:
+        raise ValueError('from must not be after to')
+    if (end - start).days >= MAX_ANALYTICS_DAYS:
+        raise ValueError(f'At most {MAX_ANALYTICS_DAYS} days can be reported at once')
+    return start, end
+
+
+def borrows_by_day(start, end):
+    """[{day, borrows, returns}] for every day in the window with any loans."""
+    borrows, returns = db.func.sum(DailyGenreStat.borrows), db.func.sum(DailyGenreStat.returns)
+    rows = db.session.execute(
+        db.select(DailyGenreStat.day, borrows, returns)
+        .where(DailyGenreStat.day.between(start, end))
+        .group_by(DailyGenreStat.day)
+        .order_by(DailyGenreStat.day))
+    return [{'day': day.isoformat(), 'borrows': b, 'returns': r} for day, b, r in rows]
+
+
+def borrows_by_genre(start, end):
+    """[{genre, borrows, returns}] over the window, most borrowed first; genre is None for books without one."""
+    borrows, returns = db.func.sum(DailyGenreStat.borrows), db.func.sum(DailyGenreStat.returns)
+    rows = db.session.execute(
+        db.select(DailyGenreStat.genre, borrows, returns)
+        .where(DailyGenreStat.day.between(start, end))
+        .group_by(DailyGenreStat.genre)
+        .order_by(borrows.desc(), DailyGenreStat.genre))
+    return [{'genre': genre or None, 'borrows': b, 'returns': r} for genre, b, r in rows]
+
+
+def borrows_by_author(start, end, limit):
+    """[{author, borrows, returns}] for the `limit` most borrowed authors over the window."""
+    per_book = (db.select(DailyBookStat.book_id,
+                          db.func.sum(DailyBookStat.borrows).label('borrows'),
+                          db.func.sum(DailyBookStat.returns).label('returns'))
+                .where(DailyBookStat.day.between(start, end))
+                .group_by(DailyBookStat.book_id)
+                .subquery())
+    borrows, returns = db.func.sum(per_book.c.borrows), db.func.sum(per_book.c.returns)
+    rows = db.session.execute(
+        db.select(Book.author, borrows, returns)
+        .select_from(per_book)
+        .join(Book, Book.id == per_book.c.book_id)
+        .group_by(Book.author)
+        .having(borrows > 0)
+        .order_by(borrows.desc(), Book.author)
+        .limit(limit))
+    return [{'author': author, 'borrows': b, 'returns': r} for author, b, r in rows]
+
+
+def ranked_books(columns, ranked):
+    """Dicts for the books of `ranked`, a subquery already ordered and limited, in its order.
+
+    Books are looked up only for the rows that made the cut; deleted ones
+    keep their counts, with a None title and author.
+    """
+    rows = db.session.execute(
+        db.select(ranked.c.book_id, Book.title, Book.author, *[ranked.c[name] for name in columns])
+        .select_from(ranked)
+        .outerjoin(Book, Book.id == ranked.c.book_id)
+        .order_by(ranked.c.rank))
+    return [dict(zip(('id', 'title', 'author', *columns), row)) for row in rows]
+
+
+def top_borrowed(start, end, limit):
+    """[{id, title, author, borrows}] for the `limit` most borrowed books over the window."""
+    borrows = db.func.sum(DailyBookStat.borrows)
+    ranked = (db.select(DailyBookStat.book_id, borrows.label('borrows'),
+                        db.func.row_number().over(order_by=(borrows.desc(), DailyBookStat.book_id)).label('rank'))
+              .where(DailyBookStat.day.between(start, end))
+              .group_by(DailyBookStat.book_id)
+              .having(borrows > 0)
+              .order_by(borrows.desc(), DailyBookStat.book_id)
+              .limit(limit)
+              .subquery())
+    return ranked_books(('borrows',), ranked)
+
+
+def top_rated(start, end, limit, min_reviews):
+    """[{id, title, author, average_rating, reviews}] for the `limit` best rated books.
+
+    Counts the reviews written in the window, and only books with at
+    least `min_reviews` of them.
+    """
+    reviews = db.func.sum(DailyBookStat.reviews)
+    average = db.cast(db.func.sum(DailyBookStat.rating_sum), db.Float) / reviews
+    order = (average.desc(), reviews.desc(), DailyBookStat.book_id)
+    ranked = (db.select(DailyBookStat.book_id, db.func.round(average, 2).label('average_rating'),
+                        reviews.label('reviews'),
+                        db.func.row_number().over(order_by=order).label('rank'))
+              .where(DailyBookStat.day.between(start, end), DailyBookStat.reviews > 0)
+              .group_by(DailyBookStat.book_id)
+              .having(reviews >= max(min_reviews, 1))
+              .order_by(*order)
+              .limit(limit)
+              .subquery())
+    return ranked_books(('average_rating', 'reviews'), ranked)
+
+
+@click.command('analytics-rebuild')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Only recompute the days from this date (YYYY-MM-DD); all days by default.')
+@with_appcontext
+def rebuild_analytics_command(since):
+    """Recompute the circulation analytics rollups from loans and reviews."""
+    count = rebuild_analytics(since.date() if since else None)
+    click.echo(f'Stored {count} daily book rows.')
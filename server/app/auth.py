@@ -0,0 +1,162 @@
+"""Who is calling: the user behind a JWT, resolved once per request from a cache.
+
+JWTManager's user_lookup_loader runs for every request with a token. It
+takes the user's id, role, is_active and token_version from a
+per-process LRU that keeps each entry for AUTH_CACHE_TTL seconds, so an
+authenticated request normally costs no user query at all; read the
+result with flask_jwt_extended.current_user.
+
+Tokens carry the token_version they were issued under (the `ver`
+claim). A token is refused once its account is deactivated or its
+version is bumped, which `flask deactivate-user` and `flask
+revoke-tokens` do. Those commands run in their own process, so along
+with the user they bump the 'auth' scope in cache_versions. Every
+request reads that one row, a primary-key lookup, and a worker that
+finds it moved drops its whole cache, so a revoked token stops working
+on the next request in every worker.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import click
+from flask import jsonify
+from flask.cli import with_appcontext
+from app import db, jwt
+from app.models import User
+from app.cache import current_versions, bump_scopes
+from app.nplusone import outside_budget
+
+# Claim holding the user's token_version at the time the token was issued
+VERSION_CLAIM = 'ver'
+
+# cache_versions scope bumped whenever a user's tokens are revoked or the
+# account is deactivated or reactivated
+AUTH_SCOPE = 'auth'
+
+Principal = namedtuple('Principal', 'id email username role is_active token_version')
+
+
+class PrincipalCache:
+    """Process-local LRU of user principals, each kept for `ttl` seconds."""
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # The AUTH_SCOPE version the entries were loaded under
+        self.revocations = None
+
+    def sync(self, revocations):
+        """Drop every entry if a revocation has been recorded since they were loaded."""
+        with self.lock:
+            if revocations != self.revocations:
+                self.entries.clear()
+                self.revocations = revocations
+
+    def get(self, user_id):
+        """(found, principal); a cached None means there is no such user."""
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return False, None
+            principal, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[user_id]
+                return False, None
+            self.entries.move_to_end(user_id)
+            return True, principal
+
+    def put(self, user_id, principal):
+        with self.lock:
+            self.entries[user_id] = (principal, time.monotonic() + self.ttl)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+principal_cache = PrincipalCache()
+
+
+def load_principal(user_id):
+    row = db.session.execute(db.select(User.id, User.email, User.username, User.role,
+                                       User.is_active, User.token_version)
+                             .where(User.id == user_id)).first()
+    return Principal(*row) if row else None
+
+
+def token_claims(user):
+    """Extra claims for a new access token for `user`."""
+    return {VERSION_CLAIM: user.token_version}
+
+
+@jwt.user_lookup_loader
+def lookup_principal(jwt_header, jwt_data):
+    """The caller's Principal, or None (answered with 401) if the token may no longer be used."""
+    identity = jwt_data.get('sub')
+    user_id = identity.get('id') if isinstance(identity, dict) else None
+    if user_id is None:
+        return None
+    # A fixed cost of every authenticated request rather than of the route
+    with outside_budget():
+        principal_cache.sync(current_versions([AUTH_SCOPE])[0])
+    found, principal = principal_cache.get(user_id)
+    if not found:
+        with outside_budget():
+            principal = load_principal(user_id)
+        principal_cache.put(user_id, principal)
+    # is_active is NULL for accounts created before it was set on insert
+    if principal is None or principal.is_active is False:
+        return None
+    if jwt_data.get(VERSION_CLAIM, 0) != principal.token_version:
+        return None
+    return principal
+
+
+@jwt.user_lookup_error_loader
+def rejected_principal(jwt_header, jwt_data):
+    return jsonify({'message': 'This session is no longer valid, please log in again'}), 401
+
+
+def revoke_tokens(user, deactivate=False):
+    """Invalidate every token issued to `user` so far, optionally deactivating the account; commits."""
+    user.token_version = User.token_version + 1
+    if deactivate:
+        user.is_active = False
+    bump_scopes(AUTH_SCOPE)
+    db.session.commit()
+
+
+@click.command('revoke-tokens')
+@click.argument('email')
+@with_appcontext
+def revoke_tokens_command(email):
+    """Log a user out everywhere by invalidating their current tokens."""
+    user = User.query.filter_by(email=email.lower().strip()).first()
+    if not user:
+        raise click.ClickException(f'No user with email {email}')
+    revoke_tokens(user)
+    click.echo(f'Revoked tokens for {user.email}.')
+
+
+@click.command('deactivate-user')
+@click.argument('email')
+@click.option('--reactivate', is_flag=True, help='Allow the account to log in again instead.')
+@with_appcontext
+def deactivate_user_command(email, reactivate):
+    """Deactivate a user's account, refusing their tokens from then on."""
+    user = User.query.filter_by(email=email.lower().strip()).first()
+    if not user:
+        raise click.ClickException(f'No user with email {email}')
+    if reactivate:
+        user.is_active = True
+        bump_scopes(AUTH_SCOPE)
+        db.session.commit()
+        click.echo(f'Reactivated {user.email}.')
+    else:
+        revoke_tokens(user, deactivate=True)
+        click.echo(f'Deactivated {user.email}.')
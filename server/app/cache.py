@@ -0,0 +1,127 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, Response
+from sqlalchemy import text
+from app import db
+from app.models import CacheVersion
+
+# Version scopes. 'catalog' covers listings that can contain any book;
+# book_scope(id) covers responses about a single book.
+CATALOG_SCOPE = 'catalog'
+
+def book_scope(book_id):
+    return f'book:{book_id}'
+
+# Response headers that are recomputed rather than replayed from the cache
+SKIP_HEADERS = {'Content-Length', 'ETag'}
+
+
+class ResponseCache:
+    """Process-local LRU of rendered responses, bounded by entry count and bytes."""
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry['versions'] != versions:
+                # Written under an older version: stale everywhere
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, versions, body, headers):
+        if len(body) > self.max_bytes:
+            return None
+        entry = {
+            'versions': versions,
+            'body': body,
+            'headers': headers,
+            'etag': hashlib.sha1(body).hexdigest()
+        }
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.size += len(body)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= len(entry['body'])
+
+
+response_cache = ResponseCache()
+
+
+def current_versions(scopes):
+    """Read the committed version of each scope (0 if never bumped) in one query."""
+    rows = CacheVersion.query.filter(CacheVersion.scope.in_(scopes)).all()
+    found = {row.scope: row.version for row in rows}
+    return tuple(found.get(scope, 0) for scope in scopes)
+
+
+def bump_versions(*book_ids):
+    """Invalidate cached responses for the given books and the catalog listing.
+
+    Call before the commit of the write so the bump is part of the same
+    transaction; every worker sees it as soon as the change is visible.
+    """
+    bump_scopes(CATALOG_SCOPE, *[book_scope(book_id) for book_id in book_ids])
+
+
+def bump_scopes(*scopes):
+    """Bump the version of each scope, in the caller's transaction."""
+    db.session.execute(text(
+        "INSERT INTO cache_versions (scope, version) VALUES (:scope, 1) "
+        "ON CONFLICT (scope) DO UPDATE SET version = version + 1"
+    ), [{'scope': scope} for scope in scopes])
+
+
+def cached_response(scopes):
+    """Serve a GET view from the response cache with strong ETags.
+
+    `scopes` receives the view arguments and returns the version scopes the
+    response depends on. Only 200 responses are cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+                return view(*args, **kwargs)
+
+            key = request.full_path
+            versions = current_versions(scopes(**kwargs))
+            entry = response_cache.get(key, versions)
+            if entry is None:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                headers = [(k, v) for k, v in response.headers.items() if k not in SKIP_HEADERS]
+                entry = response_cache.put(key, versions, response.get_data(), headers)
+                if entry is None:
+                    return response
+
+            response = Response(entry['body'], status=200, headers=entry['headers'])
+            response.set_etag(entry['etag'])
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.models import Book, BorrowRecord
+from app.cache import bump_versions
+from app.events import record_availability
+from app.analytics import count_borrow, count_return
+from app.fines import due_date_for, fine_for
+
+
+class CirculationError(Exception):
+    """A borrow or return that was refused; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def checkout(user_id, book_id):
+    """Create a borrow record and take one copy, without committing.
+
+    The copy is taken with a single conditional UPDATE so concurrent
+    borrowers can never drive available_copies below zero.
+    """
+    book = db.session.get(Book, book_id)
+    if not book:
+        raise CirculationError('Book not found', 404)
+
+    if book.available_copies <= 0:
+        raise CirculationError('No copies available')
+
+    existing_borrow = BorrowRecord.query.filter_by(
+        user_id=user_id,
+        book_id=book_id,
+        return_date=None
+    ).first()
+    if existing_borrow:
+        raise CirculationError('You have already borrowed this book')
+
+    taken = Book.query.filter(
+        Book.id == book_id,
+        Book.available_copies > 0
+    ).update({Book.available_copies: Book.available_copies - 1}, synchronize_session=False)
+    if not taken:
+        # Another worker took the last copy since we looked
+        raise CirculationError('No copies available')
+
+    borrow_date = datetime.utcnow()
+    borrow_record = BorrowRecord(
+        user_id=user_id,
+        book_id=book_id,
+        borrow_date=borrow_date,
+        due_date=due_date_for(borrow_date),
+        status='borrowed'
+    )
+    db.session.add(borrow_record)
+    # Assign the id now so callers can report it before committing
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # uq_borrow_records_open_loan: a concurrent request won the race
+        raise CirculationError('You have already borrowed this book')
+    bump_versions(book_id)
+    record_availability(book_id)
+    count_borrow(book_id, borrow_date)
+    return borrow_record
+
+
+def checkin(user_id, borrow_id):
+    """Close a borrow record and put its copy back, without committing.
+
+    Closing the record is conditional on it still being open, so two
+    concurrent returns of the same loan only restore one copy.
+    """
+    borrow_record = db.session.get(BorrowRecord, borrow_id)
+    if not borrow_record:
+        raise CirculationError('Borrow record not found', 404)
+
+    if borrow_record.user_id != user_id:
+        raise CirculationError('Unauthorized', 403)
+
+    if borrow_record.return_date:
+        raise CirculationError('Book already returned')
+
+    # Settle the fine for this loan now rather than waiting for the next
+    # refresh-fines run
+    closed_values = {
+        'return_date': datetime.utcnow(),
+        'status': 'returned'
+    }
+    closed_values['fine_amount'] = fine_for(borrow_record.due_date, closed_values['return_date'])
+    closed = BorrowRecord.query.filter(
+        BorrowRecord.id == borrow_id,
+        BorrowRecord.return_date.is_(None)
+    ).update(closed_values, synchronize_session=False)
+    if not closed:
+        raise CirculationError('Book already returned')
+    # Mirror the UPDATE on the loaded object without marking it dirty
+    for name, value in closed_values.items():
+        set_committed_value(borrow_record, name, value)
+
+    Book.query.filter_by(id=borrow_record.book_id).update(
+        {Book.available_copies: Book.available_copies + 1}, synchronize_session=False)
+    bump_versions(borrow_record.book_id)
+    record_availability(borrow_record.book_id)
+    count_return(borrow_record.book_id, closed_values['return_date'])
+    return borrow_record
@@ -0,0 +1,184 @@
+"""Book change events for the /api/events server-sent event stream.
+
+The write paths record an event row in book_events inside their own
+transaction (next to bump_versions), so an event becomes visible exactly
+when its change commits and never for a change that rolled back. Each
+worker process runs one EventHub thread, only while it has subscribers,
+that tails book_events and hands new rows to the streams subscribed to
+their book. Because the table is the channel, events written by any
+worker reach subscribers in every worker on the host; a worker that
+just committed wakes its own hub instead of waiting for the next poll.
+
+Event types and their data (all also carry book_id):
+
+    availability  available_copies, total_copies
+    review        review_id, user_id, rating
+    rating        rating_count, average_rating
+"""
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+from sqlalchemy import bindparam, text
+from app import db
+from app.models import BookEvent
+from app.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+# Events kept for Last-Event-ID replay; older ones are pruned as new ones arrive
+RETAINED_EVENTS = 10000
+PRUNE_EVERY = 500
+
+# Events a slow stream may fall behind by before it is closed; the browser
+# reconnects with Last-Event-ID and catches up from the table
+SUBSCRIBER_BACKLOG = 256
+
+# Rows the hub reads per poll
+READ_BATCH = 1000
+
+AVAILABILITY_SQL = text("""
+INSERT INTO book_events (book_id, type, data, created_at)
+SELECT id, 'availability', json_object('available_copies', available_copies, 'total_copies', total_copies), :now
+FROM books WHERE id IN :book_ids
+""").bindparams(bindparam('book_ids', expanding=True))
+
+REVIEW_SQL = text("""
+INSERT INTO book_events (book_id, type, data, created_at)
+SELECT :book_id, 'review', json_object('review_id', :review_id, 'user_id', :user_id, 'rating', :rating), :now
+UNION ALL
+SELECT id, 'rating', json_object(
+    'rating_count', rating_count,
+    'average_rating', CASE WHEN rating_count > 0 THEN CAST(rating_sum AS REAL) / rating_count ELSE 0 END), :now
+FROM books WHERE id = :book_id
+""")
+
+
+def record(statement, parameters):
+    result = db.session.execute(statement, dict(parameters, now=datetime.utcnow()))
+    # Every PRUNE_EVERY events, drop the ones too old to replay
+    if result.rowcount > 0 and result.lastrowid % PRUNE_EVERY < result.rowcount:
+        db.session.execute(text('DELETE FROM book_events WHERE id <= :cutoff'),
+                           {'cutoff': result.lastrowid - RETAINED_EVENTS})
+
+
+def record_availability(*book_ids):
+    """Record the books' copy counts as they stand in the current transaction."""
+    record(AVAILABILITY_SQL, {'book_ids': list(book_ids)})
+
+
+def record_review(review):
+    """Record a new (flushed) review and the book's updated rating aggregates."""
+    record(REVIEW_SQL, {'book_id': review.book_id, 'review_id': review.id,
+                        'user_id': review.user_id, 'rating': review.rating})
+
+
+def format_event(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+
+
+def read_events(after_id, until_id=None, book_ids=None, limit=None):
+    """[(id, book_id, type, SSE data)] for committed events newer than `after_id`, oldest first."""
+    statement = (db.select(BookEvent.id, BookEvent.book_id, BookEvent.type, BookEvent.data)
+                 .where(BookEvent.id > after_id)
+                 .order_by(BookEvent.id)
+                 .limit(limit))
+    if until_id is not None:
+        statement = statement.where(BookEvent.id <= until_id)
+    if book_ids is not None:
+        statement = statement.where(BookEvent.book_id.in_(book_ids))
+    rows = db.session.execute(statement)
+    return [(event_id, book_id, event_type, json.dumps(dict(json.loads(data), book_id=book_id)))
+            for event_id, book_id, event_type, data in rows]
+
+
+def latest_event_id():
+    return db.session.query(db.func.max(BookEvent.id)).scalar() or 0
+
+
+def oldest_event_id():
+    return db.session.query(db.func.min(BookEvent.id)).scalar()
+
+
+class Subscription:
+    """One stream's book IDs and the queue of SSE messages waiting for it."""
+
+    def __init__(self, book_ids, start_id):
+        self.book_ids = frozenset(book_ids)
+        self.start_id = start_id
+        self.messages = queue.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        self.overflowed = False
+
+    def put(self, message):
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+
+class EventHub:
+    """Per-process fan-out of book_events rows to the open streams."""
+
+    def __init__(self, poll_interval=0.5):
+        self.poll_interval = poll_interval
+        self.by_book = {}
+        self.last_id = 0
+        self.thread = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def subscribe(self, app, book_ids):
+        """Register a stream; must be called with an app context. Events after start_id will be queued."""
+        with self.lock:
+            if self.thread is None:
+                # Nobody was listening: start tailing from the current end
+                self.last_id = latest_event_id()
+                self.thread = threading.Thread(target=self.run, args=(app,), name='event-hub', daemon=True)
+                self.thread.start()
+            subscription = Subscription(book_ids, self.last_id)
+            for book_id in subscription.book_ids:
+                self.by_book.setdefault(book_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for book_id in subscription.book_ids:
+                subscribers = self.by_book.get(book_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.by_book[book_id]
+
+    def notify(self):
+        """Poll now rather than at the next interval; call after committing an event."""
+        self.wakeup.set()
+
+    def run(self, app):
+        with app.app_context():
+            while True:
+                with self.lock:
+                    if not self.by_book:
+                        self.thread = None
+                        return
+                try:
+                    events = read_events(self.last_id, limit=READ_BATCH)
+                except Exception as e:
+                    # e.g. the database is busy; try again at the next poll
+                    log_event(logger, logging.WARNING, 'event_poll_failed', error=str(e))
+                    events = []
+                finally:
+                    db.session.remove()
+                with self.lock:
+                    for event_id, book_id, event_type, data in events:
+                        for subscription in self.by_book.get(book_id, ()):
+                            subscription.put(format_event(event_id, event_type, data))
+                    if events:
+                        self.last_id = events[-1][0]
+                if len(events) == READ_BATCH:
+                    continue  # more waiting already
+                if self.wakeup.wait(self.poll_interval):
+                    self.wakeup.clear()
+
+
+event_hub = EventHub()
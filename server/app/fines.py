@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import DateTime, bindparam, text
+from app import db
+
+# Whole days past the due date, as SQLite computes them
+DAYS_OVERDUE_SQL = "CAST(julianday(:now) - julianday(due_date) AS INTEGER)"
+FINE_SQL = f"MIN(:cap, ROUND(:rate * {DAYS_OVERDUE_SQL}, 2))"
+
+
+def loan_period():
+    return timedelta(days=current_app.config['LOAN_PERIOD_DAYS'])
+
+
+def due_date_for(borrow_date):
+    return borrow_date + loan_period()
+
+
+def fine_for(due_date, returned_at):
+    """The fine owed for a loan returned (or still out) at `returned_at`."""
+    if not due_date or returned_at <= due_date:
+        return 0.0
+    days = (returned_at - due_date).days
+    return min(current_app.config['FINE_CAP'], round(days * current_app.config['FINE_PER_DAY'], 2))
+
+
+def assign_missing_due_dates():
+    """Give loans created before due dates were tracked one from the loan policy."""
+    result = db.session.execute(text(
+        "UPDATE borrow_records SET due_date = datetime(borrow_date, :period) WHERE due_date IS NULL"
+    ), {'period': f"+{current_app.config['LOAN_PERIOD_DAYS']} days"})
+    return result.rowcount
+
+
+def refresh_overdue(now=None):
+    """Mark every open loan past its due date overdue and recompute its fine.
+
+    One set-based UPDATE over open loans; rows whose status and fine are
+    already current are left alone so repeated runs write nothing new.
+    """
+    params = {
+        'now': now or datetime.utcnow(),
+        'rate': current_app.config['FINE_PER_DAY'],
+        'cap': current_app.config['FINE_CAP']
+    }
+    result = db.session.execute(text(
+        f"UPDATE borrow_records SET status = 'overdue', fine_amount = {FINE_SQL} "
+        "WHERE return_date IS NULL AND due_date < :now "
+        f"AND (status IS NOT 'overdue' OR fine_amount IS NOT {FINE_SQL})"
+    ).bindparams(bindparam('now', type_=DateTime)), params)
+    return result.rowcount
+
+
+@click.command('refresh-fines')
+@with_appcontext
+def refresh_fines_command():
+    """Assign missing due dates, then mark overdue loans and recompute their fines."""
+    assigned = assign_missing_due_dates()
+    updated = refresh_overdue()
+    db.session.commit()
+    click.echo(f'Assigned {assigned} due dates, updated {updated} overdue loans.')
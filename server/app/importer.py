@@ -0,0 +1,203 @@
+import csv
+import io
+import json
+import os
+import re
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from app import db
+from app.models import Book
+from app.cache import bump_versions
+from app.events import record_availability
+from app.storage import run_with_retry
+
+DEFAULT_CHUNK_SIZE = 1000
+# How many rejected rows are reported back in detail
+MAX_REPORTED_ERRORS = 20
+
+# Catalog fields replaced when an imported ISBN already exists
+UPDATE_COLUMNS = ['title', 'author', 'image_url', 'description', 'publication_year', 'genre']
+
+
+def normalize_isbn(raw):
+    """Return the ISBN without separators if its check digit is valid, else None."""
+    isbn = re.sub(r'[\s-]', '', str(raw or '')).upper()
+    if re.fullmatch(r'\d{9}[\dX]', isbn):
+        total = sum((10 - i) * (10 if ch == 'X' else int(ch)) for i, ch in enumerate(isbn))
+        return isbn if total % 11 == 0 else None
+    if re.fullmatch(r'\d{13}', isbn):
+        total = sum(int(ch) * (1 if i % 2 == 0 else 3) for i, ch in enumerate(isbn))
+        return isbn if total % 10 == 0 else None
+    return None
+
+
+def optional_int(value):
+    if value is None or str(value).strip() == '':
+        return None
+    return int(value)
+
+
+def book_values(record):
+    """Validate one input record and turn it into a row for `books`. Raises ValueError."""
+    isbn = normalize_isbn(record.get('isbn'))
+    if not isbn:
+        raise ValueError(f"invalid ISBN {record.get('isbn')!r}")
+    title = (record.get('title') or '').strip()
+    author = (record.get('author') or '').strip()
+    if not title or not author:
+        raise ValueError('title and author are required')
+
+    total_copies = optional_int(record.get('total_copies'))
+    total_copies = 1 if total_copies is None else total_copies
+    available_copies = optional_int(record.get('available_copies'))
+    available_copies = total_copies if available_copies is None else available_copies
+    if total_copies < 0 or not 0 <= available_copies <= total_copies:
+        raise ValueError('copies must satisfy 0 <= available_copies <= total_copies')
+
+    return {
+        'isbn': isbn,
+        'title': title[:200],
+        'author': author[:100],
+        'total_copies': total_copies,
+        'available_copies': available_copies,
+        'image_url': record.get('image_url') or None,
+        'description': record.get('description') or None,
+        'publication_year': optional_int(record.get('publication_year')),
+        'genre': record.get('genre') or None,
+        'created_at': datetime.utcnow()
+    }
+
+
+def iter_records(stream, fmt):
+    """Yield one dict per input record from a text stream, never reading ahead more than a line."""
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        raise ValueError(f'Unsupported format {fmt!r}, expected csv or jsonl')
+
+
+def upsert_books(rows):
+    """Insert or update one chunk of rows with a single executemany statement, without committing.
+
+    Returns the ISBNs of existing books left unchanged because their new
+    total_copies is below the copies currently on loan.
+    """
+    table = Book.__table__
+    stmt = insert(table)
+    # Keep outstanding loans: shift availability by the change in stock
+    available_copies = table.c.available_copies + stmt.excluded.total_copies - table.c.total_copies
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.isbn],
+        set_={
+            **{name: stmt.excluded[name] for name in UPDATE_COLUMNS},
+            'total_copies': stmt.excluded.total_copies,
+            'available_copies': available_copies,
+            # Librarians' pending patches to these books must reload first
+            'version': table.c.version + 1
+        },
+        # Shifting can't take it above total_copies, only below zero
+        where=available_copies >= 0
+    )
+    db.session.execute(stmt, rows)
+    stored = db.session.execute(
+        select(table.c.id, table.c.isbn, table.c.total_copies)
+        .where(table.c.isbn.in_([row['isbn'] for row in rows]))).all()
+    bump_versions(*[book_id for book_id, _, _ in stored])
+    wanted = {row['isbn']: row['total_copies'] for row in rows}
+    record_availability(*[book_id for book_id, isbn, total_copies in stored if total_copies == wanted[isbn]])
+    return {isbn for _, isbn, total_copies in stored if total_copies != wanted[isbn]}
+
+
+def import_books(stream, fmt, chunk_size=DEFAULT_CHUNK_SIZE, skip=0, on_chunk=None):
+    """Stream records into `books`, committing every `chunk_size` valid rows.
+
+    The first `skip` records are read but not imported, for resuming. After
+    each commit `on_chunk(stats)` is called; stats['records'] is the number
+    of input records fully processed so far and is safe to resume from.
+    """
+    stats = {'records': 0, 'imported': 0, 'rejected': 0, 'errors': []}
+
+    def reject(record_number, error):
+        stats['rejected'] += 1
+        if len(stats['errors']) < MAX_REPORTED_ERRORS:
+            stats['errors'].append({'record': record_number, 'error': error})
+
+    def flush(chunk):
+        refused = run_with_retry(lambda: upsert_books([row for _, row in chunk]))
+        for record_number, row in chunk:
+            if row['isbn'] in refused:
+                reject(record_number, f"total_copies {row['total_copies']} is below the copies on loan")
+            else:
+                stats['imported'] += 1
+
+    chunk = []
+    for record in iter_records(stream, fmt):
+        stats['records'] += 1
+        if stats['records'] <= skip:
+            continue
+        try:
+            chunk.append((stats['records'], book_values(record)))
+        except (ValueError, TypeError, AttributeError) as e:
+            reject(stats['records'], str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+            if on_chunk:
+                on_chunk(stats)
+    if chunk:
+        flush(chunk)
+    if on_chunk:
+        on_chunk(stats)
+    return stats
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower()
+    return {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}.get(extension)
+
+
+def text_stream(binary_stream):
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+
+@click.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Rows per transaction.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help='File recording progress; an existing checkpoint is resumed from.')
+@with_appcontext
+def import_command(path, fmt, chunk_size, checkpoint):
+    """Upsert books from a CSV or JSONL file, keyed on ISBN."""
+    fmt = fmt or detect_format(path)
+    if not fmt:
+        raise click.UsageError('Cannot tell the format from the file name, pass --format')
+
+    skip = 0
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        if saved.get('path') != os.path.abspath(path):
+            raise click.UsageError(f'{checkpoint} belongs to a different import ({saved.get("path")})')
+        skip = saved['records']
+        click.echo(f'Resuming after record {skip}')
+
+    def report(stats):
+        click.echo(f"{stats['records']} records read, {stats['imported']} imported, {stats['rejected']} rejected")
+        if checkpoint:
+            with open(checkpoint, 'w') as f:
+                json.dump({'path': os.path.abspath(path), 'records': stats['records']}, f)
+
+    with open(path, 'rb') as f:
+        stats = import_books(text_stream(f), fmt, chunk_size=chunk_size, skip=skip, on_chunk=report)
+    for error in stats['errors']:
+        click.echo(f"record {error['record']}: {error['error']}", err=True)
+    click.echo('Import finished.')
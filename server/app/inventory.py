@@ -0,0 +1,285 @@
+"""Admin edits to the catalog and stock: create, patch and delete books in bulk.
+
+Each function handles a whole batch in the caller's transaction with the
+same handful of statements however many books it holds: new rows go in
+with one executemany INSERT, and patches and deletes are single UPDATE
+... FROM / DELETE statements that read the batch from a JSON parameter.
+Nothing commits here; run them through run_with_retry() so a batch
+commits or rolls back as a whole.
+
+Every book carries a version. A patch or delete names the version the
+librarian last saw and only applies to a book still at that version, so
+two librarians editing the same book can't silently overwrite each
+other and no rows stay locked while they edit. If any book in the batch
+has moved on (or gone), the batch is refused with the current versions
+and the client reloads and tries again.
+
+Borrows and returns don't bump the version: a patch changing
+total_copies shifts available_copies by the same amount, keeping the
+copies currently on loan. A patch that sets available_copies itself may
+not put more on the shelf than total_copies less the open loans, so an
+edit made from a stale read can't hand back copies that are out.
+"""
+import json
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Book, BorrowRecord
+from app.cache import bump_versions
+from app.events import record_availability
+from app.importer import book_values, normalize_isbn
+
+# Largest batch one call accepts
+MAX_INVENTORY_BATCH = 500
+
+# Fields a patch may change, and whether they may be set to null
+PATCH_FIELDS = {
+    'title': False,
+    'author': False,
+    'isbn': False,
+    'image_url': True,
+    'description': True,
+    'publication_year': True,
+    'genre': True,
+    'total_copies': False,
+    'available_copies': False,
+}
+
+# `c` is the batch joined to the books it names at the versions it names,
+# with the copy counts each book would end up with and the most it may
+# have on the shelf. Open loans are only counted for patches that set
+# available_copies; the others shift it along with total_copies.
+PATCH_SQL = text("""
+UPDATE books SET
+    title = coalesce(json_extract(c.change, '$.title'), books.title),
+    author = coalesce(json_extract(c.change, '$.author'), books.author),
+    isbn = coalesce(json_extract(c.change, '$.isbn'), books.isbn),
+    image_url = CASE WHEN json_type(c.change, '$.image_url') IS NULL
+                     THEN books.image_url ELSE json_extract(c.change, '$.image_url') END,
+    description = CASE WHEN json_type(c.change, '$.description') IS NULL
+                       THEN books.description ELSE json_extract(c.change, '$.description') END,
+    publication_year = CASE WHEN json_type(c.change, '$.publication_year') IS NULL
+                            THEN books.publication_year ELSE json_extract(c.change, '$.publication_year') END,
+    genre = CASE WHEN json_type(c.change, '$.genre') IS NULL
+                 THEN books.genre ELSE json_extract(c.change, '$.genre') END,
+    total_copies = c.total_copies,
+    available_copies = c.available_copies,
+    version = books.version + 1
+FROM (
+    SELECT b.id, j.value AS change,
+           coalesce(json_extract(j.value, '$.total_copies'), b.total_copies) AS total_copies,
+           coalesce(json_extract(j.value, '$.available_copies'),
+                    b.available_copies + coalesce(json_extract(j.value, '$.total_copies'), b.total_copies)
+                    - b.total_copies) AS available_copies,
+           coalesce(json_extract(j.value, '$.total_copies'), b.total_copies)
+           - CASE WHEN json_type(j.value, '$.available_copies') IS NULL THEN 0
+                  ELSE (SELECT count(*) FROM borrow_records AS r
+                        WHERE r.book_id = b.id AND r.return_date IS NULL) END AS max_available
+    FROM json_each(:changes) AS j
+    JOIN books AS b ON b.id = json_extract(j.value, '$.id')
+    WHERE b.version = json_extract(j.value, '$.version')
+) AS c
+WHERE books.id = c.id AND c.available_copies BETWEEN 0 AND c.max_available
+RETURNING books.id, books.version
+""")
+
+# Books on loan can't be deleted; their open loans would be left pointing nowhere
+DELETE_SQL = text("""
+DELETE FROM books WHERE id IN (
+    SELECT b.id FROM json_each(:books) AS j
+    JOIN books AS b ON b.id = json_extract(j.value, '$.id')
+    WHERE b.version = json_extract(j.value, '$.version')
+      AND NOT EXISTS (SELECT 1 FROM borrow_records AS r WHERE r.book_id = b.id AND r.return_date IS NULL)
+)
+RETURNING id
+""")
+
+# History of deleted books, as the ORM cascade on Book would remove it.
+# book_neighbours rows pointing *at* a deleted book are left for the next
+# rebuild; recommendations join to books, so they are never shown.
+DELETE_CHILDREN_SQL = [
+    text(f'DELETE FROM {table} WHERE book_id IN :book_ids').bindparams(bindparam('book_ids', expanding=True))
+    for table in ('reviews', 'borrow_records', 'book_neighbours')
+]
+
+
+class InventoryError(Exception):
+    """A batch that was refused as a whole; `errors` says which items and why."""
+
+    def __init__(self, message, status_code=400, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.errors = errors or []
+
+
+def check_batch(items):
+    if not isinstance(items, list) or not items:
+        raise InventoryError('books must be a non-empty list')
+    if len(items) > MAX_INVENTORY_BATCH:
+        raise InventoryError(f'At most {MAX_INVENTORY_BATCH} books can be changed at once')
+    if not all(isinstance(item, dict) for item in items):
+        raise InventoryError('Each book must be an object')
+
+
+def read_id_and_version(item):
+    book_id, version = item.get('id'), item.get('version')
+    if not isinstance(book_id, int) or not isinstance(version, int) or isinstance(book_id, bool):
+        raise ValueError('id and version must be integers')
+    return book_id, version
+
+
+def patch_values(item):
+    """The validated fields of one patch, as {field: value}. Raises ValueError."""
+    unknown = set(item) - set(PATCH_FIELDS) - {'id', 'version'}
+    if unknown:
+        raise ValueError(f"unknown fields {', '.join(sorted(unknown))}")
+    values = {}
+    for field, nullable in PATCH_FIELDS.items():
+        if field not in item:
+            continue
+        value = item[field]
+        if value is None:
+            if not nullable:
+                raise ValueError(f'{field} may not be null')
+        elif field in ('total_copies', 'available_copies', 'publication_year'):
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f'{field} must be an integer')
+            if field != 'publication_year' and value < 0:
+                raise ValueError(f'{field} must not be negative')
+        elif field == 'isbn':
+            value = normalize_isbn(value)
+            if not value:
+                raise ValueError(f"invalid ISBN {item['isbn']!r}")
+        elif not isinstance(value, str):
+            raise ValueError(f'{field} must be a string')
+        elif field in ('title', 'author'):
+            value = value.strip()[:200 if field == 'title' else 100]
+            if not value:
+                raise ValueError(f'{field} may not be empty')
+        values[field] = value
+    if not values:
+        raise ValueError('nothing to change')
+    if 'total_copies' in values and 'available_copies' in values \
+            and values['available_copies'] > values['total_copies']:
+        raise ValueError('available_copies may not exceed total_copies')
+    return values
+
+
+def validated(items, read):
+    """[read(item)] for a batch, or InventoryError listing every item that failed."""
+    check_batch(items)
+    results, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            results.append(read(item))
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append({'index': index, 'error': str(e)})
+    if errors:
+        raise InventoryError('Some books are invalid', 400, errors)
+    return results
+
+
+def refuse_duplicates(keys, name):
+    seen, errors = set(), []
+    for index, key in enumerate(keys):
+        if key in seen:
+            errors.append({'index': index, 'error': f'{name} {key} appears more than once'})
+        seen.add(key)
+    if errors:
+        raise InventoryError(f'Each {name} may appear only once', 400, errors)
+
+
+def current_state(book_ids):
+    """{id: (version, open loans)} for the books that still exist."""
+    on_loan = (db.select(db.func.count()).select_from(BorrowRecord)
+               .where(BorrowRecord.book_id == Book.id, BorrowRecord.return_date.is_(None))
+               .scalar_subquery())
+    rows = db.session.execute(db.select(Book.id, Book.version, on_loan).where(Book.id.in_(book_ids)))
+    return {book_id: (version, loans) for book_id, version, loans in rows}
+
+
+def refused(items, applied, describe):
+    """Raise InventoryError for the items of a batch that weren't applied."""
+    missed = [item for item in items if item['id'] not in applied]
+    state = current_state([item['id'] for item in missed])
+    errors, conflict = [], False
+    for item in missed:
+        if item['id'] not in state:
+            errors.append({'id': item['id'], 'error': 'not_found'})
+            conflict = True
+        elif state[item['id']][0] != item['version']:
+            errors.append({'id': item['id'], 'error': 'version_conflict', 'current_version': state[item['id']][0]})
+            conflict = True
+        else:
+            errors.append({'id': item['id'], **describe(item, state[item['id']])})
+    if conflict:
+        raise InventoryError('Some books were changed or removed by someone else; reload them and try again',
+                             409, errors)
+    raise InventoryError('Some changes were refused', 400, errors)
+
+
+def create_books(records):
+    """Insert a batch of new books; returns their IDs in the order given."""
+    def read(record):
+        record = dict(record)
+        # A form with only the copies on the shelf means that many in total
+        if record.get('total_copies') in (None, '') and record.get('available_copies') not in (None, ''):
+            record['total_copies'] = record['available_copies']
+        return book_values(record)
+
+    rows = validated(records, read)
+    refuse_duplicates([row['isbn'] for row in rows], 'ISBN')
+    existing = set(db.session.execute(
+        db.select(Book.isbn).where(Book.isbn.in_([row['isbn'] for row in rows]))).scalars())
+    if existing:
+        raise InventoryError('Some ISBNs are already in the catalog', 409,
+                             [{'index': index, 'error': f"ISBN {row['isbn']} already exists"}
+                              for index, row in enumerate(rows) if row['isbn'] in existing])
+    table = Book.__table__
+    try:
+        # Matched up by ISBN: asking for RETURNING rows in parameter order
+        # makes SQLAlchemy insert on SQLite one row per statement
+        inserted = dict(db.session.execute(table.insert().returning(table.c.isbn, table.c.id), rows).all())
+    except IntegrityError:
+        # Another librarian added one of them since we looked
+        raise InventoryError('Some ISBNs are already in the catalog', 409)
+    book_ids = [inserted[row['isbn']] for row in rows]
+    bump_versions(*book_ids)
+    return book_ids
+
+
+def patch_books(changes):
+    """Apply a batch of patches, each at the version it names; returns {id: new version}."""
+    values = validated(changes, lambda change: (read_id_and_version(change), patch_values(change)))
+    refuse_duplicates([book_id for (book_id, _), _ in values], 'book id')
+    batch = [{'id': book_id, 'version': version, **fields} for (book_id, version), fields in values]
+    try:
+        applied = dict(db.session.execute(PATCH_SQL, {'changes': json.dumps(batch)}).all())
+    except IntegrityError:
+        raise InventoryError('Another book already has one of these ISBNs', 409)
+    if len(applied) < len(batch):
+        refused(batch, applied, lambda item, state: {
+            'error': 'copies',
+            'message': f'available_copies must stay between 0 and total_copies less the {state[1]} on loan'})
+
+    bump_versions(*applied)
+    stock_changed = [item['id'] for item in batch if 'total_copies' in item or 'available_copies' in item]
+    if stock_changed:
+        record_availability(*stock_changed)
+    return applied
+
+
+def delete_books(items):
+    """Delete a batch of books, each at the version it names, with their reviews and loan history."""
+    batch = [{'id': book_id, 'version': version} for book_id, version in validated(items, read_id_and_version)]
+    refuse_duplicates([item['id'] for item in batch], 'book id')
+    deleted = db.session.execute(DELETE_SQL, {'books': json.dumps(batch)}).scalars().all()
+    if len(deleted) < len(batch):
+        refused(batch, set(deleted), lambda item, state: {
+            'error': 'on_loan', 'message': f'{state[1]} copies are still on loan'})
+
+    for statement in DELETE_CHILDREN_SQL:
+        db.session.execute(statement, {'book_ids': deleted})
+    bump_versions(*deleted)
+    return deleted
@@ -0,0 +1,11 @@
+import json
+
+
+def log_event(logger, level, event, **fields):
+    """Log `event` with its fields as one JSON object.
+
+    Returns straight away when `level` is disabled, so the message is never
+    formatted on a hot path that isn't being logged.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({'event': event, **fields}, default=str))
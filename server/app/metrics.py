@@ -0,0 +1,139 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """In-process metrics, rendered in the Prometheus text format.
+
+    Each worker process keeps its own registry; scrape every worker (or sum
+    them) to get totals for the whole deployment.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, text) in sorted(self.help.items()):
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{format_labels(labels)} {value}')
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+registry = Registry()
+registry.describe('library_http_requests_total', 'counter', 'Requests handled, by endpoint, method and status.')
+registry.describe('library_http_request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+registry.describe('library_http_response_size_bytes', 'histogram', 'Response body size by endpoint.')
+registry.describe('library_db_statements_per_request', 'histogram', 'SQL statements issued per request, by endpoint.')
+registry.describe('library_db_statements_total', 'counter', 'SQL statements issued, by endpoint.')
+registry.describe('library_db_duration_seconds_total', 'counter', 'Time spent executing SQL, by endpoint.')
+
+
+# The start time lives on the statement's execution context, which goes
+# away with it, so a statement that raises leaves nothing behind
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_start', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if has_request_context() and 'metrics_started' in g:
+        g.db_statements += 1
+        g.db_seconds += elapsed
+
+
+def start_request():
+    g.metrics_started = time.perf_counter()
+    g.db_statements = 0
+    g.db_seconds = 0.0
+
+
+def finish_request(response):
+    """Record the request and add a Server-Timing header; meant for after_request."""
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_started
+    endpoint = request.endpoint or 'unmatched'
+    labels = {'endpoint': endpoint}
+
+    registry.inc('library_http_requests_total',
+                 {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)})
+    registry.observe('library_http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+    registry.observe('library_db_statements_per_request', labels, g.db_statements, STATEMENT_BUCKETS)
+    registry.inc('library_db_statements_total', labels, g.db_statements)
+    registry.inc('library_db_duration_seconds_total', labels, g.db_seconds)
+    # Streamed bodies haven't been produced yet, so their size is unknown
+    if not response.is_streamed:
+        registry.observe('library_http_response_size_bytes', labels, response.calculate_content_length() or 0,
+                         SIZE_BUCKETS)
+
+    response.headers['Server-Timing'] = (
+        f'app;dur={elapsed * 1000:.2f}, '
+        f'db;dur={g.db_seconds * 1000:.2f};desc="{g.db_statements} queries"'
+    )
+    return response
@@ -1,5 +1,7 @@
 from app import db
 from datetime import datetime
+from sqlalchemy import case, cast
+from sqlalchemy.ext.hybrid import hybrid_property
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -10,6 +12,8 @@ class User(db.Model):
     role = db.Column(db.String(20), nullable=False, default='user')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    # Bumped to invalidate every token issued so far (see app/auth.py)
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationships
     borrow_records = db.relationship('BorrowRecord', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -41,6 +45,13 @@ class Book(db.Model):
     publication_year = db.Column(db.Integer, nullable=True)
     genre = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Review aggregates, maintained by add_review (see app/ratings.py)
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by every catalog or stock edit, so concurrent admin edits are
+    # detected instead of overwriting each other (see app/inventory.py).
+    # Borrows and returns don't touch it.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     # Relationships
     borrow_records = db.relationship('BorrowRecord', backref='book', lazy=True, cascade='all, delete-orphan')
@@ -49,11 +60,15 @@ class Book(db.Model):
     def __repr__(self):
         return f'<Book {self.title}>'
     
-    @property
+    @hybrid_property
     def average_rating(self):
-        if not self.reviews:
+        if not self.rating_count:
             return 0
-        return sum(review.rating for review in self.reviews) / len(self.reviews)
+        return self.rating_sum / self.rating_count
+    
+    @average_rating.expression
+    def average_rating(cls):
+        return case((cls.rating_count > 0, cast(cls.rating_sum, db.Float) / cls.rating_count), else_=0)
     
     @property
     def is_available(self):
@@ -72,7 +87,9 @@ class Book(db.Model):
             'publication_year': self.publication_year,
             'genre': self.genre,
             'average_rating': self.average_rating,
+            'rating_count': self.rating_count,
             'is_available': self.is_available,
+            'version': self.version,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
@@ -87,6 +104,20 @@ class BorrowRecord(db.Model):
     status = db.Column(db.String(20), default='borrowed')  # borrowed, returned, overdue
     fine_amount = db.Column(db.Float, default=0.0)
     
+    # Indexes
+    __table_args__ = (
+        # Open loans per user (borrowed-books list, profile)
+        db.Index('ix_borrow_records_user_id_return_date', 'user_id', 'return_date'),
+        db.Index('ix_borrow_records_book_id', 'book_id'),
+        db.Index('ix_borrow_records_borrow_date', 'borrow_date'),
+        # At most one open loan per user and book; also answers the duplicate-borrow check
+        db.Index('uq_borrow_records_open_loan', 'user_id', 'book_id', unique=True,
+                 sqlite_where=db.text('return_date IS NULL')),
+        # Open loans by due date, for the fines engine
+        db.Index('ix_borrow_records_open_due_date', 'due_date',
+                 sqlite_where=db.text('return_date IS NULL')),
+    )
+    
     def __repr__(self):
         return f'<BorrowRecord User:{self.user_id} Book:{self.book_id}>'
     
@@ -129,6 +160,7 @@ class Review(db.Model):
     __table_args__ = (
         db.CheckConstraint('rating >= 1 AND rating <= 5', name='rating_range'),
         db.UniqueConstraint('user_id', 'book_id', name='unique_user_book_review'),
+        db.Index('ix_reviews_book_id', 'book_id'),
     )
     
     def __repr__(self):
@@ -143,4 +175,90 @@ class Review(db.Model):
             'comment': self.comment,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    # e.g. 'catalog' or 'book:42'; bumped in the same transaction as the change
+    scope = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.scope}:{self.version}>'
+
+class BookNeighbour(db.Model):
+    __tablename__ = 'book_neighbours'
+    # "Patrons who borrowed book_id also borrowed neighbour_id", `count` times.
+    # At most NEIGHBOUR_CAPACITY rows per book; see app/recommendations.py.
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('ix_book_neighbours_book_id_count', 'book_id', 'count'),
+    )
+    
+    def __repr__(self):
+        return f'<BookNeighbour {self.book_id}->{self.neighbour_id}:{self.count}>'
+
+class JobWatermark(db.Model):
+    __tablename__ = 'job_watermarks'
+    # Highest source row ID an incremental job has processed
+    name = db.Column(db.String(64), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<JobWatermark {self.name}:{self.last_id}>'
+
+class BookEvent(db.Model):
+    __tablename__ = 'book_events'
+    # Changes pushed to /api/events subscribers. Written in the same
+    # transaction as the change, so only committed changes are ever sent;
+    # see app/events.py.
+    id = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    def __repr__(self):
+        return f'<BookEvent {self.id} {self.type} book:{self.book_id}>'
+
+class DailyGenreStat(db.Model):
+    __tablename__ = 'daily_genre_stats'
+    # Loans made and returned per UTC day and genre ('' for books without
+    # one), kept current by the borrow and return paths; see app/analytics.py
+    day = db.Column(db.Date, primary_key=True)
+    genre = db.Column(db.String(50), primary_key=True)
+    borrows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    returns = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Clustered on (day, genre), so a date range is one sequential read
+    __table_args__ = {'sqlite_with_rowid': False}
+    
+    def __repr__(self):
+        return f'<DailyGenreStat {self.day} {self.genre!r}:{self.borrows}>'
+
+class DailyBookStat(db.Model):
+    __tablename__ = 'daily_book_stats'
+    # The same per UTC day and book, plus the reviews written that day.
+    # No foreign key: the counts outlive a deleted book.
+    day = db.Column(db.Date, primary_key=True)
+    book_id = db.Column(db.Integer, primary_key=True)
+    borrows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    returns = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    reviews = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        # Most rows count loans only; the rating rankings read just the
+        # days with reviews, from the index alone
+        db.Index('ix_daily_book_stats_reviewed', 'day', 'book_id', 'reviews', 'rating_sum',
+                 sqlite_where=db.text('reviews > 0')),
+        {'sqlite_with_rowid': False},
+    )
+    
+    def __repr__(self):
+        return f'<DailyBookStat {self.day} book:{self.book_id}:{self.borrows}>'
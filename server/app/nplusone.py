@@ -0,0 +1,129 @@
+"""N+1 query detection and per-route query budgets.
+
+With QUERY_INSPECTION on (the default in debug and testing), every SQL
+statement a request issues is grouped by its normalised text. A group that
+repeats N_PLUS_ONE_THRESHOLD times or more is logged as an N+1 pattern,
+naming the route and, for lazy loads, the relationship attribute behind it.
+
+Routes declare how many statements they may issue with @query_budget(n).
+Going over budget raises QueryBudgetExceeded when the app is testing, so
+the pytest run (or any test client call) fails; otherwise it is logged.
+tests/test_query_budgets.py sends every budgeted route its scenario from
+tests/scenarios.py, and fails if a budgeted route has none.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from app.logs import log_event
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = 3
+
+IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+WHITESPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A route issued more SQL statements than its declared budget."""
+
+
+def query_budget(limit, per_item=False):
+    """Declare the most SQL statements a route may issue per request.
+
+    per_item=True marks routes that repeat the same statements once per
+    item on purpose (the batch endpoints), so the repeats are not flagged.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        view.query_per_item = per_item
+        return view
+    return decorator
+
+
+@contextmanager
+def outside_budget():
+    """Leave the statements issued inside out of the route's budget.
+
+    For loads a cache amortises across requests, such as resolving the
+    caller on a cold cache. They still show in X-Query-Count.
+    """
+    if not (has_request_context() and 'query_log' in g):
+        yield
+        return
+    start = len(g.query_log)
+    try:
+        yield
+    finally:
+        g.unbudgeted_statements = g.get('unbudgeted_statements', 0) + len(g.query_log) - start
+
+
+def normalize_sql(statement):
+    statement = STRING_LITERAL.sub('?', statement)
+    statement = NUMBER_LITERAL.sub('?', statement)
+    statement = IN_LIST.sub('(?)', statement)
+    return WHITESPACE.sub(' ', statement).strip()
+
+
+def inspection_enabled():
+    enabled = current_app.config.get('QUERY_INSPECTION')
+    if enabled is None:
+        return current_app.debug or current_app.testing
+    return enabled
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def note_lazy_load(orm_execute_state):
+    if not (has_request_context() and 'query_log' in g):
+        return
+    if orm_execute_state.is_relationship_load and orm_execute_state.lazy_loaded_from is not None:
+        prop = orm_execute_state.loader_strategy_path[-1]
+        g.pending_relationship = f'{prop.parent.class_.__name__}.{prop.key}'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def log_statement(conn, cursor, statement, parameters, context, executemany):
+    if not (has_request_context() and 'query_log' in g):
+        return
+    g.query_log.append((normalize_sql(statement), g.pop('pending_relationship', None)))
+
+
+def start_query_log():
+    if inspection_enabled():
+        g.query_log = []
+
+
+def check_query_log(response):
+    """Report N+1 groups and enforce the route's budget; meant for after_request."""
+    if 'query_log' not in g:
+        return response
+    route = request.endpoint or 'unmatched'
+    view = current_app.view_functions.get(request.endpoint)
+    statements = Counter(sql for sql, _ in g.query_log)
+    relationships = {sql: relationship for sql, relationship in g.query_log if relationship}
+
+    # Only repeated reads count; a write per item is what a batch is for
+    if not getattr(view, 'query_per_item', False):
+        for sql, count in statements.items():
+            if count >= N_PLUS_ONE_THRESHOLD and sql.upper().startswith('SELECT'):
+                log_event(logger, logging.WARNING, 'n_plus_one', route=route, count=count,
+                          relationship=relationships.get(sql), statement=sql)
+
+    response.headers['X-Query-Count'] = str(len(g.query_log))
+    budget = getattr(view, 'query_budget', None)
+    counted = len(g.query_log) - g.get('unbudgeted_statements', 0)
+    if budget is not None and counted > budget:
+        message = f'{route} issued {counted} SQL statements, budget is {budget}'
+        if current_app.testing:
+            raise QueryBudgetExceeded(message + ':\n' + '\n'.join(
+                f'{count}x {sql}' for sql, count in statements.most_common()))
+        log_event(logger, logging.ERROR, 'query_budget_exceeded', route=route,
+                  statements=counted, budget=budget)
+    return response
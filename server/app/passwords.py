@@ -0,0 +1,101 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from flask import current_app
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already queued in this process, one timed out, or the pool broke."""
+
+
+# Run in the pool's worker processes, so they must be importable module-level functions
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+class HashingPool:
+    """A per-process bcrypt pool with a cap on queued work.
+
+    The pool is created on first use and again after a fork, so a preloaded
+    app never shares its parent's worker processes. A hash counts against
+    the cap until it finishes, even if its request gave up waiting: one
+    already running can't be stopped, and it still holds a worker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+        self.pending = 0
+
+    def run(self, fn, *args):
+        config = current_app.config
+        workers = config['PASSWORD_HASH_WORKERS']
+        if not workers:
+            return fn(*args)
+
+        with self.lock:
+            if self.pending >= config['PASSWORD_HASH_MAX_PENDING']:
+                raise HashingBusy()
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers=workers)
+                self.pid = os.getpid()
+            executor = self.executor
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self.discard(executor)
+                raise HashingBusy()
+            self.pending += 1
+        future.add_done_callback(self.finished)
+        try:
+            return future.result(timeout=config['PASSWORD_HASH_TIMEOUT'])
+        except FuturesTimeout:
+            # Only works while it is still queued
+            future.cancel()
+            raise HashingBusy()
+        except BrokenProcessPool:
+            # A worker process died; the next call starts a new pool
+            with self.lock:
+                self.discard(executor)
+            raise HashingBusy()
+
+    def finished(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def discard(self, executor):
+        """Forget `executor` if it is still the current pool; call with the lock held."""
+        if self.executor is executor:
+            self.executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+hashing_pool = HashingPool()
+
+
+def hash_password(password):
+    """bcrypt-hash `password` at the configured work factor, off the request thread."""
+    return hashing_pool.run(_hashpw, password.encode('utf-8'), current_app.config['BCRYPT_ROUNDS'])
+
+
+def check_password(password, hashed):
+    if isinstance(hashed, str):
+        hashed = hashed.encode('utf-8')
+    return hashing_pool.run(_checkpw, password.encode('utf-8'), hashed)
+
+
+def needs_rehash(hashed):
+    """True if `hashed` was made with a different work factor than the configured one."""
+    if isinstance(hashed, bytes):
+        hashed = hashed.decode('utf-8')
+    try:
+        return int(hashed.split('$')[2]) != current_app.config['BCRYPT_ROUNDS']
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,21 @@
+"""`flask check-query-plans`: the query-plan tests, run from the Flask CLI.
+
+The check itself lives in tests/test_query_plans.py, where `pytest`
+picks it up along with the rest of the suite: every API route is driven
+against a scratch database and any statement whose plan reads a whole
+table fails. This command runs just that module, for a quick check
+without remembering the path. pytest is a development dependency, so it
+is only imported when the command runs.
+"""
+import os
+import click
+
+TESTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'test_query_plans.py')
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the plan of every statement.')
+def check_query_plans_command(verbose):
+    """Fail if any statement issued by the API routes falls back to a full table scan."""
+    import pytest
+    raise SystemExit(pytest.main([TESTS, '-v', '-s'] if verbose else [TESTS, '-q']))
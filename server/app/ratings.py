@@ -0,0 +1,35 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app import db
+from app.models import Book
+
+def record_rating(book_id, rating):
+    """Fold a new review into the book's aggregates.
+
+    Runs as a single UPDATE in the caller's transaction, so the aggregates
+    commit (or roll back) together with the review itself.
+    """
+    Book.query.filter_by(id=book_id).update({
+        Book.rating_count: Book.rating_count + 1,
+        Book.rating_sum: Book.rating_sum + rating
+    }, synchronize_session=False)
+
+
+def recompute_ratings():
+    """Recompute every book's aggregates from the reviews table in one statement."""
+    result = db.session.execute(text(
+        "UPDATE books SET "
+        "rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id), "
+        "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.book_id = books.id)"
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+@click.command('ratings-backfill')
+@with_appcontext
+def backfill_command():
+    """Recompute the rating aggregates of every book from its reviews."""
+    count = recompute_ratings()
+    click.echo(f'Recomputed rating aggregates for {count} books.')
@@ -0,0 +1,197 @@
+""""Patrons who borrowed this also borrowed" recommendations.
+
+Two books co-occur when one patron borrowed both, at most HISTORY distinct
+books apart in the order they first borrowed them (so a heavy reader's
+whole history doesn't link everything to everything). book_neighbours
+keeps up to NEIGHBOUR_CAPACITY co-occurring books per book with their
+counts, which the recommendations endpoint reads top-K with one indexed
+query.
+
+rebuild_recommendations() computes exact counts from every loan in one
+set-based statement. update_recommendations() folds in loans made since
+the last run, in batches: for each book touched it updates the stored
+counts in place, and when a new neighbour arrives at a full book it takes
+the place of the lowest count, starting from that count (the Space-Saving
+scheme). Counts can then overestimate by at most the count replaced,
+while storage per book stays bounded. Run it every few minutes:
+
+    flask recommendations-update
+"""
+from collections import Counter, defaultdict
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app import db
+from app.models import Book, BookNeighbour, BorrowRecord, JobWatermark
+from app.serializers import Projection, none_if_empty
+
+HISTORY = 20
+NEIGHBOUR_CAPACITY = 50
+WATERMARK = 'recommendations'
+
+RECOMMENDED_BOOK = Projection({
+    'id': Book.id,
+    'title': Book.title,
+    'author': Book.author,
+    'image_url': (Book.image_url, none_if_empty),
+    'available_copies': Book.available_copies,
+    'score': BookNeighbour.count,
+})
+
+# Each patron's distinct books numbered in the order they first borrowed them.
+# Kept in an indexed temp table so the pairing self-join is a range lookup.
+SEQUENCE_SQL = """
+CREATE TEMP TABLE borrow_sequence AS
+SELECT user_id, book_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY MIN(id)) AS position
+FROM borrow_records GROUP BY user_id, book_id
+"""
+
+REBUILD_SQL = """
+INSERT INTO book_neighbours (book_id, neighbour_id, count)
+WITH pairs AS (
+    SELECT a.book_id AS book_id, b.book_id AS neighbour_id, COUNT(*) AS count
+    FROM borrow_sequence a JOIN borrow_sequence b
+      ON b.user_id = a.user_id
+     AND b.position BETWEEN a.position - :history AND a.position + :history
+     AND b.position != a.position
+    GROUP BY a.book_id, b.book_id
+), ranked AS (
+    SELECT book_id, neighbour_id, count,
+           ROW_NUMBER() OVER (PARTITION BY book_id ORDER BY count DESC, neighbour_id) AS rank
+    FROM pairs
+)
+SELECT book_id, neighbour_id, count FROM ranked WHERE rank <= :capacity
+"""
+
+
+def set_watermark(last_id):
+    db.session.execute(text(
+        "INSERT INTO job_watermarks (name, last_id) VALUES (:name, :last_id) "
+        "ON CONFLICT (name) DO UPDATE SET last_id = :last_id"
+    ), {'name': WATERMARK, 'last_id': last_id})
+
+
+def rebuild_recommendations():
+    """Recompute every book's neighbours from all loans; returns the rows stored."""
+    last_id = db.session.query(db.func.max(BorrowRecord.id)).scalar() or 0
+    db.session.query(BookNeighbour).delete()
+    db.session.execute(text(SEQUENCE_SQL))
+    db.session.execute(text('CREATE INDEX temp.ix_borrow_sequence ON borrow_sequence (user_id, position)'))
+    result = db.session.execute(text(REBUILD_SQL), {'history': HISTORY, 'capacity': NEIGHBOUR_CAPACITY})
+    db.session.execute(text('DROP TABLE temp.borrow_sequence'))
+    set_watermark(last_id)
+    db.session.commit()
+    return result.rowcount
+
+
+def pair_deltas(loans):
+    """Co-occurrence increments from `loans`, the (id, user_id, book_id) rows of one batch.
+
+    Only a patron's first loan of a book adds pairs, with the HISTORY books
+    they first borrowed just before it.
+    """
+    user_ids = {user_id for _, user_id, _ in loans}
+    sequences = defaultdict(list)
+    positions = {}
+    for user_id, book_id, first_id in db.session.execute(
+            db.select(BorrowRecord.user_id, BorrowRecord.book_id, db.func.min(BorrowRecord.id))
+            .where(BorrowRecord.user_id.in_(user_ids))
+            .group_by(BorrowRecord.user_id, BorrowRecord.book_id)
+            .order_by(db.func.min(BorrowRecord.id))):
+        positions[first_id] = len(sequences[user_id])
+        sequences[user_id].append(book_id)
+
+    deltas = Counter()
+    for loan_id, user_id, book_id in loans:
+        position = positions.get(loan_id)
+        if position is None:
+            continue  # borrowed this book before
+        for other_id in sequences[user_id][max(0, position - HISTORY):position]:
+            deltas[(book_id, other_id)] += 1
+            deltas[(other_id, book_id)] += 1
+    return deltas
+
+
+def apply_deltas(deltas):
+    """Fold pair increments into the bounded neighbour lists of the books they touch."""
+    by_book = defaultdict(dict)
+    for (book_id, neighbour_id), delta in deltas.items():
+        by_book[book_id][neighbour_id] = delta
+    book_ids = list(by_book)
+
+    stored = defaultdict(dict)
+    for start in range(0, len(book_ids), 500):
+        for book_id, neighbour_id, count in db.session.execute(
+                db.select(BookNeighbour.book_id, BookNeighbour.neighbour_id, BookNeighbour.count)
+                .where(BookNeighbour.book_id.in_(book_ids[start:start + 500]))):
+            stored[book_id][neighbour_id] = count
+
+    changed, evicted = {}, []
+    for book_id, increments in by_book.items():
+        counts = stored[book_id]
+        for neighbour_id, delta in increments.items():
+            if neighbour_id not in counts and len(counts) >= NEIGHBOUR_CAPACITY:
+                lowest = min(counts, key=lambda other: (counts[other], -other))
+                counts[neighbour_id] = counts.pop(lowest)
+                changed.pop((book_id, lowest), None)
+                evicted.append({'book_id': book_id, 'neighbour_id': lowest})
+            counts[neighbour_id] = counts.get(neighbour_id, 0) + delta
+            changed[(book_id, neighbour_id)] = counts[neighbour_id]
+
+    if evicted:
+        db.session.execute(text(
+            "DELETE FROM book_neighbours WHERE book_id = :book_id AND neighbour_id = :neighbour_id"
+        ), evicted)
+    if changed:
+        db.session.execute(text(
+            "INSERT INTO book_neighbours (book_id, neighbour_id, count) VALUES (:book_id, :neighbour_id, :count) "
+            "ON CONFLICT (book_id, neighbour_id) DO UPDATE SET count = excluded.count"
+        ), [{'book_id': book_id, 'neighbour_id': neighbour_id, 'count': count}
+             for (book_id, neighbour_id), count in changed.items()])
+
+
+def update_recommendations(batch_size=5000):
+    """Fold in loans made since the last run; returns how many were processed."""
+    processed = 0
+    while True:
+        watermark = db.session.get(JobWatermark, WATERMARK)
+        last_id = watermark.last_id if watermark else 0
+        loans = db.session.execute(
+            db.select(BorrowRecord.id, BorrowRecord.user_id, BorrowRecord.book_id)
+            .where(BorrowRecord.id > last_id)
+            .order_by(BorrowRecord.id)
+            .limit(batch_size)).all()
+        if not loans:
+            return processed
+        apply_deltas(pair_deltas(loans))
+        set_watermark(loans[-1][0])
+        db.session.commit()
+        processed += len(loans)
+
+
+def recommendations_for(book_id, limit):
+    """Dicts for the `limit` books most often borrowed by patrons who borrowed `book_id`."""
+    rows = db.session.execute(RECOMMENDED_BOOK.select()
+                              .select_from(BookNeighbour)
+                              .join(Book, Book.id == BookNeighbour.neighbour_id)
+                              .where(BookNeighbour.book_id == book_id)
+                              .order_by(BookNeighbour.count.desc(), BookNeighbour.neighbour_id)
+                              .limit(limit))
+    return [RECOMMENDED_BOOK.to_dict(row) for row in rows]
+
+
+@click.command('recommendations-rebuild')
+@with_appcontext
+def rebuild_command():
+    """Recompute all book recommendations from the full loan history."""
+    count = rebuild_recommendations()
+    click.echo(f'Stored {count} neighbour rows.')
+
+
+@click.command('recommendations-update')
+@click.option('--batch-size', default=5000, show_default=True, help='Loans folded in per transaction.')
+@with_appcontext
+def update_command(batch_size):
+    """Fold loans made since the last run into the book recommendations."""
+    count = update_recommendations(batch_size)
+    click.echo(f'Processed {count} new loans.')
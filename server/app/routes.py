@@ -1,91 +1,395 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, current_app, request, jsonify, url_for, Response, stream_with_context
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, current_user
 from app import db  
-from app.models import User, Book, BorrowRecord, Review
-import bcrypt
-from datetime import datetime, timedelta
+from app.models import User, Book, Review
+from app.search import search_books
+from app.ratings import record_rating
+from app.recommendations import recommendations_for
+from app.auth import token_claims
+from app.cache import cached_response, bump_versions, book_scope, CATALOG_SCOPE
+from app.circulation import checkout, checkin, CirculationError
+from app.inventory import create_books, patch_books, delete_books, InventoryError, PATCH_FIELDS
+from app.analytics import (count_review, analytics_window, borrows_by_day, borrows_by_genre, borrows_by_author,
+                           top_borrowed, top_rated, MAX_ANALYTICS_LIMIT)
+from app.storage import run_with_retry, DatabaseBusy
+from app.events import event_hub, record_review, read_events, oldest_event_id, format_event
+from app.importer import import_books, detect_format, text_stream, normalize_isbn
+from app.exporter import iter_export, parse_timestamp, EXPORTS, FORMATS
+from app.passwords import hash_password, check_password, needs_rehash, HashingBusy
+from app.logs import log_event
+from app.metrics import registry, start_request, finish_request
+from app.nplusone import query_budget, outside_budget, start_query_log, check_query_log
+from app.serializers import (BOOK_FIELDS, BOOK_LIST_CHILDREN, BOOK_DETAIL_CHILDREN, book_projection, book_items,
+                             books_by, profile, borrowed_books, json_array_response)
+from datetime import date, datetime, timedelta
+from contextlib import ExitStack
+from functools import wraps
 import logging
+import queue
 
 bp = Blueprint('api', __name__)
-logging.basicConfig(level=logging.DEBUG) 
+logger = logging.getLogger(__name__)
+
+# Per-request latency, SQL and response-size metrics, plus Server-Timing
+bp.before_request(start_request)
+bp.after_request(finish_request)
+
+# N+1 detection and query budgets (development and testing only by default)
+bp.before_request(start_query_log)
+bp.after_request(check_query_log)
+
+# Keyset pagination for the catalog listing
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def parse_page_args():
+    """Read ?limit= and ?after= from the query string, raising ValueError on bad input."""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        raise ValueError('limit and after must be integers')
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    if after < 0:
+        raise ValueError('after must be a non-negative book ID')
+    return limit, after
+
+def set_next_cursor(response, next_cursor):
+    """Expose the next-page cursor without changing the list-shaped response body."""
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        next_url = url_for(request.endpoint, _external=True, **(request.view_args or {}), **args)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
+
+def parse_book_view(children, default_include):
+    """Read ?fields= and ?include= into (fields, include) tuples, raising ValueError on unknown names.
+
+    Without ?fields= every field is returned; 'id' always is. Without
+    ?include= the endpoint's usual child lists are embedded, and an empty
+    ?include= embeds none.
+    """
+    def names(param, allowed):
+        values = {value.strip() for value in request.args[param].split(',') if value.strip()}
+        unknown = values - set(allowed)
+        if unknown:
+            raise ValueError(f"Unknown {param}: {', '.join(sorted(unknown))}; "
+                             f"expected any of {', '.join(allowed)}")
+        return values
+
+    fields = names('fields', BOOK_FIELDS) | {'id'} if 'fields' in request.args else BOOK_FIELDS
+    include = names('include', children) if 'include' in request.args else default_include
+    return tuple(sorted(fields)), tuple(sorted(include))
+
+# Most books one multi-get (?ids= or /api/books/lookup) resolves
+MAX_LOOKUP_SIZE = 200
+
+def read_lookup_keys(values, key):
+    """Validate the IDs or ISBNs of a multi-get, raising ValueError."""
+    if not isinstance(values, list) or not values:
+        raise ValueError(f'{key} must be a non-empty list')
+    if len(values) > MAX_LOOKUP_SIZE:
+        raise ValueError(f'At most {MAX_LOOKUP_SIZE} books can be looked up at once')
+    if key == 'ids':
+        try:
+            return [int(value) for value in values]
+        except (TypeError, ValueError):
+            raise ValueError('ids must be integers')
+    return [str(value).strip() for value in values]
+
+def lookup_books(keys, key):
+    """Books for `keys` (IDs or ISBNs) in the order asked for, with a marker for each one not found.
+
+    One query for the books plus one per included child list, however many
+    keys there are. Honours ?fields= and ?include= like get_books.
+    """
+    fields, include = parse_book_view(BOOK_LIST_CHILDREN, ('borrow_records', 'reviews'))
+    projection = book_projection(fields, include)
+    children = {name: BOOK_LIST_CHILDREN[name] for name in include}
+    if key == 'ids':
+        found = books_by(projection, children, Book.id, set(keys))
+        return [found.get(book_id, {'id': book_id, 'found': False}) for book_id in keys]
+    # Accept ISBNs with or without separators
+    lookups = {isbn: normalize_isbn(isbn) or isbn for isbn in keys}
+    found = books_by(projection, children, Book.isbn, set(lookups.values()))
+    return [found.get(lookups[isbn], {'isbn': isbn, 'found': False}) for isbn in keys]
+
+# Largest number of items accepted by the batch circulation endpoints
+MAX_BATCH_SIZE = 50
+# A handful of statements per item, plus the transaction's own
+BATCH_QUERY_BUDGET = 8 * MAX_BATCH_SIZE + 2
+
+def serialize_borrow_record(borrow_record):
+    return {
+        'id': borrow_record.id,
+        'user_id': borrow_record.user_id,
+        'book_id': borrow_record.book_id,
+        'borrow_date': borrow_record.borrow_date.isoformat() if borrow_record.borrow_date else None,
+        'due_date': borrow_record.due_date.isoformat() if borrow_record.due_date else None,
+        'return_date': borrow_record.return_date.isoformat() if borrow_record.return_date else None,
+        'fine_amount': borrow_record.fine_amount
+    }
+
+def read_batch(data, key):
+    """Return the list of IDs under `key`, raising ValueError if it is missing or too long."""
+    ids = (data or {}).get(key)
+    if not isinstance(ids, list) or not ids:
+        raise ValueError(f'{key} must be a non-empty list')
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValueError(f'At most {MAX_BATCH_SIZE} items can be processed at once')
+    return ids
+
+def admin_required(view):
+    """Like jwt_required(), but also require the caller's account to have the admin role."""
+    @wraps(view)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        # current_user is the cached principal, so this costs no query
+        if current_user.role != 'admin':
+            return jsonify({'message': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+def busy_response():
+    response = jsonify({'message': 'The library is busy right now, please try again'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
 @bp.route('/api/books', methods=['GET'])
+@query_budget(5)
+@cached_response(lambda: [CATALOG_SCOPE])
 def get_books():
     try:
-        logging.debug("Entering get_books endpoint")
-        books = Book.query.all()
-        logging.debug(f"Queried {len(books)} books from database")
-        if not books:
-            logging.debug("No books found in database")
+        if 'ids' in request.args:
+            # Multi-get: ?ids=1,2,3 returns just those books, in that order
+            try:
+                ids = read_lookup_keys([value for value in request.args['ids'].split(',') if value.strip()], 'ids')
+                return json_array_response(lookup_books(ids, 'ids'))
+            except ValueError as e:
+                return jsonify({'message': str(e)}), 400
+
+        try:
+            limit, after = parse_page_args()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        try:
+            fields, include = parse_book_view(BOOK_LIST_CHILDREN, ('borrow_records', 'reviews'))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        projection = book_projection(fields, include)
+
+        # One query for the page plus one batched query per requested child
+        # list, however many books or reviews the page holds. Rows are read
+        # as plain column tuples, never as ORM objects.
+        query = projection.select().where(Book.id > after)
+        min_rating = request.args.get('min_rating', type=float)
+        if min_rating is not None:
+            query = query.where(Book.average_rating >= min_rating)
+        rows = db.session.execute(query.order_by(Book.id).limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        log_event(logger, logging.DEBUG, 'books_listed', count=len(rows), after=after, limit=limit)
+        if not rows and not after:
             return jsonify({'message': 'No books found'}), 200
-        
-        serialized_books = []
-        for book in books:
-            book_data = {
-                'id': book.id,
-                'title': book.title,
-                'author': book.author,
-                'isbn': book.isbn,
-                'available_copies': book.available_copies,
-                'image_url': book.image_url if book.image_url else None,
-                'genre': getattr(book, 'genre', None),
-                'publication_year': getattr(book, 'publication_year', None),
-                'description': getattr(book, 'description', None),
-                'borrow_records': [{
-                    'id': br.id,
-                    'user_id': br.user_id,
-                    'book_id': br.book_id,
-                    'borrow_date': br.borrow_date.isoformat() if br.borrow_date else None,
-                    'return_date': br.return_date.isoformat() if br.return_date else None
-                } for br in book.borrow_records] if book.borrow_records else [],
-                'reviews': [{
-                    'id': r.id,
-                    'user_id': r.user_id,
-                    'book_id': r.book_id,
-                    'rating': r.rating,
-                    'comment': r.comment,
-                    'user': r.user.username if r.user else 'Unknown',
-                    'created_at': getattr(r, 'created_at', datetime.utcnow()).isoformat()
-                } for r in book.reviews] if book.reviews else []
-            }
-            serialized_books.append(book_data)
-        
-        logging.debug(f"Serialized books: {serialized_books[:1]}")
-        return jsonify(serialized_books)
+
+        serialized_books = book_items(rows, projection, {name: BOOK_LIST_CHILDREN[name] for name in include})
+        return set_next_cursor(json_array_response(serialized_books), serialized_books[-1]['id'] if has_more else None)
     except Exception as e:
-        logging.error(f"Error in get_books: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='get_books', error=str(e))
         return jsonify({'message': 'Failed to load books', 'error': str(e)}), 500
 
+@bp.route('/api/books/lookup', methods=['POST'])
+@query_budget(3)
+def lookup_books_batch():
+    try:
+        data = request.get_json(silent=True) or {}
+        keys = [key for key in ('ids', 'isbns') if key in data]
+        if len(keys) != 1:
+            return jsonify({'message': 'Send either ids or isbns'}), 400
+        try:
+            values = read_lookup_keys(data[keys[0]], keys[0])
+            return jsonify({'results': lookup_books(values, keys[0])}), 200
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='lookup_books_batch', error=str(e))
+        return jsonify({'message': 'Failed to look up books', 'error': str(e)}), 500
+
+@bp.route('/api/books/search', methods=['GET'])
+@query_budget(3)
+def search():
+    try:
+        q = request.args.get('q', '').strip()
+        if not q:
+            return jsonify({'message': 'Search query is required'}), 400
+        try:
+            limit = int(request.args.get('limit', 20))
+            offset = int(request.args.get('offset', 0))
+            year = request.args.get('year', type=int)
+            year_from = request.args.get('year_from', year, type=int)
+            year_to = request.args.get('year_to', year, type=int)
+        except ValueError:
+            return jsonify({'message': 'limit and offset must be integers'}), 400
+        if limit < 1 or limit > 100 or offset < 0:
+            return jsonify({'message': 'limit must be between 1 and 100 and offset non-negative'}), 400
+
+        ranked = search_books(q, genre=request.args.get('genre'),
+                              year_from=year_from, year_to=year_to,
+                              limit=limit, offset=offset)
+        books = {book.id: book for book in Book.query.filter(Book.id.in_([id for id, _ in ranked]))}
+
+        results = []
+        for book_id, rank in ranked:
+            book = books.get(book_id)
+            if book:
+                results.append({
+                    'id': book.id,
+                    'title': book.title,
+                    'author': book.author,
+                    'isbn': book.isbn,
+                    'available_copies': book.available_copies,
+                    'image_url': book.image_url if book.image_url else None,
+                    'genre': book.genre,
+                    'publication_year': book.publication_year,
+                    'description': book.description,
+                    'rank': rank
+                })
+        return jsonify({'query': q, 'results': results})
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='search', error=str(e))
+        return jsonify({'message': 'Search failed', 'error': str(e)}), 500
 
 @bp.route('/api/books/<int:id>', methods=['GET'])
+@query_budget(4)
 @jwt_required(optional=True)
+@cached_response(lambda id: [book_scope(id)])
 def get_book(id):
     try:
-        book = Book.query.get_or_404(id)
-        book_data = {
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'isbn': book.isbn,
-            'available_copies': book.available_copies,
-            'image_url': book.image_url if book.image_url else None,
-            'genre': getattr(book, 'genre', None),
-            'publication_year': getattr(book, 'publication_year', None),
-            'description': getattr(book, 'description', None),
-            'reviews': [{
-                'id': r.id,
-                'user': r.user.username if r.user else 'Unknown',
-                'rating': r.rating,
-                'comment': r.comment,
-                'created_at': getattr(r, 'created_at', datetime.utcnow()).isoformat()
-            } for r in book.reviews] if book.reviews else []
-        }
+        try:
+            fields, include = parse_book_view(BOOK_DETAIL_CHILDREN, ('reviews',))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        projection = book_projection(fields, include)
+
+        row = db.session.execute(projection.select().where(Book.id == id)).first()
+        if row is None:
+            return jsonify({'message': 'Book not found'}), 404
+        book_data = book_items([row], projection, {name: BOOK_DETAIL_CHILDREN[name] for name in include})[0]
         return jsonify(book_data)
     except Exception as e:
-        logging.error(f"Error in get_book: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='get_book', error=str(e))
         return jsonify({'message': 'Failed to load book', 'error': str(e)}), 500
 
+# Longest list the recommendations endpoint returns
+MAX_RECOMMENDATIONS = 20
+
+@bp.route('/api/books/<int:id>/recommendations', methods=['GET'])
+@query_budget(2)
+def get_book_recommendations(id):
+    try:
+        limit = request.args.get('limit', 10, type=int)
+        if limit < 1 or limit > MAX_RECOMMENDATIONS:
+            return jsonify({'message': f'limit must be between 1 and {MAX_RECOMMENDATIONS}'}), 400
+
+        recommendations = recommendations_for(id, limit)
+        # Only an empty list needs telling apart from a missing book
+        if not recommendations and db.session.get(Book, id) is None:
+            return jsonify({'message': 'Book not found'}), 404
+        return jsonify({'book_id': id, 'recommendations': recommendations})
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='get_book_recommendations', error=str(e))
+        return jsonify({'message': 'Failed to load recommendations', 'error': str(e)}), 500
+
+# Seconds between keep-alive comments on an idle event stream
+EVENTS_HEARTBEAT = 15
+
+def read_event_books():
+    """The book IDs in ?books=, raising ValueError."""
+    try:
+        book_ids = {int(value) for value in request.args.get('books', '').split(',') if value.strip()}
+    except ValueError:
+        raise ValueError('books must be a comma-separated list of book IDs')
+    if not book_ids:
+        raise ValueError('books is required')
+    if len(book_ids) > MAX_LOOKUP_SIZE:
+        raise ValueError(f'At most {MAX_LOOKUP_SIZE} books can be watched at once')
+    return book_ids
+
+def read_last_event_id():
+    """The Last-Event-ID the browser resends on reconnect (or ?last_event_id=), or None."""
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError('Last-Event-ID must be an event ID')
+
+@bp.route('/api/events', methods=['GET'])
+@query_budget(3)
+def book_events():
+    """Server-sent events for the books in ?books=1,2,3 (see app/events.py).
+
+    A reconnecting client that sends Last-Event-ID gets what it missed
+    first; if that is older than the events still kept, a `reset` event
+    tells it to refetch instead.
+
+    Each open stream holds a server thread until the page closes, so the
+    app has to run on threaded workers (gthread in gunicorn.conf.py, with
+    WEB_THREADS per worker); a sync worker would serve nothing else.
+    """
+    try:
+        try:
+            book_ids = read_event_books()
+            last_event_id = read_last_event_id()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+
+        subscription = event_hub.subscribe(current_app._get_current_object(), book_ids)
+        missed = []
+        try:
+            if last_event_id is not None and last_event_id < subscription.start_id:
+                oldest = oldest_event_id()
+                if oldest is None or oldest > last_event_id + 1:
+                    missed.append('event: reset\ndata: {}\n\n')
+                else:
+                    missed.extend(format_event(event_id, event_type, data) for event_id, _, event_type, data in
+                                  read_events(last_event_id, subscription.start_id, subscription.book_ids))
+        except Exception:
+            event_hub.unsubscribe(subscription)
+            raise
+
+        def stream():
+            yield 'retry: 3000\n\n'
+            yield from missed
+            while not subscription.overflowed:
+                try:
+                    yield subscription.messages.get(timeout=EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+            # Fell too far behind: end the stream and let the browser
+            # reconnect and catch up with Last-Event-ID
+
+        response = Response(stream(), mimetype='text/event-stream')
+        # Runs however the stream ends, including before it started
+        response.call_on_close(lambda: event_hub.unsubscribe(subscription))
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='book_events', error=str(e))
+        return jsonify({'message': 'Failed to open event stream', 'error': str(e)}), 500
+
 @bp.route('/api/login', methods=['POST'])
+@query_budget(3)
 def login():
     try:
         data = request.get_json()
@@ -96,16 +400,28 @@ def login():
         if not user:
             return jsonify({'message': 'Invalid credentials'}), 401
         
-        # Check password - handle both string and bytes password hash
-        password_to_check = data.get('password', '').encode('utf-8')
-        stored_password = user.password_hash
-        if isinstance(stored_password, str):
-            stored_password = stored_password.encode('utf-8')
-        
-        if bcrypt.checkpw(password_to_check, stored_password):
+        # Check password off the request thread; refuse quickly when the pool is full
+        try:
+            password_ok = check_password(data.get('password', ''), user.password_hash)
+            if password_ok and needs_rehash(user.password_hash):
+                # Work factor changed since this hash was made: upgrade it transparently
+                password_hash = hash_password(data.get('password', ''))
+                user_id = user.id
+                run_with_retry(lambda: User.query.filter_by(id=user_id).update(
+                    {User.password_hash: password_hash}, synchronize_session=False))
+        except HashingBusy:
+            return busy_response()
+        except DatabaseBusy:
+            # The old hash still works; upgrade it on a later login
+            pass
+        
+        if password_ok:
+            if user.is_active is False:
+                return jsonify({'message': 'This account has been deactivated'}), 403
             # Create token that expires in 24 hours
             access_token = create_access_token(
                 identity={'id': user.id, 'email': user.email},
+                additional_claims=token_claims(user),
                 expires_delta=timedelta(hours=24)
             )
             return jsonify({
@@ -120,10 +436,11 @@ def login():
         else:
             return jsonify({'message': 'Invalid credentials'}), 401
     except Exception as e:
-        logging.error(f"Error in login: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='login', error=str(e))
         return jsonify({'message': 'Login failed', 'error': str(e)}), 500
 
 @bp.route('/api/signup', methods=['POST'])
+@query_budget(3)
 def signup():
     try:
         data = request.get_json()
@@ -145,25 +462,32 @@ def signup():
             return jsonify({'message': 'Username already taken'}), 400
 
         # Hash password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        try:
+            hashed_password = hash_password(password)
+        except HashingBusy:
+            return busy_response()
         
         # Create user
-        user = User(
-            email=email, 
-            username=username,
-            password_hash=hashed_password,
-            role='user'
-        )
-        db.session.add(user)
-        db.session.commit()
+        def create_user():
+            db.session.add(User(
+                email=email, 
+                username=username,
+                password_hash=hashed_password,
+                role='user'
+            ))
+        try:
+            run_with_retry(create_user)
+        except DatabaseBusy:
+            return busy_response()
         
         return jsonify({'message': 'User created successfully'}), 201
     except Exception as e:
-        logging.error(f"Error in signup: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='signup', error=str(e))
         db.session.rollback()
         return jsonify({'message': 'Signup failed', 'error': str(e)}), 500
 
 @bp.route('/api/borrow', methods=['POST'])
+@query_budget(8)
 @jwt_required()
 def borrow_book():
     try:
@@ -175,93 +499,126 @@ def borrow_book():
         user_identity = get_jwt_identity()
         user_id = user_identity['id']
 
-        # Check if book exists
-        book = Book.query.get(book_id)
-        if not book:
-            return jsonify({'message': 'Book not found'}), 404
-        
-        # Check if copies are available
-        if book.available_copies <= 0:
-            return jsonify({'message': 'No copies available'}), 400
-        
-        # Check if user already has an active borrow record for this book
-        existing_borrow = BorrowRecord.query.filter_by(
-            user_id=user_id, 
-            book_id=book_id, 
-            return_date=None
-        ).first()
-        
-        if existing_borrow:
-            return jsonify({'message': 'You have already borrowed this book'}), 400
-
-        # Create borrow record
-        borrow_record = BorrowRecord(
-            user_id=user_id, 
-            book_id=book_id, 
-            borrow_date=datetime.utcnow()
-        )
-        
-        # Update available copies
-        book.available_copies -= 1
-        
-        db.session.add(borrow_record)
-        db.session.commit()
+        try:
+            borrow_record = run_with_retry(lambda: serialize_borrow_record(checkout(user_id, book_id)))
+        except CirculationError as e:
+            return jsonify({'message': e.message}), e.status_code
+        except DatabaseBusy:
+            return busy_response()
+        event_hub.notify()
         
         return jsonify({
             'message': 'Book borrowed successfully', 
-            'borrow_record': {
-                'id': borrow_record.id,
-                'user_id': borrow_record.user_id,
-                'book_id': borrow_record.book_id,
-                'borrow_date': borrow_record.borrow_date.isoformat(),
-                'return_date': None
-            }
+            'borrow_record': borrow_record
         }), 201
     except Exception as e:
-        logging.error(f"Error in borrow_book: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='borrow_book', error=str(e))
         db.session.rollback()
         return jsonify({'message': 'Failed to borrow book', 'error': str(e)}), 500
 
 @bp.route('/api/borrow/<int:id>', methods=['PUT'])
+@query_budget(7)
 @jwt_required()
 def return_book(id):
     try:
         user_identity = get_jwt_identity()
         user_id = user_identity['id']
         
-        borrow_record = BorrowRecord.query.get(id)
-        if not borrow_record:
-            return jsonify({'message': 'Borrow record not found'}), 404
-        
-        # Check if the user owns this borrow record
-        if borrow_record.user_id != user_id:
-            return jsonify({'message': 'Unauthorized'}), 403
-        
-        if borrow_record.return_date:
-            return jsonify({'message': 'Book already returned'}), 400
-        
-        # Return the book
-        borrow_record.return_date = datetime.utcnow()
-        borrow_record.book.available_copies += 1
-        
-        db.session.commit()
+        try:
+            borrow_record = run_with_retry(lambda: serialize_borrow_record(checkin(user_id, id)))
+        except CirculationError as e:
+            return jsonify({'message': e.message}), e.status_code
+        except DatabaseBusy:
+            return busy_response()
+        event_hub.notify()
         
         return jsonify({
             'message': 'Book returned successfully', 
-            'borrow_record': {
-                'id': borrow_record.id,
-                'user_id': borrow_record.user_id,
-                'book_id': borrow_record.book_id,
-                'borrow_date': borrow_record.borrow_date.isoformat() if borrow_record.borrow_date else None,
-                'return_date': borrow_record.return_date.isoformat() if borrow_record.return_date else None
-            }
+            'borrow_record': borrow_record
         }), 200
     except Exception as e:
-        logging.error(f"Error in return_book: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='return_book', error=str(e))
         db.session.rollback()
         return jsonify({'message': 'Failed to return book', 'error': str(e)}), 500
 
+def process_batch(ids, key, action):
+    """Apply `action` to every ID inside one transaction and collect per-item results.
+
+    Each item runs in a savepoint, so a refused one is reported and skipped
+    without undoing the others; that includes one refused at flush time by
+    a racing duplicate, after its copy was already taken.
+    """
+    results = []
+    for item_id in ids:
+        savepoint = db.session.begin_nested()
+        try:
+            borrow_record = action(item_id)
+        except CirculationError as e:
+            savepoint.rollback()
+            results.append({key: item_id, 'status': 'error', 'code': e.status_code, 'message': e.message})
+            continue
+        savepoint.commit()
+        results.append({key: item_id, 'status': 'ok', 'borrow_record': serialize_borrow_record(borrow_record)})
+    return results
+
+@bp.route('/api/borrow/batch', methods=['POST'])
+@query_budget(BATCH_QUERY_BUDGET, per_item=True)
+@jwt_required()
+def borrow_books_batch():
+    try:
+        try:
+            book_ids = read_batch(request.get_json(), 'book_ids')
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        user_id = get_jwt_identity()['id']
+
+        try:
+            results = run_with_retry(lambda: process_batch(
+                book_ids, 'book_id', lambda book_id: checkout(user_id, book_id)))
+        except DatabaseBusy:
+            return busy_response()
+        event_hub.notify()
+
+        borrowed = sum(1 for result in results if result['status'] == 'ok')
+        return jsonify({
+            'message': f'Borrowed {borrowed} of {len(results)} books',
+            'results': results
+        }), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='borrow_books_batch', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to borrow books', 'error': str(e)}), 500
+
+@bp.route('/api/borrow/batch', methods=['PUT'])
+@query_budget(BATCH_QUERY_BUDGET, per_item=True)
+@jwt_required()
+def return_books_batch():
+    try:
+        try:
+            borrow_ids = read_batch(request.get_json(), 'borrow_ids')
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        user_id = get_jwt_identity()['id']
+
+        try:
+            results = run_with_retry(lambda: process_batch(
+                borrow_ids, 'borrow_id', lambda borrow_id: checkin(user_id, borrow_id)))
+        except DatabaseBusy:
+            return busy_response()
+        event_hub.notify()
+
+        returned = sum(1 for result in results if result['status'] == 'ok')
+        return jsonify({
+            'message': f'Returned {returned} of {len(results)} books',
+            'results': results
+        }), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='return_books_batch', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to return books', 'error': str(e)}), 500
+
 @bp.route('/api/reviews', methods=['POST'])
+@query_budget(9)
 @jwt_required()
 def add_review(): 
     try:
@@ -280,7 +637,7 @@ def add_review():
             return jsonify({'message': 'Rating must be an integer between 1 and 5'}), 400
         
         # Check if book exists
-        book = Book.query.get(book_id)
+        book = db.session.get(Book, book_id)
         if not book:
             return jsonify({'message': 'Book not found'}), 404
         
@@ -290,19 +647,20 @@ def add_review():
             return jsonify({'message': 'You have already reviewed this book'}), 400
         
         # Create review
-        review = Review(
-            user_id=user_id, 
-            book_id=book_id, 
-            rating=rating, 
-            comment=comment
-        )
-        
-        db.session.add(review)
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'Review added successfully', 
-            'review': {
+        def create_review():
+            review = Review(
+                user_id=user_id, 
+                book_id=book_id, 
+                rating=rating, 
+                comment=comment
+            )
+            db.session.add(review)
+            record_rating(book_id, rating)
+            bump_versions(book_id)
+            db.session.flush()
+            record_review(review)
+            count_review(book_id, review.created_at, rating)
+            return {
                 'id': review.id,
                 'user_id': review.user_id,
                 'book_id': review.book_id,
@@ -311,91 +669,335 @@ def add_review():
                 'user': review.user.username if review.user else 'Unknown',
                 'created_at': getattr(review, 'created_at', datetime.utcnow()).isoformat()
             }
+        try:
+            review = run_with_retry(create_review)
+        except DatabaseBusy:
+            return busy_response()
+        event_hub.notify()
+        
+        return jsonify({
+            'message': 'Review added successfully', 
+            'review': review
         }), 201
     except Exception as e:
-        logging.error(f"Error in add_review: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='add_review', error=str(e))
         db.session.rollback()
         return jsonify({'message': 'Failed to add review', 'error': str(e)}), 500
 
 @bp.route('/api/profile', methods=['GET'])
+@query_budget(3)
 @jwt_required()
 def get_profile():
     try:
         identity = get_jwt_identity()
-        logging.debug(f"JWT Identity: {identity}")
         user_id = identity.get('id')
         if not user_id:
             return jsonify({'message': 'Invalid token: missing user ID'}), 422
         
-        user = User.query.get(user_id)
+        user = profile(user_id)
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        # Get user's borrow records with book details
-        borrow_records = []
-        for br in user.borrow_records:
-            borrow_data = {
-                'id': br.id,
-                'user_id': br.user_id,
-                'book_id': br.book_id,
-                'book_title': br.book.title if br.book else 'Unknown',
-                'book_author': br.book.author if br.book else 'Unknown',
-                'borrow_date': br.borrow_date.isoformat() if br.borrow_date else None,
-                'return_date': br.return_date.isoformat() if br.return_date else None,
-                'is_active': br.return_date is None
-            }
-            borrow_records.append(borrow_data)
-        
-        # Get user's reviews with book details
-        reviews = []
-        for r in user.reviews:
-            review_data = {
-                'id': r.id,
-                'user_id': r.user_id,
-                'book_id': r.book_id,
-                'book_title': r.book.title if r.book else 'Unknown',
-                'rating': r.rating,
-                'comment': r.comment,
-                'created_at': getattr(r, 'created_at', datetime.utcnow()).isoformat()
-            }
-            reviews.append(review_data)
-        
-        return jsonify({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'role': user.role,
-            'borrow_records': borrow_records,
-            'reviews': reviews
-        })
+        return jsonify(user)
     except Exception as e:
-        logging.error(f"Error in get_profile: {str(e)}")
+        log_event(logger, logging.ERROR, 'request_failed', route='get_profile', error=str(e))
         return jsonify({'message': 'Error fetching profile', 'error': str(e)}), 500
 
 @bp.route('/api/user/borrowed-books', methods=['GET'])
+@query_budget(2)
 @jwt_required()
 def get_user_borrowed_books():
     try:
         user_identity = get_jwt_identity()
         user_id = user_identity['id']
         
-        # Get active borrow records (not returned yet)
-        active_borrows = BorrowRecord.query.filter_by(user_id=user_id, return_date=None).all()
-        
-        borrowed_books = []
-        for borrow in active_borrows:
-            if borrow.book:
-                book_data = {
-                    'borrow_id': borrow.id,
-                    'book_id': borrow.book.id,
-                    'title': borrow.book.title,
-                    'author': borrow.book.author,
-                    'borrow_date': borrow.borrow_date.isoformat() if borrow.borrow_date else None,
-                    'image_url': borrow.book.image_url
-                }
-                borrowed_books.append(book_data)
-        
-        return jsonify({'borrowed_books': borrowed_books}), 200
+        # Active borrow records (not returned yet) with their books' details
+        return jsonify({'borrowed_books': borrowed_books(user_id)}), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='get_user_borrowed_books', error=str(e))
+        return jsonify({'message': 'Error fetching borrowed books', 'error': str(e)}), 500
+
+def inventory_books(book_ids):
+    """Full dicts for the given books, in the order given (after an inventory write)."""
+    books = books_by(book_projection(tuple(sorted(BOOK_FIELDS)), ()), {}, Book.id, book_ids)
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+def inventory_error_response(e):
+    return jsonify({'message': e.message, 'errors': e.errors}), e.status_code
+
+@bp.route('/api/books', methods=['POST'])
+@query_budget(6)
+@admin_required
+def add_book():
+    try:
+        data = request.get_json(silent=True)
+        try:
+            book_ids = run_with_retry(lambda: create_books([data]))
+        except InventoryError as e:
+            return inventory_error_response(e)
+        except DatabaseBusy:
+            return busy_response()
+        return jsonify(inventory_books(book_ids)[0]), 201
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='add_book', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to add book', 'error': str(e)}), 500
+
+@bp.route('/api/books/<int:id>', methods=['PUT'])
+@query_budget(7)
+@admin_required
+def update_book(id):
+    try:
+        data = request.get_json(silent=True) or {}
+        # The client sends the whole book back; only the editable fields and
+        # the version it was read at matter here
+        change = {key: value for key, value in data.items() if key in PATCH_FIELDS}
+        change.update(id=id, version=data.get('version'))
+
+        def apply():
+            # Keep only the fields the librarian actually changed. Copy
+            # counts sent back as they were read would undo loans made since
+            # (borrows don't bump the version), and values stored before
+            # validation existed, like seed ISBNs, would be refused
+            fields = [field for field in PATCH_FIELDS if field in change]
+            stored = db.session.execute(
+                db.select(Book.id, *[getattr(Book, field) for field in fields])
+                .where(Book.id == id)).first()
+            if stored is None:
+                return patch_books([change])
+            for field, value in zip(fields, stored[1:]):
+                if change[field] == value:
+                    del change[field]
+            if set(change) <= {'id', 'version'}:
+                return {}
+            return patch_books([change])
+
+        try:
+            changed = run_with_retry(apply)
+        except InventoryError as e:
+            return inventory_error_response(e)
+        except DatabaseBusy:
+            return busy_response()
+        if changed:
+            event_hub.notify()
+        return jsonify(inventory_books([id])[0]), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='update_book', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to update book', 'error': str(e)}), 500
+
+@bp.route('/api/books/<int:id>', methods=['DELETE'])
+@query_budget(8)
+@admin_required
+def delete_book(id):
+    try:
+        version = request.args.get('version', type=int)
+        if version is None:
+            version = (request.get_json(silent=True) or {}).get('version')
+        try:
+            run_with_retry(lambda: delete_books([{'id': id, 'version': version}]))
+        except InventoryError as e:
+            return inventory_error_response(e)
+        except DatabaseBusy:
+            return busy_response()
+        return jsonify({'message': 'Book deleted successfully'}), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='delete_book', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to delete book', 'error': str(e)}), 500
+
+# The bulk inventory endpoints take {"books": [...]} and apply the whole
+# list in one transaction with a fixed number of statements: either every
+# book is changed or, with the reasons in "errors", none is.
+
+@bp.route('/api/admin/books', methods=['POST'])
+@query_budget(6)
+@admin_required
+def add_books_bulk():
+    try:
+        books = (request.get_json(silent=True) or {}).get('books')
+        try:
+            book_ids = run_with_retry(lambda: create_books(books))
+        except InventoryError as e:
+            return inventory_error_response(e)
+        except DatabaseBusy:
+            return busy_response()
+        return jsonify({'message': f'Added {len(book_ids)} books', 'books': inventory_books(book_ids)}), 201
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='add_books_bulk', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to add books', 'error': str(e)}), 500
+
+@bp.route('/api/admin/books', methods=['PATCH'])
+@query_budget(7)
+@admin_required
+def update_books_bulk():
+    try:
+        changes = (request.get_json(silent=True) or {}).get('books')
+        try:
+            versions = run_with_retry(lambda: patch_books(changes))
+        except InventoryError as e:
+            return inventory_error_response(e)
+        except DatabaseBusy:
+            return busy_response()
+        event_hub.notify()
+        return jsonify({'message': f'Updated {len(versions)} books',
+                        'books': inventory_books([change['id'] for change in changes])}), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='update_books_bulk', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to update books', 'error': str(e)}), 500
+
+@bp.route('/api/admin/books', methods=['DELETE'])
+@query_budget(8)
+@admin_required
+def delete_books_bulk():
+    try:
+        books = (request.get_json(silent=True) or {}).get('books')
+        try:
+            deleted = run_with_retry(lambda: delete_books(books))
+        except InventoryError as e:
+            return inventory_error_response(e)
+        except DatabaseBusy:
+            return busy_response()
+        return jsonify({'message': f'Deleted {len(deleted)} books', 'deleted': deleted}), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='delete_books_bulk', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Failed to delete books', 'error': str(e)}), 500
+
+@bp.route('/api/admin/books/import', methods=['POST'])
+@query_budget(4, per_item=True)
+@admin_required
+def import_books_upload():
+    try:
+        # Either a multipart upload under 'file' or the raw body; both are
+        # read as a stream so large files never sit in memory.
+        upload = request.files.get('file')
+        if upload:
+            stream, filename = upload.stream, upload.filename
+        else:
+            stream, filename = request.stream, None
+        fmt = request.args.get('format') or detect_format(filename) or {
+            'text/csv': 'csv',
+            'application/x-ndjson': 'jsonl',
+            'application/jsonl': 'jsonl'
+        }.get(request.mimetype)
+        if fmt not in ('csv', 'jsonl'):
+            return jsonify({'message': 'Format must be csv or jsonl'}), 400
+
+        chunk_size = request.args.get('chunk_size', 1000, type=int)
+        # The budget covers the first chunk; the ones after it repeat the
+        # same statements for the next rows, so they are left out of it
+        with ExitStack() as later_chunks:
+            def after_chunk(stats):
+                if not counted_chunk:
+                    counted_chunk.append(True)
+                    later_chunks.enter_context(outside_budget())
+            counted_chunk = []
+            try:
+                stats = import_books(text_stream(stream), fmt, chunk_size=max(chunk_size, 1), on_chunk=after_chunk)
+            except DatabaseBusy:
+                return busy_response()
+        event_hub.notify()
+        return jsonify({'message': 'Import finished', **stats}), 200
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='import_books_upload', error=str(e))
+        db.session.rollback()
+        return jsonify({'message': 'Import failed', 'error': str(e)}), 500
+
+@bp.route('/api/admin/export/<name>', methods=['GET'])
+@admin_required
+def export_table(name):
+    try:
+        if name not in EXPORTS:
+            return jsonify({'message': f"Unknown export, expected one of {', '.join(EXPORTS)}"}), 404
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in FORMATS:
+            return jsonify({'message': 'Format must be ndjson or csv'}), 400
+        try:
+            since = parse_timestamp(request.args.get('since'))
+            until = parse_timestamp(request.args.get('until'))
+        except ValueError:
+            return jsonify({'message': 'since and until must be ISO dates'}), 400
+
+        # Rows go out as they are read; nothing is built up in memory
+        response = Response(stream_with_context(iter_export(name, fmt, since, until)), mimetype=FORMATS[fmt])
+        extension = 'csv' if fmt == 'csv' else 'ndjson'
+        response.headers['Content-Disposition'] = f'attachment; filename={name}.{extension}'
+        return response
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='export_table', error=str(e))
+        return jsonify({'message': 'Export failed', 'error': str(e)}), 500
+
+# Rows in a ranked analytics list when ?limit= is not given
+DEFAULT_ANALYTICS_LIMIT = 10
+
+def parse_analytics_args():
+    """Read ?from=, ?to= and ?limit= for the analytics endpoints, raising ValueError on bad input."""
+    try:
+        start, end = (date.fromisoformat(request.args[key]) if request.args.get(key) else None
+                      for key in ('from', 'to'))
+    except ValueError:
+        raise ValueError('from and to must be dates like 2026-01-31')
+    start, end = analytics_window(start, end)
+    try:
+        limit = int(request.args.get('limit', DEFAULT_ANALYTICS_LIMIT))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1 or limit > MAX_ANALYTICS_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_ANALYTICS_LIMIT}')
+    return start, end, limit
+
+@bp.route('/api/admin/analytics/borrows', methods=['GET'])
+@query_budget(1)
+@admin_required
+def analytics_borrows():
+    try:
+        try:
+            start, end, limit = parse_analytics_args()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        by = request.args.get('by', 'day')
+        if by == 'day':
+            rows = borrows_by_day(start, end)
+        elif by == 'genre':
+            rows = borrows_by_genre(start, end)
+        elif by == 'author':
+            rows = borrows_by_author(start, end, limit)
+        else:
+            return jsonify({'message': 'by must be day, genre or author'}), 400
+        return jsonify({'from': start.isoformat(), 'to': end.isoformat(), 'by': by, 'rows': rows})
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='analytics_borrows', error=str(e))
+        return jsonify({'message': 'Failed to load borrow statistics', 'error': str(e)}), 500
+
+@bp.route('/api/admin/analytics/top-borrowed', methods=['GET'])
+@query_budget(1)
+@admin_required
+def analytics_top_borrowed():
+    try:
+        try:
+            start, end, limit = parse_analytics_args()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        return jsonify({'from': start.isoformat(), 'to': end.isoformat(), 'books': top_borrowed(start, end, limit)})
+    except Exception as e:
+        log_event(logger, logging.ERROR, 'request_failed', route='analytics_top_borrowed', error=str(e))
+        return jsonify({'message': 'Failed to load most borrowed books', 'error': str(e)}), 500
+
+@bp.route('/api/admin/analytics/top-rated', methods=['GET'])
+@query_budget(1)
+@admin_required
+def analytics_top_rated():
+    try:
+        try:
+            start, end, limit = parse_analytics_args()
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        min_reviews = request.args.get('min_reviews', 1, type=int)
+        return jsonify({'from': start.isoformat(), 'to': end.isoformat(),
+                        'books': top_rated(start, end, limit, min_reviews)})
     except Exception as e:
-        logging.error(f"Error in get_user_borrowed_books: {str(e)}")
-        return jsonify({'message': 'Error fetching borrowed books', 'error': str(e)}), 500
\ No newline at end of file
+        log_event(logger, logging.ERROR, 'request_failed', route='analytics_top_rated', error=str(e))
+        return jsonify({'message': 'Failed to load highest rated books', 'error': str(e)}), 500
@@ -0,0 +1,60 @@
+import re
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from app import db
+
+# External-content FTS5 index over the searchable book columns. The index
+# stores only the token data; rows are read back from `books` by rowid.
+# The table and its sync triggers are created by the migrations.
+FTS_TABLE = 'books_fts'
+
+# bm25 column weights: title, author, description, genre
+RANK_EXPRESSION = 'bm25(books_fts, 10.0, 5.0, 1.0, 2.0)'
+
+
+def build_match_query(q):
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Words are quoted so user input can never inject FTS5 operators.
+    """
+    terms = re.findall(r'\w+', q or '', re.UNICODE)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_books(q, genre=None, year_from=None, year_to=None, limit=20, offset=0):
+    """Return a list of (book_id, rank) pairs, best match first."""
+    match = build_match_query(q)
+    if not match:
+        return []
+
+    sql = (f"SELECT books.id, {RANK_EXPRESSION} AS rank "
+           "FROM books_fts JOIN books ON books.id = books_fts.rowid "
+           "WHERE books_fts MATCH :match")
+    params = {'match': match, 'limit': limit, 'offset': offset}
+    if genre:
+        sql += " AND books.genre = :genre"
+        params['genre'] = genre
+    if year_from is not None:
+        sql += " AND books.publication_year >= :year_from"
+        params['year_from'] = year_from
+    if year_to is not None:
+        sql += " AND books.publication_year <= :year_to"
+        params['year_to'] = year_to
+    sql += " ORDER BY rank LIMIT :limit OFFSET :offset"
+
+    return [(row.id, row.rank) for row in db.session.execute(text(sql), params)]
+
+
+def rebuild_search_index():
+    """Re-read every row of `books` into the index."""
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+@click.command('search-reindex')
+@with_appcontext
+def reindex_command():
+    """Rebuild the full-text search index over books."""
+    rebuild_search_index()
+    click.echo('Search index rebuilt.')
@@ -0,0 +1,264 @@
+"""SQLite storage profile and the serialised commit path.
+
+SQLITE_PROFILE picks the pragmas every new connection runs and the
+connection pool settings; SQLITE_PRAGMAS overrides single pragmas on top
+of it. The default 'wal' profile lets readers keep reading while a write
+commits, which the stock rollback journal does not:
+
+    wal          WAL journal, synchronous=NORMAL (a power cut can lose the
+                 last commits, never corrupt the file), 256 MiB mmap,
+                 32 MiB page cache per connection
+    wal-durable  the same with synchronous=FULL
+    rollback     SQLite's defaults, for filesystems without shared memory
+
+Every write should go through run_with_retry(). Writers in one process
+take turns, and each write transaction opens with BEGIN IMMEDIATE, so it
+owns SQLite's write lock from its first statement instead of failing
+halfway when another process wrote first. Busy errors roll back and retry
+with jittered exponential backoff, WRITE_RETRY_ATTEMPTS times at most.
+
+With WRITE_GROUP_COMMIT on, writes that queue up while another is
+committing are run together by whichever thread gets the lock next, each
+in its own savepoint, and share one commit. Their `work` then runs on
+that thread's session, so it must return plain data rather than ORM
+objects (the circulation routes already do).
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DisconnectionError, OperationalError
+from app import db
+
+MIB = 1024 * 1024
+
+STORAGE_PROFILES = {
+    'wal': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 2000,
+            'mmap_size': 256 * MIB,
+            'cache_size': -32 * 1024,  # negative: KiB rather than pages
+            'temp_store': 'MEMORY',
+        },
+        # Connections are cheap, but each keeps its own page cache warm
+        'pool': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10},
+    },
+    'wal-durable': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'FULL',
+            'busy_timeout': 2000,
+            'mmap_size': 256 * MIB,
+            'cache_size': -32 * 1024,
+            'temp_store': 'MEMORY',
+        },
+        'pool': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10},
+    },
+    'rollback': {
+        'pragmas': {'busy_timeout': 5000},
+        'pool': {},
+    },
+}
+
+# Execution option marking a transaction that will write
+IMMEDIATE = 'sqlite_begin_immediate'
+
+
+class DatabaseBusy(Exception):
+    """SQLite stayed busy/locked for every retry attempt."""
+
+
+def is_busy_error(error):
+    """True for SQLite's locked/busy errors, wrapped by SQLAlchemy or not.
+
+    The BEGIN IMMEDIATE in on_begin goes straight to the driver, outside
+    SQLAlchemy's exception wrapping, so its lock timeout arrives as a bare
+    sqlite3.OperationalError.
+    """
+    if not isinstance(error, (OperationalError, sqlite3.OperationalError)):
+        return False
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def is_memory_database(uri):
+    database = make_url(uri).database
+    return not database or database == ':memory:' or 'mode=memory' in uri
+
+
+def storage_profile(config):
+    name = config['SQLITE_PROFILE']
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown SQLITE_PROFILE {name!r}, expected one of {', '.join(STORAGE_PROFILES)}")
+    profile = STORAGE_PROFILES[name]
+    return dict(profile['pragmas'], **config.get('SQLITE_PRAGMAS', {})), profile['pool']
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS with the profile's pool settings filled in; call before db.init_app."""
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if not is_memory_database(config['SQLALCHEMY_DATABASE_URI']):
+        _, pool = storage_profile(config)
+        for name, value in pool.items():
+            options.setdefault(name, value)
+    return options
+
+
+def install_storage_profile(engine, config):
+    """Run the profile's pragmas on every new connection and let transactions begin IMMEDIATE.
+
+    Also keeps a forked worker from using connections its parent opened.
+    """
+    pragmas, _ = storage_profile(config)
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+        # Leave BEGIN to the 'begin' hook below instead of the sqlite3 module
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        # A connection opened before a fork (e.g. by a preloading parent)
+        # belongs to the parent; make the pool open a new one instead
+        if connection_record.info['pid'] != os.getpid():
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise DisconnectionError('Connection was opened by another process')
+
+    @event.listens_for(engine, 'begin')
+    def on_begin(connection):
+        # Straight to the driver, so it isn't counted as one of the request's statements
+        statement = 'BEGIN IMMEDIATE' if connection.get_execution_options().get(IMMEDIATE) else 'BEGIN'
+        connection.connection.driver_connection.execute(statement)
+
+
+def begin_write():
+    """Start the session's transaction as a writer.
+
+    A transaction already open at this point was started by the caller's
+    own reads (a route checking the book exists, say) with a plain BEGIN,
+    and would only take the write lock at its first write; it is rolled
+    back first, so changes belong in `work` rather than before it.
+    """
+    if db.session().in_transaction():
+        db.session.rollback()
+    db.session.connection(execution_options={IMMEDIATE: True})
+
+
+class CommitPath:
+    """One writer at a time per process, optionally committing queued writes together."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.pending_lock = threading.Lock()
+
+    def run(self, work, attempts, base_delay, group_size):
+        if group_size <= 1:
+            with self.lock:
+                return self.run_group([work], attempts, base_delay)[0].result()
+
+        item = PendingWrite(work, current_app._get_current_object())
+        with self.pending_lock:
+            self.pending.append(item)
+        with self.lock:
+            # Unless an earlier holder of the lock already ran it, run this
+            # write along with whatever else has queued up since
+            while not item.done:
+                group = self.take_group(item.app, group_size)
+                outcomes = self.run_group([pending.work for pending in group], attempts, base_delay)
+                for pending, outcome in zip(group, outcomes):
+                    pending.outcome = outcome
+                    pending.done = True
+        return item.outcome.result()
+
+    def take_group(self, app, size):
+        """Up to `size` queued writes for `app`, oldest first."""
+        with self.pending_lock:
+            group = [item for item in self.pending if item.app is app][:size]
+            for item in group:
+                self.pending.remove(item)
+        return group
+
+    def run_group(self, works, attempts, base_delay):
+        """Run `works` in one transaction and commit; returns an Outcome for each, never raising."""
+        for attempt in range(attempts):
+            try:
+                begin_write()
+                if len(works) == 1:
+                    outcomes = [Outcome(value=works[0]())]
+                else:
+                    outcomes = [self.run_nested(work) for work in works]
+                db.session.commit()
+                return outcomes
+            except Exception as e:
+                db.session.rollback()
+                if not is_busy_error(e):
+                    return [Outcome(error=e) for _ in works]
+                # Exponential backoff with jitter so retrying workers spread out
+                time.sleep(base_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+        return [Outcome(error=DatabaseBusy()) for _ in works]
+
+    @staticmethod
+    def run_nested(work):
+        """Run one write of a group in a savepoint, so a refused one leaves nothing behind."""
+        savepoint = db.session.begin_nested()
+        try:
+            value = work()
+        except (OperationalError, sqlite3.OperationalError) as e:
+            if is_busy_error(e):
+                raise  # the whole group retries
+            savepoint.rollback()
+            return Outcome(error=e)
+        except Exception as e:
+            savepoint.rollback()
+            return Outcome(error=e)
+        savepoint.commit()
+        return Outcome(value=value)
+
+
+class PendingWrite:
+    def __init__(self, work, app):
+        self.work = work
+        self.app = app
+        self.done = False
+        self.outcome = None
+
+
+class Outcome:
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+commit_path = CommitPath()
+
+
+def run_with_retry(work, attempts=None, base_delay=None):
+    """Run `work()` as a write transaction and commit it, retrying the whole transaction on busy errors.
+
+    Any other exception rolls back and propagates unchanged. Raises
+    DatabaseBusy once all attempts have hit a locked database.
+    """
+    config = current_app.config
+    group_size = config['WRITE_GROUP_MAX'] if config['WRITE_GROUP_COMMIT'] else 1
+    return commit_path.run(work,
+                           attempts or config['WRITE_RETRY_ATTEMPTS'],
+                           base_delay if base_delay is not None else config['WRITE_RETRY_BASE_DELAY'],
+                           group_size)
@@ -0,0 +1,113 @@
+"""Dashboard query benchmark: analytics rollups against GROUP BY on raw rows.
+
+Runs each analytics question (borrows per day, genre and author, most
+borrowed and best rated books) over a 30-day and a 365-day window, once
+through app/analytics.py and once as the equivalent GROUP BY over
+borrow_records and reviews, and reports the median time of each:
+
+    python -m benchmarks.dataset --database /tmp/big.db --loans 5000000
+    python -m benchmarks.analytics --database /tmp/big.db
+
+Without --database a small dataset is generated first. The raw queries
+only count borrows, not returns, so they do less work than the rollups.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from sqlalchemy import text
+from app import db
+from app.analytics import (rebuild_analytics, borrows_by_day, borrows_by_genre, borrows_by_author, top_borrowed,
+                           top_rated)
+from app.models import BorrowRecord
+from benchmarks.common import make_app, migrate_database, run_metadata, write_results
+from benchmarks.dataset import Generator
+
+LIMIT = 10
+
+RAW_SQL = {
+    'by_day': """
+        SELECT date(borrow_date) AS day, COUNT(*) FROM borrow_records
+        WHERE borrow_date >= :start AND borrow_date < :stop GROUP BY day ORDER BY day""",
+    'by_genre': """
+        SELECT COALESCE(b.genre, '') AS genre, COUNT(*) AS borrows
+        FROM borrow_records AS r JOIN books AS b ON b.id = r.book_id
+        WHERE r.borrow_date >= :start AND r.borrow_date < :stop GROUP BY genre ORDER BY borrows DESC""",
+    'by_author': """
+        SELECT b.author, COUNT(*) AS borrows
+        FROM borrow_records AS r JOIN books AS b ON b.id = r.book_id
+        WHERE r.borrow_date >= :start AND r.borrow_date < :stop
+        GROUP BY b.author ORDER BY borrows DESC LIMIT :limit""",
+    'top_borrowed': """
+        SELECT b.id, b.title, b.author, t.borrows FROM (
+            SELECT book_id, COUNT(*) AS borrows FROM borrow_records
+            WHERE borrow_date >= :start AND borrow_date < :stop GROUP BY book_id
+        ) AS t JOIN books AS b ON b.id = t.book_id ORDER BY t.borrows DESC LIMIT :limit""",
+    'top_rated': """
+        SELECT b.id, b.title, b.author, t.average, t.reviews FROM (
+            SELECT book_id, AVG(rating) AS average, COUNT(*) AS reviews FROM reviews
+            WHERE created_at >= :start AND created_at < :stop GROUP BY book_id HAVING COUNT(*) >= 1
+        ) AS t JOIN books AS b ON b.id = t.book_id ORDER BY t.average DESC, t.reviews DESC LIMIT :limit""",
+}
+
+ROLLUP_QUERIES = {
+    'by_day': lambda start, end: borrows_by_day(start, end),
+    'by_genre': lambda start, end: borrows_by_genre(start, end),
+    'by_author': lambda start, end: borrows_by_author(start, end, LIMIT),
+    'top_borrowed': lambda start, end: top_borrowed(start, end, LIMIT),
+    'top_rated': lambda start, end: top_rated(start, end, LIMIT, 1),
+}
+
+
+def median_ms(work, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='an existing dataset from benchmarks.dataset')
+    parser.add_argument('--loans', type=int, default=500000, help='loans to generate without --database')
+    parser.add_argument('--books', type=int, help='books to generate without --database (default: loans / 10)')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query; the median is reported')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.database:
+        app = make_app('sqlite:///' + os.path.abspath(args.database))
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='library-bench-'), 'analytics.db')
+        app = make_app('sqlite:///' + path)
+        migrate_database(app)
+        Generator(users=max(args.loans // 50, 100), books=args.books or max(args.loans // 10, 100), loans=args.loans,
+                  reviews=args.loans // 5, bcrypt_rounds=4).run(app)
+
+    report = {'run': run_metadata(), 'windows': {}}
+    with app.app_context():
+        start = time.perf_counter()
+        report['rollup_rows'] = rebuild_analytics()
+        report['rebuild_seconds'] = round(time.perf_counter() - start, 2)
+        report['loans'] = db.session.query(db.func.count(BorrowRecord.id)).scalar()
+        end = db.session.query(db.func.max(BorrowRecord.borrow_date)).scalar().date()
+
+        for days in (30, 365):
+            start = end - timedelta(days=days - 1)
+            parameters = {'start': start.isoformat(), 'stop': (end + timedelta(days=1)).isoformat(), 'limit': LIMIT}
+            results = {}
+            for name, query in ROLLUP_QUERIES.items():
+                rollup = median_ms(lambda: query(start, end), args.repeat)
+                raw = median_ms(lambda: db.session.execute(text(RAW_SQL[name]), parameters).all(), args.repeat)
+                results[name] = {'rollup_ms': rollup, 'raw_ms': raw,
+                                 'speedup': round(raw / rollup, 1) if rollup else None}
+            report['windows'][f'{days}_days'] = results
+    write_results(args.output, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Contention benchmark for borrow/return.
+
+Starts N worker processes against one SQLite file, each running a share of
+the borrowers, all hammering the same popular book. Reports throughput,
+latency percentiles, status counts and checks the inventory afterwards:
+
+    python -m benchmarks.borrow_contention --workers 8 --borrowers 400 --copies 50
+"""
+import argparse
+import multiprocessing
+import time
+from collections import Counter
+from flask_jwt_extended import create_access_token
+from app import db
+from app.models import User, Book, BorrowRecord
+from benchmarks.common import temp_database_uri, make_app, latency_summary, write_results
+
+
+def setup(database_uri, borrowers, copies):
+    app = make_app(database_uri)
+    with app.app_context():
+        book = Book(title='Popular Book', author='Someone', isbn='9780000000001',
+                    available_copies=copies, total_copies=copies)
+        db.session.add(book)
+        db.session.add_all([
+            User(username=f'borrower{i}', email=f'borrower{i}@example.com', password_hash='x')
+            for i in range(borrowers)
+        ])
+        db.session.commit()
+        user_ids = [user.id for user in User.query.order_by(User.id)]
+        return book.id, user_ids
+
+
+def worker(database_uri, book_id, user_ids, rounds, barrier, results):
+    app = make_app(database_uri)
+    client = app.test_client()
+    with app.app_context():
+        headers = {
+            user_id: {'Authorization': 'Bearer ' + create_access_token(
+                identity={'id': user_id, 'email': f'user{user_id}@example.com'})}
+            for user_id in user_ids
+        }
+
+    samples = []
+    barrier.wait()
+    for _ in range(rounds):
+        for user_id in user_ids:
+            start = time.perf_counter()
+            response = client.post('/api/borrow', json={'book_id': book_id}, headers=headers[user_id])
+            samples.append(('borrow', response.status_code, time.perf_counter() - start))
+            if response.status_code == 201:
+                borrow_id = response.get_json()['borrow_record']['id']
+                start = time.perf_counter()
+                response = client.put(f'/api/borrow/{borrow_id}', headers=headers[user_id])
+                samples.append(('return', response.status_code, time.perf_counter() - start))
+    results.put(samples)
+
+
+def check_inventory(database_uri, book_id, copies):
+    app = make_app(database_uri)
+    with app.app_context():
+        book = Book.query.get(book_id)
+        active = BorrowRecord.query.filter_by(book_id=book_id, return_date=None).count()
+        duplicates = (db.session.query(BorrowRecord.user_id)
+                      .filter_by(book_id=book_id, return_date=None)
+                      .group_by(BorrowRecord.user_id)
+                      .having(db.func.count() > 1)
+                      .count())
+        return {
+            'available_copies': book.available_copies,
+            'active_borrows': active,
+            'duplicate_active_borrows': duplicates,
+            'consistent': (book.available_copies >= 0
+                           and book.available_copies + active == copies
+                           and duplicates == 0)
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8, help='concurrent worker processes')
+    parser.add_argument('--borrowers', type=int, default=200, help='distinct users')
+    parser.add_argument('--copies', type=int, default=20, help='copies of the popular book')
+    parser.add_argument('--rounds', type=int, default=3, help='borrow/return passes per borrower')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    database_uri = temp_database_uri()
+    book_id, user_ids = setup(database_uri, args.borrowers, args.copies)
+
+    barrier = multiprocessing.Barrier(args.workers + 1)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(
+            database_uri, book_id, user_ids[i::args.workers], args.rounds, barrier, results))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    start = time.perf_counter()
+    samples = [sample for _ in processes for sample in results.get()]
+    elapsed = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    report = {
+        'workers': args.workers,
+        'borrowers': args.borrowers,
+        'copies': args.copies,
+        'rounds': args.rounds,
+        'requests': len(samples),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'status_counts': {f'{op} {status}': count for (op, status), count
+                          in sorted(Counter((op, status) for op, status, _ in samples).items())},
+        'latency': {op: latency_summary([t for o, _, t in samples if o == op])
+                    for op in ('borrow', 'return')},
+        'inventory': check_inventory(database_uri, book_id, args.copies)
+    }
+    write_results(args.output, report)
+    if not report['inventory']['consistent']:
+        raise SystemExit('Inventory check failed')
+
+
+if __name__ == '__main__':
+    main()
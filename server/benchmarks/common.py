@@ -0,0 +1,89 @@
+"""Shared helpers for the scripts in this package.
+
+Run them from the server/ directory, e.g. `python -m benchmarks.borrow_contention`.
+"""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+from contextlib import closing
+from datetime import datetime
+from flask_migrate import upgrade
+from app import create_app
+
+
+def temp_database_uri(name='bench.db'):
+    """A fresh, migrated SQLite file in a temporary directory, so benchmarks never touch library.db."""
+    database_uri = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='library-bench-'), name)
+    migrate_database(make_app(database_uri))
+    return database_uri
+
+
+def copy_database_uri(path, name='bench.db'):
+    """A copy of an existing dataset in a temporary directory, so a run never writes into the original."""
+    target = os.path.join(tempfile.mkdtemp(prefix='library-bench-'), name)
+    # The backup API also copies whatever is still in the WAL
+    with closing(sqlite3.connect(path)) as source, closing(sqlite3.connect(target)) as copy:
+        source.backup(copy)
+    return 'sqlite:///' + target
+
+
+def migrate_database(app):
+    """Bring the app's database up to the latest migration, as `flask db upgrade` would."""
+    with app.app_context():
+        upgrade()
+
+
+def make_app(database_uri, **config):
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'TESTING': True,
+        # Measure the production request path, without the N+1 detector
+        'QUERY_INSPECTION': False,
+        **config
+    })
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list; 0 for an empty one."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def latency_summary(latencies):
+    """p50/p95/p99/max in milliseconds for a list of durations in seconds."""
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0
+    }
+
+
+def run_metadata():
+    """Where and when a run happened, so saved results can be compared across commits."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'started_at': datetime.utcnow().isoformat(timespec='seconds')
+    }
+
+
+def write_results(path, results):
+    if path:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
@@ -0,0 +1,330 @@
+"""Synthetic dataset generator for load and capacity tests.
+
+Builds a fresh SQLite database at production-like scale with skewed,
+believable distributions:
+
+* book popularity is Zipfian, and popular titles hold more copies
+* a few heavy readers account for most loans
+* a configurable share of loans is still out, and some of those are overdue
+* each book has its own quality, and its ratings spread around it
+
+The same --seed and --as-of always produce the same rows. Rows go in
+through bulk Core inserts in chunks; the loan and review indexes, the
+search index and the analytics rollups are built once at the end. Every
+account shares one precomputed bcrypt hash of PASSWORD, so 100k users
+cost a single hash.
+
+    python -m benchmarks.dataset --database /tmp/big.db --users 100000 \\
+        --books 2000000 --loans 20000000 --reviews 5000000
+"""
+import argparse
+import os
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+import bcrypt
+from sqlalchemy import text
+from app import db
+from app.models import User, Book, BorrowRecord, Review
+from app.analytics import rebuild_analytics
+from app.fines import refresh_overdue
+from app.ratings import recompute_ratings
+from app.search import rebuild_search_index
+from app.storage import storage_profile
+from benchmarks.common import make_app, migrate_database, write_results
+
+PASSWORD = 'password123'
+CHUNK_SIZE = 10000
+
+# Column order of the row tuples each generator yields
+USER_COLUMNS = ('id', 'username', 'email', 'password_hash', 'role', 'created_at', 'is_active')
+BOOK_COLUMNS = ('id', 'title', 'author', 'isbn', 'available_copies', 'total_copies', 'description',
+                'publication_year', 'genre', 'created_at')
+LOAN_COLUMNS = ('user_id', 'book_id', 'borrow_date', 'due_date', 'return_date', 'status', 'fine_amount')
+REVIEW_COLUMNS = ('user_id', 'book_id', 'rating', 'comment', 'created_at', 'updated_at')
+
+GENRES = ['Fiction', 'Mystery', 'Science Fiction', 'Fantasy', 'Romance', 'History', 'Biography',
+          'Self-Help', 'Science', 'Poetry', 'Philosophy', 'Children']
+# Fiction-heavy, like most public library collections
+GENRE_CUM_WEIGHTS = list(accumulate([20, 12, 9, 9, 10, 8, 6, 7, 6, 2, 3, 8]))
+TITLE_WORDS = ['Silent', 'River', 'Shadow', 'Garden', 'Empire', 'Winter', 'Secret', 'Light', 'Stone',
+               'Last', 'House', 'Journey', 'Night', 'Glass', 'Iron', 'Forgotten', 'Summer', 'City',
+               'Ocean', 'Crown', 'Fire', 'Letters', 'Storm', 'Orchard', 'Mountain', 'Clock', 'Wild',
+               'Hidden', 'Golden', 'Bridge', 'Island', 'Memory', 'Song', 'North', 'Thread', 'Road']
+FIRST_NAMES = ['Ada', 'James', 'Mary', 'Chinua', 'Toni', 'Haruki', 'Elena', 'George', 'Zadie', 'Ngozi',
+               'Italo', 'Ursula', 'Kazuo', 'Isabel', 'Gabriel', 'Jhumpa', 'Orhan', 'Doris', 'Colson', 'Yaa']
+LAST_NAMES = ['Achebe', 'Morrison', 'Murakami', 'Ferrante', 'Eliot', 'Smith', 'Adichie', 'Calvino',
+              'Le Guin', 'Ishiguro', 'Allende', 'Marquez', 'Lahiri', 'Pamuk', 'Lessing', 'Whitehead',
+              'Gyasi', 'Austen', 'Orwell', 'Woolf', 'Okri', 'Mantel', 'Atwood', 'Rushdie', 'Tolkien']
+COMMENTS = ['Really enjoyed this book!', 'Not bad, but could be better.', 'Excellent read, highly recommend!',
+            'Good book, learned a lot.', 'Amazing story and characters.', 'Well written and engaging.',
+            'Could not put it down!', 'Thought-provoking and insightful.', 'Slow start, strong finish.',
+            'Not for me.']
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks 1..n, for random.choices(cum_weights=...)."""
+    total, weights = 0.0, []
+    for rank in range(1, n + 1):
+        total += rank ** -exponent
+        weights.append(total)
+    return weights
+
+
+def isbn13(number):
+    """A valid ISBN-13 in the 978 range for a 9-digit serial number."""
+    digits = f'978{number:09d}'
+    check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10
+    return digits + str(check)
+
+
+def copies_for_rank(rank):
+    # A dozen copies of the bestseller, a single one for the long tail
+    return max(1, round(12 / (rank + 1) ** 0.25))
+
+
+def timestamp(value):
+    """The text SQLAlchemy's SQLite DateTime type stores, without its per-row overhead."""
+    return value.isoformat(sep=' ', timespec='microseconds') if value else None
+
+
+def insert_chunks(conn, table, columns, rows):
+    """Insert an iterator of row tuples in CHUNK_SIZE executemany batches.
+
+    The statement is compiled once and rows skip SQLAlchemy's per-value
+    bind processing, which otherwise costs more than SQLite itself.
+    """
+    statement = (f"INSERT INTO {table.name} ({', '.join(columns)}) "
+                 f"VALUES ({', '.join('?' for _ in columns)})")
+    chunk, count = [], 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            conn.exec_driver_sql(statement, chunk)
+            conn.commit()
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        conn.exec_driver_sql(statement, chunk)
+        conn.commit()
+        count += len(chunk)
+    return count
+
+
+class Generator:
+    def __init__(self, users, books, loans, reviews, seed=42, as_of=None, days=730, zipf=1.1,
+                 reader_skew=0.6, open_fraction=0.05, overdue_fraction=0.02, admins=1, bcrypt_rounds=12):
+        self.users, self.books, self.loans, self.reviews = users, books, loans, reviews
+        self.rng = random.Random(seed)
+        self.as_of = as_of or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.days = days
+        self.open_fraction = open_fraction
+        self.overdue_fraction = overdue_fraction
+        self.admins = admins
+        self.bcrypt_rounds = bcrypt_rounds
+
+        # Popularity rank -> book ID, shuffled so popularity doesn't follow insertion order
+        self.book_by_rank = list(range(1, books + 1))
+        self.rng.shuffle(self.book_by_rank)
+        self.book_weights = zipf_cum_weights(books, zipf)
+        self.reader_by_rank = list(range(1, users + 1))
+        self.rng.shuffle(self.reader_by_rank)
+        self.reader_weights = zipf_cum_weights(users, reader_skew)
+
+        self.copies = array('i', [0]) * (books + 1)
+        for rank, book_id in enumerate(self.book_by_rank):
+            self.copies[book_id] = copies_for_rank(rank)
+        self.quality = array('f', [0.0]) * (books + 1)
+        for book_id in range(1, books + 1):
+            self.quality[book_id] = min(5.0, max(1.0, self.rng.gauss(3.8, 0.7)))
+        self.open_loans = array('i', [0]) * (books + 1)
+
+    def pick_books(self, k):
+        return self.rng.choices(self.book_by_rank, cum_weights=self.book_weights, k=k)
+
+    def pick_readers(self, k):
+        return self.rng.choices(self.reader_by_rank, cum_weights=self.reader_weights, k=k)
+
+    def past(self, max_days, min_days=0):
+        return self.as_of - timedelta(seconds=self.rng.randint(min_days * 86400, max_days * 86400))
+
+    def user_rows(self):
+        password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(self.bcrypt_rounds)).decode('utf-8')
+        for user_id in range(1, self.users + 1):
+            yield (user_id, f'user{user_id}', f'user{user_id}@example.com', password_hash,
+                   'admin' if user_id <= self.admins else 'user', timestamp(self.past(self.days)), 1)
+
+    def book_rows(self):
+        rng = self.rng
+        for book_id in range(1, self.books + 1):
+            copies = self.copies[book_id]
+            yield (
+                book_id,
+                ' '.join(rng.sample(TITLE_WORDS, rng.randint(2, 4))),
+                f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                isbn13(book_id),
+                copies,
+                copies,
+                f'A {rng.choice(GENRES).lower()} story about {rng.choice(TITLE_WORDS).lower()}.',
+                rng.randint(1850, self.as_of.year),
+                rng.choices(GENRES, cum_weights=GENRE_CUM_WEIGHTS)[0],
+                timestamp(self.past(self.days))
+            )
+
+    def loan_rows(self, loan_period, fine_per_day, fine_cap):
+        rng = self.rng
+        open_pairs = set()
+        generated = 0
+        while generated < self.loans:
+            k = min(CHUNK_SIZE, self.loans - generated)
+            for book_id, user_id in zip(self.pick_books(k), self.pick_readers(k)):
+                roll = rng.random()
+                # Only one open loan per reader and book, and never more than the copies on the shelf
+                can_open = (self.open_loans[book_id] < self.copies[book_id]
+                            and (user_id, book_id) not in open_pairs)
+                if roll < self.overdue_fraction and can_open:
+                    borrowed = self.past(loan_period.days + 90, loan_period.days + 1)
+                    returned, status = None, 'overdue'
+                elif roll < self.overdue_fraction + self.open_fraction and can_open:
+                    borrowed = self.past(loan_period.days)
+                    returned, status = None, 'borrowed'
+                else:
+                    borrowed = self.past(self.days, 1)
+                    # Most loans come back within the period, a few come back late
+                    returned = borrowed + timedelta(seconds=rng.randint(3600, int(loan_period.total_seconds() * 1.3)))
+                    returned, status = min(returned, self.as_of), 'returned'
+                due = borrowed + loan_period
+                fine = 0.0
+                if returned is None:
+                    open_pairs.add((user_id, book_id))
+                    self.open_loans[book_id] += 1
+                elif returned > due:
+                    fine = min(fine_cap, round((returned - due).days * fine_per_day, 2))
+                yield (user_id, book_id, timestamp(borrowed), timestamp(due), timestamp(returned), status, fine)
+            generated += k
+
+    def review_rows(self):
+        rng = self.rng
+        reviewed = set()
+        generated = 0
+        # A reader reviews a book at most once; cap the attempts so tiny
+        # catalogs can't spin forever looking for an unused pair.
+        attempts = 0
+        while generated < self.reviews and attempts < self.reviews * 20:
+            k = min(CHUNK_SIZE, self.reviews - generated)
+            for book_id, user_id in zip(self.pick_books(k), self.pick_readers(k)):
+                attempts += 1
+                if (user_id, book_id) in reviewed:
+                    continue
+                reviewed.add((user_id, book_id))
+                generated += 1
+                created = timestamp(self.past(self.days))
+                yield (user_id, book_id, min(5, max(1, round(rng.gauss(self.quality[book_id], 0.9)))),
+                       rng.choice(COMMENTS), created, created)
+
+    def run(self, app):
+        """Fill the (empty) database of `app` and return row counts and timings."""
+        config = app.config
+        loan_period = timedelta(days=config['LOAN_PERIOD_DAYS'])
+        timings = {}
+        with app.app_context():
+            if db.session.query(User.id).first() or db.session.query(Book.id).first():
+                raise SystemExit('The target database already has data; point --database at a new file.')
+            bulk_tables = (BorrowRecord.__table__, Review.__table__)
+            with db.engine.connect() as conn:
+                # Bulk load: no fsync per chunk, and secondary indexes and the
+                # search index built once at the end
+                # Straight to the driver: SQLite refuses to change it inside
+                # the transaction the connection would otherwise begin first
+                conn.connection.driver_connection.execute('PRAGMA synchronous = OFF')
+                # Put back as the migration created it once the rows are in
+                insert_trigger = conn.exec_driver_sql(
+                    "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'books_fts_ai'").scalar()
+                conn.exec_driver_sql('DROP TRIGGER IF EXISTS books_fts_ai')
+                for table in bulk_tables:
+                    for index in table.indexes:
+                        index.drop(bind=conn)
+                conn.commit()
+
+                counts = {}
+                for table, columns, rows in (
+                    (User.__table__, USER_COLUMNS, self.user_rows()),
+                    (Book.__table__, BOOK_COLUMNS, self.book_rows()),
+                    (BorrowRecord.__table__, LOAN_COLUMNS,
+                     self.loan_rows(loan_period, config['FINE_PER_DAY'], config['FINE_CAP'])),
+                    (Review.__table__, REVIEW_COLUMNS, self.review_rows()),
+                ):
+                    name = table.name
+                    start = time.perf_counter()
+                    counts[name] = insert_chunks(conn, table, columns, rows)
+                    timings[name] = round(time.perf_counter() - start, 2)
+
+                start = time.perf_counter()
+                on_loan = [{'id': book_id, 'out': out} for book_id, out in enumerate(self.open_loans) if out]
+                if on_loan:
+                    conn.execute(text('UPDATE books SET available_copies = total_copies - :out WHERE id = :id'),
+                                 on_loan)
+                conn.exec_driver_sql(insert_trigger)
+                conn.commit()
+                # Back to the profile's setting before the pool hands it out again
+                pragmas, _ = storage_profile(config)
+                conn.connection.driver_connection.execute(f"PRAGMA synchronous = {pragmas.get('synchronous', 'FULL')}")
+                timings['inventory'] = round(time.perf_counter() - start, 2)
+
+            def create_indexes():
+                for table in bulk_tables:
+                    for index in table.indexes:
+                        index.create(bind=db.engine)
+
+            for step, work in (('indexes', create_indexes), ('search', rebuild_search_index),
+                               ('ratings', recompute_ratings),
+                               ('fines', lambda: refresh_overdue(self.as_of)),
+                               ('analytics', rebuild_analytics)):
+                start = time.perf_counter()
+                work()
+                db.session.commit()
+                timings[step] = round(time.perf_counter() - start, 2)
+        return {'rows': counts, 'seconds': timings}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='path of the SQLite file to create')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--loans', type=int, default=500000)
+    parser.add_argument('--reviews', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--as-of', help='ISO date the data is generated relative to (default: today)')
+    parser.add_argument('--days', type=int, default=730, help='history covered by loans and reviews')
+    parser.add_argument('--zipf', type=float, default=1.1, help='book popularity skew')
+    parser.add_argument('--reader-skew', type=float, default=0.6, help='how much heavy readers dominate')
+    parser.add_argument('--open-fraction', type=float, default=0.05, help='share of loans still out')
+    parser.add_argument('--overdue-fraction', type=float, default=0.02, help='share of loans out and overdue')
+    parser.add_argument('--admins', type=int, default=1, help='the first N users get the admin role')
+    parser.add_argument('--bcrypt-rounds', type=int, default=None,
+                        help='work factor of the shared password hash (default: BCRYPT_ROUNDS)')
+    parser.add_argument('--output', help='also write the row counts and timings as JSON to this file')
+    args = parser.parse_args()
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+    app = make_app('sqlite:///' + os.path.abspath(args.database), RESPONSE_CACHE_ENABLED=False)
+    migrate_database(app)
+    generator = Generator(
+        args.users, args.books, args.loans, args.reviews, seed=args.seed,
+        as_of=datetime.fromisoformat(args.as_of) if args.as_of else None,
+        days=args.days, zipf=args.zipf, reader_skew=args.reader_skew,
+        open_fraction=args.open_fraction, overdue_fraction=args.overdue_fraction, admins=args.admins,
+        bcrypt_rounds=args.bcrypt_rounds or app.config['BCRYPT_ROUNDS'])
+    start = time.perf_counter()
+    report = generator.run(app)
+    report.update({'database': args.database, 'seed': args.seed, 'as_of': generator.as_of.isoformat(),
+                   'total_seconds': round(time.perf_counter() - start, 2)})
+    write_results(args.output, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Mixed-traffic load test for the API.
+
+Starts create_app() against a generated dataset (see benchmarks.dataset)
+and runs concurrent clients that browse the catalog, open book pages,
+search, log in, borrow and return, review and check their profile, in
+proportions set by MIX. Reports throughput, p50/p95/p99 latency, status
+codes and SQL statements per request for each endpoint:
+
+    python -m benchmarks.load_test --clients 8 --duration 30 --output results.json
+
+Pass --database to reuse a dataset generated earlier (the run works on a
+copy, so the file itself is left as it was); otherwise a small one is
+generated into a temporary file first. Clients run as threads in this
+process, so the numbers are for one worker process.
+"""
+import argparse
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func
+from app import db
+from app.models import User, Book, BorrowRecord
+from benchmarks.common import temp_database_uri, copy_database_uri, make_app, latency_summary, run_metadata, write_results
+from benchmarks.dataset import Generator, PASSWORD, TITLE_WORDS, zipf_cum_weights
+
+# Relative weight of each client action
+MIX = {
+    'browse': 30,
+    'book_detail': 30,
+    'search': 10,
+    'profile': 8,
+    'borrow_return': 10,
+    'review': 5,
+    'login': 7,
+}
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+class Client:
+    """One simulated patron with its own test client, token and random stream."""
+
+    def __init__(self, app, user_id, book_ids, book_weights, borrowable, max_user_id, seed, record):
+        self.client = app.test_client()
+        self.rng = random.Random(seed)
+        self.book_ids, self.book_weights = book_ids, book_weights
+        self.borrowable, self.borrowable_weights = borrowable, zipf_cum_weights(len(borrowable), 1.1)
+        self.max_user_id = max_user_id
+        self.record = record
+        with app.app_context():
+            token = create_access_token(identity={'id': user_id, 'email': f'user{user_id}@example.com'})
+        self.headers = {'Authorization': 'Bearer ' + token}
+
+    def request(self, name, method, path, **kwargs):
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, **kwargs)
+        elapsed = time.perf_counter() - start
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        self.record(name, response.status_code, elapsed, int(match.group(1)) if match else None)
+        return response
+
+    def popular_book(self):
+        return self.rng.choices(self.book_ids, cum_weights=self.book_weights)[0]
+
+    def browse(self):
+        after = self.rng.randint(0, max(len(self.book_ids) - 20, 0))
+        self.request('get_books', 'GET', f'/api/books?limit=20&after={after}')
+
+    def book_detail(self):
+        self.request('get_book', 'GET', f'/api/books/{self.popular_book()}')
+
+    def search(self):
+        self.request('search', 'GET', f'/api/books/search?q={self.rng.choice(TITLE_WORDS).lower()}')
+
+    def profile(self):
+        self.request('get_profile', 'GET', '/api/profile', headers=self.headers)
+
+    def borrow_return(self):
+        book_id = self.rng.choices(self.borrowable, cum_weights=self.borrowable_weights)[0]
+        response = self.request('borrow_book', 'POST', '/api/borrow', json={'book_id': book_id},
+                                headers=self.headers)
+        if response.status_code == 201:
+            borrow_id = response.get_json()['borrow_record']['id']
+            self.request('return_book', 'PUT', f'/api/borrow/{borrow_id}', headers=self.headers)
+
+    def review(self):
+        self.request('add_review', 'POST', '/api/reviews', headers=self.headers,
+                     json={'book_id': self.popular_book(), 'rating': self.rng.randint(1, 5), 'comment': 'Load test'})
+
+    def login(self):
+        user_id = self.rng.randint(1, self.max_user_id)
+        self.request('login', 'POST', '/api/login',
+                     json={'email': f'user{user_id}@example.com', 'password': PASSWORD})
+
+
+def run_load(app, clients, duration, seed):
+    rng = random.Random(seed)
+    with app.app_context():
+        max_user_id = db.session.query(func.max(User.id)).scalar()
+        book_ids = [book_id for book_id, in db.session.query(Book.id).order_by(Book.id)]
+        in_stock = {book_id for book_id, in db.session.query(Book.id).filter(Book.available_copies > 0)}
+        # A patron per client, so no two clients race for the same loan
+        patron_ids = rng.sample(range(1, max_user_id + 1), min(clients, max_user_id))
+        on_loan = defaultdict(set)
+        for user_id, book_id in db.session.query(BorrowRecord.user_id, BorrowRecord.book_id).filter(
+                BorrowRecord.user_id.in_(patron_ids), BorrowRecord.return_date.is_(None)):
+            on_loan[user_id].add(book_id)
+    # Zipfian popularity over a shuffled catalog, as in the generated loans
+    rng.shuffle(book_ids)
+    book_weights = zipf_cum_weights(len(book_ids), 1.1)
+
+    samples = defaultdict(list)
+    lock = threading.Lock()
+
+    def record(name, status, elapsed, queries):
+        with lock:
+            samples[name].append((status, elapsed, queries))
+
+    actions, weights = zip(*MIX.items())
+    deadline = time.perf_counter() + duration
+
+    def patron(i):
+        user_id = patron_ids[i % len(patron_ids)]
+        # Borrow only what can be lent: books in stock that this patron
+        # doesn't already have, so the borrows measured mostly succeed
+        borrowable = [book_id for book_id in book_ids if book_id in in_stock and book_id not in on_loan[user_id]]
+        client = Client(app, user_id, book_ids, book_weights, borrowable, max_user_id, seed + i, record)
+        while time.perf_counter() < deadline:
+            getattr(client, client.rng.choices(actions, weights=weights)[0])()
+
+    threads = [threading.Thread(target=patron, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for name, rows in sorted(samples.items()):
+        statuses = [status for status, _, _ in rows]
+        queries = [count for _, _, count in rows if count is not None]
+        endpoints[name] = {
+            'requests': len(rows),
+            'requests_per_s': round(len(rows) / elapsed, 2),
+            'latency': latency_summary([latency for _, latency, _ in rows]),
+            'statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+            'queries_per_request': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else None,
+                'max': max(queries) if queries else None
+            }
+        }
+    total = sum(len(rows) for rows in samples.values())
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'requests': total,
+        'requests_per_s': round(total / elapsed, 2),
+        'latency': latency_summary([latency for rows in samples.values() for _, latency, _ in rows]),
+        'endpoints': endpoints
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='a dataset made by benchmarks.dataset (default: generate one)')
+    parser.add_argument('--users', type=int, default=2000, help='users to generate without --database')
+    parser.add_argument('--books', type=int, default=20000, help='books to generate without --database')
+    parser.add_argument('--loans', type=int, default=100000, help='loans to generate without --database')
+    parser.add_argument('--reviews', type=int, default=20000, help='reviews to generate without --database')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of traffic')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12,
+                        help='work factor for the app; must match the dataset for logins to skip rehashing')
+    parser.add_argument('--cache', action=argparse.BooleanOptionalAction, default=True,
+                        help='run with the response cache on or off')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    report = {'run': run_metadata(), 'clients': args.clients, 'duration_s': args.duration,
+              'mix': MIX, 'response_cache': args.cache}
+    config = {'BCRYPT_ROUNDS': args.bcrypt_rounds, 'RESPONSE_CACHE_ENABLED': args.cache}
+    if args.database:
+        app = make_app(copy_database_uri(args.database), **config)
+        report['dataset'] = {'database': args.database}
+    else:
+        app = make_app(temp_database_uri(), **config)
+        generator = Generator(args.users, args.books, args.loans, args.reviews, seed=args.seed,
+                              as_of=datetime(2026, 1, 1), bcrypt_rounds=args.bcrypt_rounds)
+        report['dataset'] = generator.run(app)
+    report['load'] = run_load(app, args.clients, args.duration, args.seed)
+    write_results(args.output, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Password hashing benchmark.
+
+Measures raw bcrypt throughput inline and through the hashing pool, then a
+login storm of concurrent clients while one reader keeps fetching a book,
+once with inline hashing and once with the pool:
+
+    python -m benchmarks.password_hashing --rounds 12 --clients 16
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app import db
+from app.models import User, Book
+from app.passwords import hash_password
+from benchmarks.common import temp_database_uri, make_app, latency_summary, write_results
+
+
+def hash_throughput(app, count, clients):
+    """Hashes per second with `clients` threads calling hash_password concurrently."""
+    def hash_once(_):
+        with app.app_context():
+            return hash_password('password123')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(hash_once, range(count)))
+    return round(count / (time.perf_counter() - start), 2)
+
+
+def login_storm(app, clients, logins_per_client):
+    with app.app_context():
+        password_hash = hash_password('password123')
+        db.session.add_all([
+            User(username=f'patron{i}', email=f'patron{i}@example.com', password_hash=password_hash)
+            for i in range(clients)
+        ])
+        db.session.add(Book(title='Bench Book', author='Someone', isbn='9780000000002'))
+        db.session.commit()
+        book_id = Book.query.filter_by(isbn='9780000000002').one().id
+
+    logins, statuses, reads = [], [], []
+    done = threading.Event()
+
+    def patron(i):
+        client = app.test_client()
+        for _ in range(logins_per_client):
+            start = time.perf_counter()
+            response = client.post('/api/login', json={'email': f'patron{i}@example.com', 'password': 'password123'})
+            logins.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    def reader():
+        client = app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get(f'/api/books/{book_id}')
+            reads.append(time.perf_counter() - start)
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        list(executor.map(patron, range(clients)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    reader_thread.join()
+
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'logins_per_s': round(len(logins) / elapsed, 2),
+        'login_latency': latency_summary(logins),
+        'login_statuses': {str(status): statuses.count(status) for status in sorted(set(statuses))},
+        'catalog_latency_during_storm': latency_summary(reads)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt work factor')
+    parser.add_argument('--hashes', type=int, default=32, help='hashes for the throughput test')
+    parser.add_argument('--workers', type=int, default=4, help='hashing pool processes')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent login clients')
+    parser.add_argument('--logins', type=int, default=2, help='logins per client')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    report = {'rounds': args.rounds, 'pool_workers': args.workers, 'clients': args.clients}
+    for mode, workers in (('inline', 0), ('pool', args.workers)):
+        app = make_app(temp_database_uri(), BCRYPT_ROUNDS=args.rounds, PASSWORD_HASH_WORKERS=workers,
+                       PASSWORD_HASH_MAX_PENDING=args.clients * 2, RESPONSE_CACHE_ENABLED=False)
+        report[mode] = {
+            'hashes_per_s': hash_throughput(app, args.hashes, args.clients),
+            'login_storm': login_storm(app, args.clients, args.logins)
+        }
+    write_results(args.output, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Read throughput while borrow/return traffic is writing.
+
+Starts reader processes fetching book details and, in a second phase,
+writer processes borrowing and returning at the same time, all against
+one SQLite file. Reports read throughput and latency for both phases, so
+the drop caused by the writers can be compared between storage profiles:
+
+    python -m benchmarks.read_under_writes --profile rollback
+    python -m benchmarks.read_under_writes --profile wal
+"""
+import argparse
+import multiprocessing
+import time
+from collections import Counter
+from flask_jwt_extended import create_access_token
+from app import db
+from app.models import User, Book
+from benchmarks.common import temp_database_uri, make_app, latency_summary, run_metadata, write_results
+
+
+def make_profile_app(database_uri, profile):
+    # The response cache would answer reads without touching SQLite at all
+    return make_app(database_uri, SQLITE_PROFILE=profile, RESPONSE_CACHE_ENABLED=False)
+
+
+def setup(database_uri, profile, books, borrowers):
+    app = make_profile_app(database_uri, profile)
+    with app.app_context():
+        db.session.add_all([
+            Book(title=f'Book {i}', author=f'Author {i % 50}', isbn=f'978{i:010d}',
+                 available_copies=5, total_copies=5)
+            for i in range(books)
+        ])
+        db.session.add_all([
+            User(username=f'borrower{i}', email=f'borrower{i}@example.com', password_hash='x')
+            for i in range(borrowers)
+        ])
+        db.session.commit()
+        return ([book_id for book_id, in db.session.execute(db.select(Book.id).order_by(Book.id))],
+                [user_id for user_id, in db.session.execute(db.select(User.id).order_by(User.id))])
+
+
+def reader(database_uri, profile, book_ids, duration, barrier, results):
+    app = make_profile_app(database_uri, profile)
+    client = app.test_client()
+    samples = []
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = client.get(f'/api/books/{book_ids[i % len(book_ids)]}')
+        samples.append(('read', response.status_code, time.perf_counter() - start))
+        i += 1
+    results.put(samples)
+
+
+def writer(database_uri, profile, book_ids, user_ids, duration, barrier, results):
+    app = make_profile_app(database_uri, profile)
+    client = app.test_client()
+    with app.app_context():
+        headers = [{'Authorization': 'Bearer ' + create_access_token(
+            identity={'id': user_id, 'email': f'borrower{user_id}@example.com'})}
+            for user_id in user_ids]
+    samples = []
+    barrier.wait()
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        user_headers = headers[i % len(headers)]
+        start = time.perf_counter()
+        response = client.post('/api/borrow', json={'book_id': book_ids[i % len(book_ids)]},
+                               headers=user_headers)
+        samples.append(('borrow', response.status_code, time.perf_counter() - start))
+        if response.status_code == 201:
+            borrow_id = response.get_json()['borrow_record']['id']
+            start = time.perf_counter()
+            response = client.put(f'/api/borrow/{borrow_id}', headers=user_headers)
+            samples.append(('return', response.status_code, time.perf_counter() - start))
+        i += 1
+    results.put(samples)
+
+
+def run_phase(database_uri, profile, book_ids, user_ids, readers, writers, duration):
+    barrier = multiprocessing.Barrier(readers + writers)
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=reader, args=(
+            database_uri, profile, book_ids[i::readers], duration, barrier, results))
+        for i in range(readers)
+    ] + [
+        multiprocessing.Process(target=writer, args=(
+            database_uri, profile, book_ids, user_ids[i::writers], duration, barrier, results))
+        for i in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [sample for _ in processes for sample in results.get()]
+    for process in processes:
+        process.join()
+
+    reads = [t for op, _, t in samples if op == 'read']
+    return {
+        'readers': readers,
+        'writers': writers,
+        'read_throughput_rps': round(len(reads) / duration, 1),
+        'write_requests': sum(1 for op, _, _ in samples if op != 'read'),
+        'status_counts': {f'{op} {status}': count for (op, status), count
+                          in sorted(Counter((op, status) for op, status, _ in samples).items())},
+        'latency': {op: latency_summary([t for o, _, t in samples if o == op])
+                    for op in ('read', 'borrow', 'return')},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', default='wal', help='SQLITE_PROFILE to run with')
+    parser.add_argument('--readers', type=int, default=4, help='reader processes')
+    parser.add_argument('--writers', type=int, default=4, help='borrow/return processes in the second phase')
+    parser.add_argument('--books', type=int, default=200, help='books in the catalogue')
+    parser.add_argument('--borrowers', type=int, default=200, help='distinct users')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per phase')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    database_uri = temp_database_uri()
+    book_ids, user_ids = setup(database_uri, args.profile, args.books, args.borrowers)
+
+    quiet = run_phase(database_uri, args.profile, book_ids, user_ids, args.readers, 0, args.duration)
+    busy = run_phase(database_uri, args.profile, book_ids, user_ids, args.readers, args.writers, args.duration)
+    report = {
+        'run': run_metadata(),
+        'profile': args.profile,
+        'duration_s': args.duration,
+        'reads_only': quiet,
+        'reads_with_writes': busy,
+        'read_throughput_retained': (round(busy['read_throughput_rps'] / quiet['read_throughput_rps'], 3)
+                                     if quiet['read_throughput_rps'] else None),
+    }
+    write_results(args.output, report)
+    errors = {key: count for key, count in busy['status_counts'].items() if key.split()[1].startswith('5')}
+    if errors:
+        raise SystemExit(f'Server errors during the write phase: {errors}')
+
+
+if __name__ == '__main__':
+    main()
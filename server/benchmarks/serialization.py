@@ -0,0 +1,87 @@
+"""Micro-benchmarks for the book serialisation paths.
+
+Times Book.to_dict() on loaded books, loading a page as ORM objects (the
+old get_books path) against loading it as projected rows (the current
+one), and the get_books view end to end with the response cache off:
+
+    python -m benchmarks.serialization --page-size 100 --repeat 50
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime
+from flask import json
+from sqlalchemy.orm import selectinload, joinedload
+from app import db
+from app.models import Book, Review
+from app.serializers import BOOK_FIELDS, BOOK_LIST_CHILDREN, book_projection, book_items
+from benchmarks.common import temp_database_uri, make_app, run_metadata, write_results
+from benchmarks.dataset import Generator
+
+
+def timed(fn, repeat):
+    """Median and best wall time of `repeat` calls, in milliseconds."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {'median_ms': round(statistics.median(runs) * 1000, 3), 'best_ms': round(min(runs) * 1000, 3)}
+
+
+def orm_page(page_size):
+    # What get_books loaded before it switched to column projections
+    return (Book.query
+            .options(selectinload(Book.borrow_records),
+                     selectinload(Book.reviews).joinedload(Review.user))
+            .order_by(Book.id)
+            .limit(page_size)
+            .all())
+
+
+def projected_page(page_size):
+    # get_books' default view: every field and both child lists
+    projection = book_projection(tuple(sorted(BOOK_FIELDS)), tuple(sorted(BOOK_LIST_CHILDREN)))
+    rows = db.session.execute(projection.select().order_by(Book.id).limit(page_size)).all()
+    return book_items(rows, projection, BOOK_LIST_CHILDREN)
+
+
+def run(app, page_size, repeat):
+    view = app.view_functions['api.get_books']
+    results = {}
+    with app.app_context():
+        books = orm_page(page_size)
+        results['book_to_dict'] = timed(lambda: [book.to_dict() for book in books], repeat)
+        dicts = [book.to_dict() for book in books]
+        results['to_dict_json_dumps'] = timed(lambda: json.dumps(dicts), repeat)
+
+    with app.test_request_context(f'/api/books?limit={page_size}'):
+        results['orm_page_load'] = timed(lambda: orm_page(page_size), repeat)
+        results['projected_page_load'] = timed(lambda: projected_page(page_size), repeat)
+        results['get_books_view'] = timed(view, repeat)
+        response = view()
+        results['get_books_body_bytes'] = len(response.get_data())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=100, help='books per page')
+    parser.add_argument('--repeat', type=int, default=50, help='timed runs of each benchmark')
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=10000)
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    app = make_app(temp_database_uri(), RESPONSE_CACHE_ENABLED=False)
+    # Fixed seed and date, so every run serialises exactly the same rows
+    Generator(500, args.books, args.loans, args.reviews, seed=7, as_of=datetime(2026, 1, 1),
+              bcrypt_rounds=4).run(app)
+    report = {'run': run_metadata(), 'page_size': args.page_size, 'repeat': args.repeat,
+              'results': run(app, args.page_size, args.repeat)}
+    write_results(args.output, report)
+
+
+if __name__ == '__main__':
+    main()
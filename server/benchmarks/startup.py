@@ -0,0 +1,122 @@
+"""Worker startup benchmark.
+
+Boots N workers against one migrated SQLite file, all at once, the two
+ways gunicorn can: as fresh interpreters that each import the code and
+call create_app() (no preload), and as forks of a parent that already
+did (preload_app). Reports how long each worker took to answer its first
+request and how long until all of them had:
+
+    python -m benchmarks.startup --workers 16
+
+--create-all also runs db.create_all() in every fresh worker, which is
+what each process did at startup before the schema moved to migrations.
+"""
+import argparse
+import json
+import multiprocessing
+import subprocess
+import sys
+import time
+from benchmarks.common import temp_database_uri, make_app, latency_summary, run_metadata, write_results
+
+# Run by each fresh interpreter; prints its timings as one JSON line
+FRESH_WORKER = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app, db
+imported = time.perf_counter()
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1], 'TESTING': True, 'QUERY_INSPECTION': False})
+if sys.argv[2] == '1':
+    with app.app_context():
+        db.create_all()
+created = time.perf_counter()
+response = app.test_client().get('/api/books/1')
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported,
+                  'first_request': done - created, 'total': done - start, 'finished': time.time()}))
+"""
+
+
+def add_book(database_uri):
+    from app import db
+    from app.models import Book
+    app = make_app(database_uri)
+    with app.app_context():
+        db.session.add(Book(title='Startup', author='Someone', isbn='9780000000001'))
+        db.session.commit()
+
+
+def boot_fresh(database_uri, workers, create_all):
+    started = time.time()
+    processes = [subprocess.Popen([sys.executable, '-c', FRESH_WORKER, database_uri, '1' if create_all else '0'],
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                 for _ in range(workers)]
+    samples, failures = [], 0
+    for process in processes:
+        out, err = process.communicate()
+        if process.returncode:
+            failures += 1
+            print(err.strip().splitlines()[-1] if err.strip() else f'exit {process.returncode}', file=sys.stderr)
+        else:
+            samples.append(json.loads(out.strip().splitlines()[-1]))
+    return summarise(samples, started, failures)
+
+
+def forked_worker(app, results):
+    start = time.perf_counter()
+    response = app.test_client().get('/api/books/1')
+    assert response.status_code == 200, response.status_code
+    results.put({'first_request': time.perf_counter() - start, 'finished': time.time()})
+
+
+def boot_preloaded(database_uri, workers):
+    start = time.perf_counter()
+    app = make_app(database_uri)
+    preload = time.perf_counter() - start
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    started = time.time()
+    processes = [context.Process(target=forked_worker, args=(app, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    failures = sum(1 for process in processes if process.exitcode)
+    return dict(summarise(samples, started, failures), parent_create_app_ms=round(preload * 1000, 1))
+
+
+def summarise(samples, started, failures):
+    report = {
+        'failures': failures,
+        'all_ready_ms': round((max(s['finished'] for s in samples) - started) * 1000, 1) if samples else None,
+    }
+    for key in ('import', 'create_app', 'first_request', 'total'):
+        if samples and key in samples[0]:
+            report[key] = latency_summary([s[key] for s in samples])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=16, help='workers booted at once')
+    parser.add_argument('--create-all', action='store_true',
+                        help='also run db.create_all() in every fresh worker, like startup used to')
+    parser.add_argument('--output', help='also write the results as JSON to this file')
+    args = parser.parse_args()
+
+    database_uri = temp_database_uri()
+    add_book(database_uri)
+    report = {
+        'run': run_metadata(),
+        'workers': args.workers,
+        'fresh': boot_fresh(database_uri, args.workers, args.create_all),
+        'preloaded': boot_preloaded(database_uri, args.workers),
+    }
+    write_results(args.output, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""Gunicorn settings, read automatically when gunicorn starts in this directory:
+
+    flask db upgrade    # once per deploy, before any worker starts
+    gunicorn run:app
+
+create_app() does no schema work and opens no connections, so the app is
+built once in the master and every worker forks with it already imported
+and configured.
+"""
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+# Each open /api/events stream holds a thread for as long as the page
+# stays open, so a worker serves requests from a pool of threads rather
+# than one at a time. Streams hold no database connection while they
+# wait. The worker timeout is its main loop's heartbeat, which threads
+# keep running, so long-lived streams are not killed after `timeout`.
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 32))
+preload_app = True
+
+
+def post_fork(server, worker):
+    # The master should not have opened any, but a connection is never
+    # shared across processes; the worker's pool starts empty
+    from app import db
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
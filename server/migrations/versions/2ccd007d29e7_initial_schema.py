@@ -0,0 +1,230 @@
+"""initial schema
+
+Revision ID: 2ccd007d29e7
+Revises:
+Create Date: 2026-10-18 18:24:50.961443
+
+Creates the schema of app/models.py plus the FTS5 search index and its
+sync triggers. Databases made by the old startup-time db.create_all()
+are brought up to the same schema in place: missing tables, the columns
+added since (books.rating_count/rating_sum, users.token_version) and the
+indexes are added, and the rating aggregates and search index are filled
+from the existing rows. This replaces `flask create-indexes` and the
+column checks `ratings-backfill`, `search-reindex` and startup used to do.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2ccd007d29e7'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('book_neighbours', 'ix_book_neighbours_book_id_count', ['book_id', 'count'], {}),
+    ('borrow_records', 'ix_borrow_records_book_id', ['book_id'], {}),
+    ('borrow_records', 'ix_borrow_records_borrow_date', ['borrow_date'], {}),
+    ('borrow_records', 'ix_borrow_records_open_due_date', ['due_date'],
+     {'sqlite_where': sa.text('return_date IS NULL')}),
+    ('borrow_records', 'ix_borrow_records_user_id_return_date', ['user_id', 'return_date'], {}),
+    ('borrow_records', 'uq_borrow_records_open_loan', ['user_id', 'book_id'],
+     {'unique': True, 'sqlite_where': sa.text('return_date IS NULL')}),
+    ('reviews', 'ix_reviews_book_id', ['book_id'], {}),
+]
+
+# Columns added to existing tables after their first release
+LATE_COLUMNS = [
+    ('books', 'rating_count'),
+    ('books', 'rating_sum'),
+    ('users', 'token_version'),
+]
+
+# External-content FTS5 index over the searchable book columns (see app/search.py)
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE books_fts USING fts5(
+        title, author, description, genre,
+        content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, description, genre)
+        VALUES (new.id, new.title, new.author, new.description, new.genre);
+    END""",
+    """CREATE TRIGGER books_fts_ad AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.genre);
+    END""",
+    # Only fire for the indexed columns so borrow/return updates to
+    # available_copies don't touch the index.
+    """CREATE TRIGGER books_fts_au AFTER UPDATE OF title, author, description, genre ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author, description, genre)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.genre);
+        INSERT INTO books_fts(rowid, title, author, description, genre)
+        VALUES (new.id, new.title, new.author, new.description, new.genre);
+    END""",
+]
+SEARCH_OBJECTS = [('table', 'books_fts'), ('trigger', 'books_fts_ai'),
+                  ('trigger', 'books_fts_ad'), ('trigger', 'books_fts_au')]
+
+
+def create_tables(existing):
+    if 'book_events' not in existing:
+        op.create_table('book_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.String(length=20), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sqlite_autoincrement=True
+        )
+    if 'books' not in existing:
+        op.create_table('books',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('author', sa.String(length=100), nullable=False),
+        sa.Column('isbn', sa.String(length=13), nullable=False),
+        sa.Column('available_copies', sa.Integer(), nullable=True),
+        sa.Column('total_copies', sa.Integer(), nullable=True),
+        sa.Column('image_url', sa.String(length=255), nullable=True),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('publication_year', sa.Integer(), nullable=True),
+        sa.Column('genre', sa.String(length=50), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('isbn')
+        )
+    if 'cache_versions' not in existing:
+        op.create_table('cache_versions',
+        sa.Column('scope', sa.String(length=64), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('scope')
+        )
+    if 'job_watermarks' not in existing:
+        op.create_table('job_watermarks',
+        sa.Column('name', sa.String(length=64), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+        )
+    if 'users' not in existing:
+        op.create_table('users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=80), nullable=False),
+        sa.Column('email', sa.String(length=120), nullable=False),
+        sa.Column('password_hash', sa.String(length=128), nullable=False),
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('token_version', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+        )
+    if 'book_neighbours' not in existing:
+        op.create_table('book_neighbours',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('neighbour_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+        sa.ForeignKeyConstraint(['neighbour_id'], ['books.id'], ),
+        sa.PrimaryKeyConstraint('book_id', 'neighbour_id')
+        )
+    if 'borrow_records' not in existing:
+        op.create_table('borrow_records',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('borrow_date', sa.DateTime(), nullable=False),
+        sa.Column('due_date', sa.DateTime(), nullable=True),
+        sa.Column('return_date', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('fine_amount', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'reviews' not in existing:
+        op.create_table('reviews',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('rating', sa.Integer(), nullable=False),
+        sa.Column('comment', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.CheckConstraint('rating >= 1 AND rating <= 5', name='rating_range'),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'book_id', name='unique_user_book_review')
+        )
+
+
+def add_late_columns(inspector, existing):
+    """Add the columns an older create_all() database lacks; returns the (table, column) pairs added."""
+    added = []
+    for table, name in LATE_COLUMNS:
+        if table in existing and name not in {column['name'] for column in inspector.get_columns(table)}:
+            # All are INTEGER NOT NULL DEFAULT 0, which ADD COLUMN allows without a table rebuild
+            op.add_column(table, sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+            added.append((table, name))
+    return added
+
+
+def create_indexes(inspector, existing):
+    for table, name, columns, options in INDEXES:
+        if table in existing and name in {index['name'] for index in inspector.get_indexes(table)}:
+            continue
+        # On an older database, uq_borrow_records_open_loan fails here if a
+        # user has two open loans of the same book; close one and re-run
+        op.create_index(name, table, columns, **options)
+
+
+def create_search_index(bind):
+    present = {tuple(row) for row in bind.execute(sa.text(
+        "SELECT type, name FROM sqlite_master WHERE name LIKE 'books_fts%'"))}
+    for (kind, name), statement in zip(SEARCH_OBJECTS, SEARCH_DDL):
+        if (kind, name) not in present:
+            op.execute(statement)
+    return ('table', 'books_fts') not in present
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+
+    create_tables(existing)
+    added = add_late_columns(inspector, existing)
+    create_indexes(inspector, existing)
+    search_created = create_search_index(bind)
+
+    if 'books' in existing:
+        # Fill what the old database never had from the rows it does have
+        if ('books', 'rating_count') in added:
+            op.execute(
+                "UPDATE books SET "
+                "rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id), "
+                "rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.book_id = books.id)")
+        if search_created:
+            op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    for kind, name in reversed(SEARCH_OBJECTS):
+        op.execute(f'DROP {kind.upper()} IF EXISTS {name}')
+    for table, name, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_table('reviews')
+    op.drop_table('borrow_records')
+    op.drop_table('book_neighbours')
+    op.drop_table('users')
+    op.drop_table('job_watermarks')
+    op.drop_table('cache_versions')
+    op.drop_table('books')
+    op.drop_table('book_events')
@@ -0,0 +1,68 @@
+"""add circulation analytics rollups
+
+Revision ID: 6450da025583
+Revises: afa0eb294047
+Create Date: 2026-10-18 18:41:52.067660
+
+Per-day rollups of loans and reviews for the analytics endpoints (see
+app/analytics.py), filled from the existing history. This is the same
+computation as `flask analytics-rebuild`, frozen as of this revision.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6450da025583'
+down_revision = 'afa0eb294047'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL_SQL = [
+    """INSERT INTO daily_book_stats (day, book_id, borrows, returns, reviews, rating_sum)
+    SELECT day, book_id, SUM(borrows), SUM(returns), SUM(reviews), SUM(rating_sum) FROM (
+        SELECT date(borrow_date) AS day, book_id, 1 AS borrows, 0 AS returns, 0 AS reviews, 0 AS rating_sum
+        FROM borrow_records
+        UNION ALL
+        SELECT date(return_date), book_id, 0, 1, 0, 0 FROM borrow_records WHERE return_date IS NOT NULL
+        UNION ALL
+        SELECT date(created_at), book_id, 0, 0, 1, rating FROM reviews WHERE created_at IS NOT NULL
+    ) GROUP BY day, book_id""",
+    """INSERT INTO daily_genre_stats (day, genre, borrows, returns)
+    SELECT s.day, COALESCE(b.genre, ''), SUM(s.borrows), SUM(s.returns)
+    FROM daily_book_stats AS s LEFT JOIN books AS b ON b.id = s.book_id
+    WHERE s.borrows > 0 OR s.returns > 0
+    GROUP BY s.day, COALESCE(b.genre, '')""",
+]
+
+
+def upgrade():
+    op.create_table('daily_book_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('borrows', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('returns', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('reviews', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('day', 'book_id'),
+    sqlite_with_rowid=False
+    )
+    op.create_table('daily_genre_stats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('genre', sa.String(length=50), nullable=False),
+    sa.Column('borrows', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('returns', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('day', 'genre'),
+    sqlite_with_rowid=False
+    )
+    op.create_index('ix_daily_book_stats_reviewed', 'daily_book_stats', ['day', 'book_id', 'reviews', 'rating_sum'],
+                    sqlite_where=sa.text('reviews > 0'))
+    for statement in BACKFILL_SQL:
+        op.execute(statement)
+
+
+def downgrade():
+    op.drop_index('ix_daily_book_stats_reviewed', table_name='daily_book_stats')
+    op.drop_table('daily_genre_stats')
+    op.drop_table('daily_book_stats')
@@ -0,0 +1,28 @@
+"""add books.version
+
+Revision ID: afa0eb294047
+Revises: 2ccd007d29e7
+Create Date: 2026-10-18 19:02:11.418305
+
+Optimistic-concurrency counter for the admin inventory API. Existing
+books start at version 1.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'afa0eb294047'
+down_revision = '2ccd007d29e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('books', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    # Natively (SQLite 3.35+) rather than in batch mode: rebuilding `books`
+    # would drop the search index triggers defined on it
+    op.execute('ALTER TABLE books DROP COLUMN version')
@@ -1,4 +1,5 @@
 from app.models import db, User, Book, BorrowRecord, Review
+from app.ratings import recompute_ratings
 import bcrypt
 from datetime import datetime, timedelta
 import random
@@ -288,6 +289,7 @@ def seed_data():
     
     db.session.add_all(reviews)
     db.session.commit()
+    recompute_ratings()
     print(f"Added {len(reviews)} reviews.")
 
     print("Database seeding completed successfully!")
@@ -0,0 +1,90 @@
+"""Fixtures for the route tests: the app on a scratch database of its own per test.
+
+The schema is migrated and seeded once per run into a template file, and
+every test gets a fresh copy of it, so a scenario never depends on what
+ran before it.
+"""
+import shutil
+import bcrypt
+import pytest
+from flask_jwt_extended import create_access_token
+from flask_migrate import upgrade
+from app import create_app, db
+from app.models import User, Book, BorrowRecord, Review
+from app.auth import principal_cache
+from app.cache import response_cache
+
+
+def make_app(path, config=None):
+    return create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'TESTING': True, **(config or {})})
+
+
+def seed():
+    """A reader with two open loans (ids 1 and 2), an admin and six books; returns their auth headers."""
+    password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt(4)).decode('utf-8')
+    reader = User(username='reader', email='reader@example.com', password_hash=password_hash)
+    admin = User(username='admin', email='admin@example.com', password_hash=password_hash, role='admin')
+    db.session.add_all([reader, admin])
+    db.session.add_all([
+        Book(title=f'Query plan book {i}', author='Planner', isbn=f'97800000000{i:02d}',
+             available_copies=2, total_copies=2, genre='Fiction', publication_year=2000 + i)
+        for i in range(1, 7)
+    ])
+    db.session.flush()
+    db.session.add(Review(user_id=admin.id, book_id=1, rating=5, comment='Fast'))
+    db.session.add_all([BorrowRecord(user_id=reader.id, book_id=book_id) for book_id in (1, 4)])
+    db.session.commit()
+    return {
+        'user': {'Authorization': 'Bearer ' + create_access_token(identity={'id': reader.id, 'email': reader.email})},
+        'admin': {'Authorization': 'Bearer ' + create_access_token(identity={'id': admin.id, 'email': admin.email})},
+    }
+
+
+@pytest.fixture(scope='session')
+def seeded_database(tmp_path_factory):
+    path = tmp_path_factory.mktemp('template') / 'library.db'
+    app = make_app(path)
+    with app.app_context():
+        upgrade()
+        headers = seed()
+        # Closing the last connection checkpoints the WAL into the file
+        db.session.remove()
+        db.engine.dispose()
+    return path, headers
+
+
+@pytest.fixture
+def app_config():
+    """Config on top of the defaults for the test's app; override in a module to change it."""
+    return {}
+
+
+@pytest.fixture
+def database_path(seeded_database, tmp_path):
+    """The test's own copy of the seeded database."""
+    path = tmp_path / 'library.db'
+    shutil.copy(seeded_database[0], path)
+    return path
+
+
+@pytest.fixture
+def app(database_path, app_config):
+    # Both caches outlive an app; entries from another test's copy would be stale here
+    principal_cache.clear()
+    response_cache.clear()
+    app = make_app(database_path, app_config)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(seeded_database):
+    """{'user': ..., 'admin': ...} headers for the seeded reader and admin."""
+    return seeded_database[1]
@@ -0,0 +1,65 @@
+"""One request per API route, run against the seeded scratch database in conftest.py.
+
+Each is (name, method, path, JSON body / raw text body / None, headers
+key); the name starts with the route's endpoint. Add one whenever a
+route is added.
+"""
+
+ROUTE_SCENARIOS = [
+    ('get_books', 'GET', '/api/books', None, None),
+    ('get_books page', 'GET', '/api/books?limit=1&after=1&min_rating=1', None, None),
+    ('get_books grid', 'GET', '/api/books?fields=id,title&include=', None, None),
+    ('get_books ids', 'GET', '/api/books?ids=2,1,99', None, None),
+    ('lookup_books_batch ids', 'POST', '/api/books/lookup', {'ids': [1, 2]}, None),
+    ('lookup_books_batch isbns', 'POST', '/api/books/lookup?include=', {'isbns': ['9780000000001']}, None),
+    ('get_book', 'GET', '/api/books/1', None, None),
+    ('get_book expanded', 'GET', '/api/books/1?include=reviews,borrow_records', None, None),
+    ('get_book_recommendations', 'GET', '/api/books/1/recommendations?limit=5', None, None),
+    ('get_book_recommendations missing', 'GET', '/api/books/99/recommendations', None, None),
+    ('search', 'GET', '/api/books/search?q=plan&genre=Fiction&year_from=1900&year_to=2100', None, None),
+    ('login', 'POST', '/api/login', {'email': 'reader@example.com', 'password': 'password123'}, None),
+    ('signup', 'POST', '/api/signup', {'email': 'new@example.com', 'username': 'new', 'password': 'password123'},
+     None),
+    ('borrow_book', 'POST', '/api/borrow', {'book_id': 2}, 'user'),
+    ('borrow_books_batch', 'POST', '/api/borrow/batch', {'book_ids': [3, 5]}, 'user'),
+    ('return_book', 'PUT', '/api/borrow/1', None, 'user'),
+    ('return_books_batch', 'PUT', '/api/borrow/batch', {'borrow_ids': [1, 2]}, 'user'),
+    ('add_review', 'POST', '/api/reviews', {'book_id': 2, 'rating': 4}, 'user'),
+    ('book_events replay', 'GET', '/api/events?books=1,2&last_event_id=0', None, None),
+    ('get_profile', 'GET', '/api/profile', None, 'user'),
+    ('get_user_borrowed_books', 'GET', '/api/user/borrowed-books', None, 'user'),
+    ('import_books_upload', 'POST', '/api/admin/books/import?format=jsonl',
+     '{"isbn": "9780306406157", "title": "Imported", "author": "Someone"}\n', 'admin'),
+    ('import_books_upload chunked', 'POST', '/api/admin/books/import?format=jsonl&chunk_size=1',
+     '{"isbn": "9780306406157", "title": "Imported", "author": "Someone"}\n'
+     '{"isbn": "9780000000019", "title": "Imported too", "author": "Someone"}\n', 'admin'),
+    ('add_book', 'POST', '/api/books', {'isbn': '9780140449136', 'title': 'Added', 'author': 'Someone'}, 'admin'),
+    ('add_books_bulk', 'POST', '/api/admin/books',
+     {'books': [{'isbn': '9780262033848', 'title': 'Added', 'author': 'Someone'}]}, 'admin'),
+    ('update_book', 'PUT', '/api/books/3', {'version': 1, 'title': 'Renamed'}, 'admin'),
+    ('update_books_bulk', 'PATCH', '/api/admin/books',
+     {'books': [{'id': 3, 'version': 1, 'total_copies': 4}, {'id': 4, 'version': 1, 'available_copies': 1}]},
+     'admin'),
+    ('update_books_bulk conflict', 'PATCH', '/api/admin/books', {'books': [{'id': 3, 'version': 2, 'genre': 'X'}]},
+     'admin'),
+    ('delete_book', 'DELETE', '/api/books/5?version=1', None, 'admin'),
+    ('delete_books_bulk', 'DELETE', '/api/admin/books', {'books': [{'id': 6, 'version': 1}]}, 'admin'),
+    ('analytics_borrows day', 'GET', '/api/admin/analytics/borrows', None, 'admin'),
+    ('analytics_borrows genre', 'GET', '/api/admin/analytics/borrows?by=genre', None, 'admin'),
+    ('analytics_borrows author', 'GET', '/api/admin/analytics/borrows?by=author&from=2000-01-01&to=2000-12-31',
+     None, 'admin'),
+    ('analytics_top_borrowed', 'GET', '/api/admin/analytics/top-borrowed?limit=5', None, 'admin'),
+    ('analytics_top_rated', 'GET', '/api/admin/analytics/top-rated?min_reviews=1', None, 'admin'),
+]
+
+
+def request_scenario(client, scenario, auth_headers):
+    """Send one scenario's request; the response is closed, so a stream is not read."""
+    _, method, path, body, auth = scenario
+    headers = auth_headers.get(auth, {})
+    if isinstance(body, str):
+        response = client.open(path, method=method, data=body, headers=headers)
+    else:
+        response = client.open(path, method=method, json=body, headers=headers)
+    response.close()
+    return response
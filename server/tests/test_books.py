@@ -0,0 +1,25 @@
+"""Editing a book through the form, which sends the whole book back."""
+import sqlite3
+
+
+def test_edit_keeps_a_stored_isbn_that_predates_validation(client, auth_headers, database_path):
+    # Seed data written before ISBNs were validated
+    with sqlite3.connect(database_path) as connection:
+        connection.execute("UPDATE books SET isbn = 'ISBN0000000000003' WHERE id = 3")
+    book = client.get('/api/books/3').get_json()
+
+    response = client.put('/api/books/3', json={**book, 'title': 'Renamed'}, headers=auth_headers['admin'])
+
+    assert response.status_code == 200
+    assert response.get_json()['title'] == 'Renamed'
+    assert response.get_json()['isbn'] == 'ISBN0000000000003'
+    assert response.get_json()['version'] == book['version'] + 1
+
+
+def test_saving_an_unchanged_book_is_a_no_op(client, auth_headers):
+    book = client.get('/api/books/3').get_json()
+
+    response = client.put('/api/books/3', json=book, headers=auth_headers['admin'])
+
+    assert response.status_code == 200
+    assert response.get_json()['version'] == book['version']
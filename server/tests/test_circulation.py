@@ -0,0 +1,29 @@
+"""Batch borrows where one item loses a race to another request."""
+from datetime import datetime
+from app import circulation, db
+from app.models import Book, BorrowRecord
+
+
+def test_batch_skips_a_duplicate_refused_at_flush(app, client, auth_headers, monkeypatch):
+    due_date_for = circulation.due_date_for
+    racing = []
+
+    def open_a_racing_loan(borrow_date):
+        # Another request opens the same loan between the duplicate check
+        # and the flush, once the copy has already been taken
+        if not racing:
+            racing.append(True)
+            db.session.execute(db.insert(BorrowRecord).values(
+                user_id=1, book_id=3, borrow_date=datetime.utcnow(), status='borrowed'))
+        return due_date_for(borrow_date)
+    monkeypatch.setattr(circulation, 'due_date_for', open_a_racing_loan)
+
+    response = client.post('/api/borrow/batch', json={'book_ids': [3, 5]}, headers=auth_headers['user'])
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result['status'] for result in results] == ['error', 'ok']
+    assert results[0]['message'] == 'You have already borrowed this book'
+    with app.app_context():
+        assert db.session.get(Book, 3).available_copies == 2
+        assert db.session.get(Book, 5).available_copies == 1
@@ -0,0 +1,23 @@
+"""Uploading a catalog file through the admin import route."""
+import json
+from app import db
+from app.events import event_hub, read_events
+from app.models import Book
+
+
+def test_import_records_availability_for_live_updates(app, client, auth_headers, monkeypatch):
+    notified = []
+    monkeypatch.setattr(event_hub, 'notify', lambda: notified.append(True))
+    body = ('{"isbn": "9780306406157", "title": "Imported", "author": "Someone", "total_copies": 3}\n'
+            '{"isbn": "not an isbn", "title": "Rejected", "author": "Someone"}\n')
+
+    response = client.post('/api/admin/books/import?format=jsonl', data=body, headers=auth_headers['admin'])
+
+    assert response.status_code == 200
+    assert response.get_json()['imported'] == 1
+    assert notified
+    with app.app_context():
+        book_id = db.session.execute(db.select(Book.id).where(Book.isbn == '9780306406157')).scalar_one()
+        events = read_events(0)
+    assert [(event[1], event[2]) for event in events] == [(book_id, 'availability')]
+    assert json.loads(events[0][3])['available_copies'] == 3
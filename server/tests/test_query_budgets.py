@@ -0,0 +1,29 @@
+"""Every budgeted route must stay within its @query_budget.
+
+The app runs with TESTING on, so a request over budget raises
+QueryBudgetExceeded out of the test client and fails the test, listing
+the statements it issued.
+"""
+import pytest
+from app.nplusone import QueryBudgetExceeded
+from tests.scenarios import ROUTE_SCENARIOS, request_scenario
+
+
+def test_every_budgeted_route_has_a_scenario(app):
+    budgeted = {endpoint.split('.', 1)[-1] for endpoint, view in app.view_functions.items()
+                if getattr(view, 'query_budget', None) is not None}
+    covered = {scenario[0].split()[0] for scenario in ROUTE_SCENARIOS}
+    assert budgeted - covered == set()
+
+
+@pytest.mark.parametrize('scenario', ROUTE_SCENARIOS, ids=[scenario[0] for scenario in ROUTE_SCENARIOS])
+def test_route_stays_within_budget(client, auth_headers, scenario):
+    response = request_scenario(client, scenario, auth_headers)
+    assert response.status_code < 500, response.get_data(as_text=True)
+    assert 'X-Query-Count' in response.headers
+
+
+def test_request_over_budget_fails(app, client, monkeypatch):
+    monkeypatch.setattr(app.view_functions['api.get_book'], 'query_budget', 1)
+    with pytest.raises(QueryBudgetExceeded, match=r'api.get_book issued \d+ SQL statements, budget is 1'):
+        client.get('/api/books/1')
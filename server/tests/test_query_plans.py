@@ -0,0 +1,62 @@
+"""Every statement the API routes issue must be answered through an index.
+
+Each scenario in scenarios.py is sent to a fresh copy of the scratch
+database while its SQL statements are recorded, then EXPLAIN QUERY PLAN
+runs on each one. A plan step that reads a whole table fails the test.
+Run with `pytest` (or `flask check-query-plans`); `-s` prints every plan.
+"""
+import pytest
+from sqlalchemy import event
+from app import db
+from tests.scenarios import ROUTE_SCENARIOS, request_scenario
+
+# Statements that never read table data
+SKIPPED_PREFIXES = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'CREATE', 'DROP')
+
+
+def is_full_scan(detail, materialized=()):
+    """True for plan steps like 'SCAN books' that walk an entire table or index.
+
+    Scans of `materialized`, the subqueries the plan has already computed
+    into a temporary result, only walk that result and don't count.
+    """
+    return (detail.startswith('SCAN ')
+            and 'VIRTUAL TABLE' not in detail
+            and 'CONSTANT ROW' not in detail
+            and detail.split()[1] not in materialized)
+
+
+def record_statements(client, scenario, auth_headers):
+    """Send the scenario's request; returns it and {statement: parameters} for what it issued."""
+    statements = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(SKIPPED_PREFIXES):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        statements.setdefault(statement, parameters)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = request_scenario(client, scenario, auth_headers)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return response, statements
+
+
+@pytest.mark.parametrize('scenario', ROUTE_SCENARIOS, ids=[scenario[0] for scenario in ROUTE_SCENARIOS])
+def test_route_statements_avoid_full_scans(client, auth_headers, scenario):
+    response, statements = record_statements(client, scenario, auth_headers)
+    assert response.status_code < 500, response.get_data(as_text=True)
+
+    failures = []
+    with db.engine.connect() as conn:
+        for statement, parameters in statements.items():
+            steps = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            print(statement, *steps, sep='\n    ')
+            materialized = {step.split()[1] for step in steps if step.startswith(('MATERIALIZE ', 'CO-ROUTINE '))}
+            scans = [step for step in steps if is_full_scan(step, materialized)]
+            if scans:
+                failures.append(f"{' | '.join(scans)}\n    {statement}")
+    assert not failures, 'Full table scans:\n' + '\n'.join(failures)
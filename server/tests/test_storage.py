@@ -0,0 +1,46 @@
+"""Writes that find another process holding SQLite's write lock.
+
+Another connection takes the lock with BEGIN IMMEDIATE, as a writer in
+another worker would. The app must wait, retry with backoff and, if the
+lock is never released, answer 503 rather than fail.
+"""
+import sqlite3
+import pytest
+from app import storage
+
+
+@pytest.fixture(params=[False, True], ids=['single', 'group-commit'])
+def app_config(request):
+    # Give up on the lock quickly, and retry a known number of times
+    return {'SQLITE_PRAGMAS': {'busy_timeout': 20}, 'WRITE_RETRY_ATTEMPTS': 3, 'WRITE_RETRY_BASE_DELAY': 0,
+            'WRITE_GROUP_COMMIT': request.param}
+
+
+@pytest.fixture
+def lock_holder(database_path):
+    connection = sqlite3.connect(database_path, isolation_level=None)
+    connection.execute('BEGIN IMMEDIATE')
+    yield connection
+    if connection.in_transaction:
+        connection.rollback()
+    connection.close()
+
+
+def test_write_retries_then_answers_busy(client, auth_headers, lock_holder, monkeypatch):
+    backoffs = []
+    monkeypatch.setattr(storage.time, 'sleep', backoffs.append)
+
+    response = client.post('/api/borrow', json={'book_id': 2}, headers=auth_headers['user'])
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert len(backoffs) == 3
+
+
+def test_write_succeeds_once_the_lock_is_released(client, auth_headers, lock_holder, monkeypatch):
+    # The other writer commits while the first attempt backs off
+    monkeypatch.setattr(storage.time, 'sleep', lambda delay: lock_holder.rollback())
+
+    response = client.post('/api/borrow', json={'book_id': 2}, headers=auth_headers['user'])
+
+    assert response.status_code == 201